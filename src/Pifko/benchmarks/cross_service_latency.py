@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Microbenchmark of cross-service MCP call latency.
+
+Compares the pooled ServiceClient (one long-lived session per peer) with
+opening a fresh MCP client per call, which pays the TCP and MCP initialize
+handshake every time. Run it inside a service container so it measures the
+local Docker network:
+
+    docker compose exec orders-service uv run python /app/src/Pifko/benchmarks/cross_service_latency.py
+
+or from the host (src/Pifko) against the published ports:
+
+    uv run python -m benchmarks.cross_service_latency --service brewery
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastmcp import Client
+
+from benchmarks.stats import format_row, summarize
+from utils.service_client import SERVICE_URLS, ServiceClient
+
+DEFAULT_CALLS = {
+    "orders": ("get_customer", {"customer_id": 1}),
+    "brewery": ("get_beers_by_ids", {"beer_ids": [1, 2, 3]}),
+    "storage": ("get_hop", {"hop_id": 1}),
+}
+
+
+async def _timed(call) -> float:
+    start = time.perf_counter()
+    await call()
+    return (time.perf_counter() - start) * 1000
+
+
+async def bench_fresh(url: str, tool: str, arguments: dict, calls: int) -> list[float]:
+    async def one_call():
+        async with Client(f"{url}/mcp") as client:
+            await client.call_tool(tool, arguments)
+
+    return [await _timed(one_call) for _ in range(calls)]
+
+
+async def bench_pooled(
+    client: ServiceClient, tool: str, arguments: dict, calls: int, concurrency: int
+) -> list[float]:
+    latencies: list[float] = []
+    remaining = iter(range(calls))
+
+    async def worker():
+        for _ in remaining:
+            latencies.append(await _timed(lambda: client.call(tool, arguments)))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--service", choices=sorted(SERVICE_URLS), default="brewery")
+    parser.add_argument("--tool", help="Tool to call (defaults to a cheap read)")
+    parser.add_argument("--args", help="Tool arguments as JSON")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    opts = parser.parse_args()
+
+    tool, arguments = DEFAULT_CALLS[opts.service]
+    if opts.tool:
+        tool, arguments = opts.tool, json.loads(opts.args or "{}")
+    url = SERVICE_URLS[opts.service]
+
+    pooled = ServiceClient(opts.service, url, max_concurrency=opts.concurrency)
+    try:
+        await bench_pooled(pooled, tool, arguments, opts.warmup, 1)
+        sequential = await bench_pooled(pooled, tool, arguments, opts.calls, 1)
+        start = time.perf_counter()
+        concurrent = await bench_pooled(
+            pooled, tool, arguments, opts.calls, opts.concurrency
+        )
+        concurrent_elapsed = time.perf_counter() - start
+    finally:
+        await pooled.close()
+
+    fresh = await bench_fresh(url, tool, arguments, min(opts.calls, 50))
+
+    print(f"{opts.service}.{tool} at {url}")
+    print(format_row("fresh client per call", summarize(fresh)))
+    print(format_row("pooled, sequential", summarize(sequential)))
+    print(format_row(f"pooled, concurrency={opts.concurrency}", summarize(concurrent)))
+    print(f"pooled throughput: {opts.calls / concurrent_elapsed:.1f} calls/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
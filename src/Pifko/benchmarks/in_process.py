@@ -0,0 +1,53 @@
+"""Import a service's main.py into this process, to call its tools directly.
+
+Used by the microbenchmarks and the stock contention harness. Tools are
+reached as attributes of the loaded main module and called through .fn,
+which skips the MCP middleware (metrics, tracing, recording).
+"""
+
+import importlib
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+
+PIFKO_ROOT = Path(__file__).resolve().parents[1]
+SERVICE_DIRS = {
+    "orders": PIFKO_ROOT / "services" / "orders_service",
+    "brewery": PIFKO_ROOT / "services" / "brewery_service",
+    "storage": PIFKO_ROOT / "services" / "storage_service",
+}
+
+
+@dataclass
+class Service:
+    main: ModuleType
+    models: ModuleType
+    engine: object
+
+
+_loaded: dict[str, Service] = {}
+
+
+def load_service(service: str, database_url: str) -> Service:
+    """Import a service's main.py bound to database_url.
+
+    All services have a main module and a db package, so those are taken out
+    of sys.modules before each import. The loaded modules keep working, since
+    they hold references to what they imported.
+    """
+    if service in _loaded:
+        return _loaded[service]
+    for name in list(sys.modules):
+        if name in ("main", "db") or name.startswith("db."):
+            del sys.modules[name]
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, str(SERVICE_DIRS[service]))
+    try:
+        main = importlib.import_module("main")
+        models = sys.modules["db.models"]
+    finally:
+        sys.path.remove(str(SERVICE_DIRS[service]))
+    _loaded[service] = Service(main, models, main.engine)
+    return _loaded[service]
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""End-to-end load test of the three MCP services over streamable-http.
+
+Runs a weighted mix of realistic operations (order creation, production
+feasibility checks, stock allocations and inventory reads) against the
+running services and reports p50/p95/p99 latency and throughput per tool.
+Answers that report a failure (insufficient stock, unknown IDs) are counted
+as rejected and left out of the latencies, like calls that raise.
+
+Two load models:
+
+    closed loop (default)  --concurrency workers issue calls back to back
+    open loop (--rate R)   calls arrive as a Poisson process at R per second,
+                           whether or not earlier calls have finished
+
+In open loop mode latency is measured from the scheduled arrival, so time
+spent queued behind a slow service counts (no coordinated omission).
+Arrivals beyond --max-in-flight are dropped and reported.
+
+IDs are drawn from the ranges the mock data creates (uv run mock_db.py).
+From the host (src/Pifko), against the compose stack's published ports:
+
+    uv run python -m benchmarks.load_test --mix default --duration 30 --rate 50
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from benchmarks.stats import format_row, is_rejected, summarize
+from utils.service_client import SERVICE_URLS, ServiceClient, ServiceCallError
+
+
+@dataclass
+class Ids:
+    customers: range
+    beers: range
+    ingredients: range
+    invoices: range
+
+
+def _parse_range(text: str) -> range:
+    first, _, last = text.partition("-")
+    return range(int(first), int(last or first) + 1)
+
+
+# Operation: (service, tool, arguments from (rng, ids))
+OPERATIONS: dict[str, tuple[str, str, Callable[[random.Random, Ids], dict]]] = {
+    "create_order": (
+        "orders",
+        "create_complete_order",
+        lambda rng, ids: {
+            "customer_id": rng.choice(ids.customers),
+            "beer_orders_json": json.dumps(
+                [
+                    {"beer_id": beer_id, "quantity_hecto": rng.randint(1, 20)}
+                    for beer_id in rng.sample(
+                        list(ids.beers), rng.randint(1, min(3, len(ids.beers)))
+                    )
+                ]
+            ),
+        },
+    ),
+    "read_invoice": (
+        "orders",
+        "get_order_invoice",
+        lambda rng, ids: {"invoice_id": rng.choice(ids.invoices)},
+    ),
+    "check_feasibility": (
+        "brewery",
+        "check_production_feasibility",
+        lambda rng, ids: {
+            "beer_id": rng.choice(ids.beers),
+            "quantity_hectoliters": rng.randint(1, 50),
+        },
+    ),
+    "read_local_storage": ("brewery", "get_local_storage", lambda rng, ids: {}),
+    "allocate_stock": (
+        "storage",
+        "allocate_stock",
+        lambda rng, ids: {
+            "ingredient_type": rng.choice(("hops", "malts")),
+            "ingredient_id": rng.choice(ids.ingredients),
+            "quantity_requested": 1,
+            "requesting_facility": "brewery",
+        },
+    ),
+    "read_inventory": ("storage", "get_full_inventory", lambda rng, ids: {}),
+}
+
+# Mix: operation -> relative weight
+MIXES = {
+    "default": {
+        "create_order": 1,
+        "read_invoice": 3,
+        "check_feasibility": 3,
+        "read_local_storage": 2,
+        "allocate_stock": 1,
+        "read_inventory": 3,
+    },
+    "reads": {
+        "read_invoice": 1,
+        "read_local_storage": 1,
+        "read_inventory": 1,
+    },
+    "orders": {
+        "create_order": 2,
+        "check_feasibility": 3,
+        "allocate_stock": 2,
+    },
+}
+
+
+class LoadTest:
+    def __init__(self, mix: dict, ids: Ids, seed: int, concurrency: int):
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.ids = ids
+        self.rng = random.Random(seed)
+        services = {OPERATIONS[name][0] for name in self.names}
+        self.clients = {
+            service: ServiceClient(
+                service,
+                SERVICE_URLS[service],
+                max_concurrency=concurrency,
+                client_name="pifko-load-test",
+            )
+            for service in services
+        }
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        # Answers reporting a failure, e.g. insufficient stock; not in the latencies
+        self.rejected: dict[str, int] = defaultdict(int)
+        self.dropped = 0
+        self.recording = False
+
+    def _next_call(self) -> tuple[str, Callable[[], Awaitable[str]]]:
+        name = self.rng.choices(self.names, self.weights)[0]
+        service, tool, arguments = OPERATIONS[name]
+        args = arguments(self.rng, self.ids)
+        return f"{service}.{tool}", lambda: self.clients[service].call(tool, args)
+
+    async def _run_call(self, label: str, call, started: float) -> None:
+        try:
+            answer = await call()
+        except ServiceCallError:
+            if self.recording:
+                self.errors[label] += 1
+            return
+        if is_rejected(answer):
+            if self.recording:
+                self.rejected[label] += 1
+            return
+        if self.recording:
+            self.latencies[label].append((time.perf_counter() - started) * 1000)
+
+    async def closed_loop(self, duration: float, concurrency: int) -> None:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                label, call = self._next_call()
+                await self._run_call(label, call, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def open_loop(self, duration: float, rate: float, max_in_flight: int):
+        in_flight: set[asyncio.Task] = set()
+        start = time.perf_counter()
+        arrival = start
+        while arrival < start + duration:
+            arrival += self.rng.expovariate(rate)
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                self.dropped += self.recording
+                continue
+            label, call = self._next_call()
+            task = asyncio.create_task(self._run_call(label, call, arrival))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        await asyncio.gather(*in_flight)
+
+    async def run(
+        self,
+        duration: float,
+        warmup: float,
+        concurrency: int,
+        rate: Optional[float],
+        max_in_flight: int,
+    ) -> float:
+        """Warm up, then measure; returns the measured wall time"""
+        try:
+            for recording, seconds in ((False, warmup), (True, duration)):
+                if seconds <= 0:
+                    continue
+                self.recording = recording
+                start = time.perf_counter()
+                if rate:
+                    await self.open_loop(seconds, rate, max_in_flight)
+                else:
+                    await self.closed_loop(seconds, concurrency)
+                elapsed = time.perf_counter() - start
+            return elapsed
+        finally:
+            for client in self.clients.values():
+                await client.close()
+
+    def report(self, elapsed: float) -> None:
+        total = sum(len(v) for v in self.latencies.values())
+        for label in sorted(
+            set(self.latencies) | set(self.errors) | set(self.rejected)
+        ):
+            latencies = self.latencies[label]
+            print(
+                format_row(label, summarize(latencies), width=40)
+                + f" {len(latencies) / elapsed:8.1f}/s errors={self.errors[label]}"
+                + f" rejected={self.rejected[label]}"
+            )
+        print(
+            format_row("all", summarize(sum(self.latencies.values(), [])), width=40)
+            + f" {total / elapsed:8.1f}/s errors={sum(self.errors.values())}"
+            + f" rejected={sum(self.rejected.values())}"
+        )
+        if self.dropped:
+            print(f"dropped arrivals (over --max-in-flight): {self.dropped}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds measured")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Closed loop workers; also caps calls in flight per service",
+    )
+    parser.add_argument("--rate", type=float, help="Open loop: arrivals per second")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--customers", default="1-5", help="Customer ID range")
+    parser.add_argument("--beers", default="1-4", help="Beer ID range")
+    parser.add_argument("--ingredients", default="1-5", help="Hop and malt ID range")
+    parser.add_argument("--invoices", default="1-5", help="Invoice ID range")
+    opts = parser.parse_args()
+
+    ids = Ids(
+        customers=_parse_range(opts.customers),
+        beers=_parse_range(opts.beers),
+        ingredients=_parse_range(opts.ingredients),
+        invoices=_parse_range(opts.invoices),
+    )
+    test = LoadTest(MIXES[opts.mix], ids, opts.seed, opts.concurrency)
+    elapsed = await test.run(
+        opts.duration, opts.warmup, opts.concurrency, opts.rate, opts.max_in_flight
+    )
+
+    model = (
+        f"open loop, {opts.rate}/s Poisson arrivals"
+        if opts.rate
+        else f"closed loop, concurrency={opts.concurrency}"
+    )
+    print(f"mix={opts.mix}, {model}, {elapsed:.1f}s measured")
+    test.report(elapsed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""Brewery service tools (see conftest.py)."""
+
+import json
+
+import pytest
+
+pytestmark = pytest.mark.benchmark(group="brewery")
+
+
+def bench_get_beers_by_ids(brewery, measure):
+    beers = json.loads(
+        measure(brewery.main.get_beers_by_ids, beer_ids=list(range(1, 11)))
+    )
+    assert len(beers) == 10
+
+
+def bench_get_local_storage(brewery, measure):
+    measure(brewery.main.get_local_storage)
+
+
+def bench_check_stock_level(brewery, measure):
+    measure(
+        brewery.main.check_stock_level,
+        ingredient_type="malts",
+        ingredient_id=3,
+        quantity_needed=100,
+    )
+
+
+def bench_check_production_feasibility(brewery, measure):
+    result = measure(
+        brewery.main.check_production_feasibility, beer_id=3, quantity_hectoliters=10
+    )
+    assert "not found" not in result
+
+
+def bench_get_ingredient_requirements(brewery, measure):
+    result = measure(
+        brewery.main.get_ingredient_requirements,
+        beer_orders_json=json.dumps(
+            [{"beer_id": b, "quantity_hecto": 5} for b in range(1, 11)]
+        ),
+    )
+    assert json.loads(result)["missing_beers"] == []
+
+
+def bench_adjust_local_storage_batch(brewery, measure):
+    result = measure(
+        brewery.main.adjust_local_storage_batch,
+        adjustments_json=json.dumps(
+            [
+                {"ingredient_type": "hops", "ingredient_id": 1, "delta": 1},
+                {"ingredient_type": "malts", "ingredient_id": 2, "delta": 1},
+            ]
+        ),
+        reason="allocation",
+    )
+    assert result.startswith("Adjusted local storage")
+
+
+@pytest.mark.postgres
+def bench_refresh_reorder_points(brewery, measure):
+    measure(brewery.main.refresh_reorder_points_now, apply=False)
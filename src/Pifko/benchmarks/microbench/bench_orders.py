@@ -0,0 +1,55 @@
+"""Orders service tools (see conftest.py)."""
+
+import json
+
+import pytest
+
+pytestmark = pytest.mark.benchmark(group="orders")
+
+
+def bench_get_customer(orders, measure):
+    assert "not found" not in measure(orders.main.get_customer, customer_id=7)
+
+
+def bench_get_customer_invoices(orders, measure):
+    measure(orders.main.get_customer_invoices, customer_id=7)
+
+
+def bench_get_order_details(orders, measure):
+    assert "not found" not in measure(orders.main.get_order_details, invoice_id=42)
+
+
+def bench_get_order_details_batch(orders, measure):
+    result = measure(
+        orders.main.get_order_details_batch, invoice_ids=list(range(1, 51))
+    )
+    assert result.startswith("Orders (50)")
+
+
+def bench_get_order_beers(orders, measure):
+    measure(orders.main.get_order_beers, order_inner_id=42)
+
+
+def bench_search_orders_by_status(orders, measure):
+    measure(orders.main.search_orders_by_status, status="fermenting")
+
+
+@pytest.mark.postgres
+def bench_get_beer_sales(orders, measure):
+    measure(orders.main.get_beer_sales, bucket="month", beer_id=3)
+
+
+def bench_get_top_customers(orders, measure):
+    measure(orders.main.get_top_customers, start_date="2025-01-01", limit=10)
+
+
+@pytest.mark.postgres
+def bench_create_complete_order(orders, measure):
+    result = measure(
+        orders.main.create_complete_order,
+        customer_id=1,
+        beer_orders_json=json.dumps(
+            [{"beer_id": 1, "quantity_hecto": 5}, {"beer_id": 2, "quantity_hecto": 3}]
+        ),
+    )
+    assert result.startswith("Created complete order")
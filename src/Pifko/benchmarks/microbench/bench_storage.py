@@ -0,0 +1,47 @@
+"""Storage service tools (see conftest.py)."""
+
+import json
+
+import pytest
+
+pytestmark = pytest.mark.benchmark(group="storage")
+
+
+def bench_get_hop(storage, measure):
+    assert "not found" not in measure(storage.main.get_hop, hop_id=7)
+
+
+def bench_get_ingredients_by_type(storage, measure):
+    measure(storage.main.get_ingredients_by_type, ingredient_type="yeasts")
+
+
+def bench_get_full_inventory(storage, measure):
+    measure(storage.main.get_full_inventory)
+
+
+def bench_search_ingredients_by_name(storage, measure):
+    measure(storage.main.search_ingredients_by_name, name="Malt 12")
+
+
+def bench_allocate_stock(storage, measure):
+    result = measure(
+        storage.main.allocate_stock,
+        ingredient_type="malts",
+        ingredient_id=3,
+        quantity_requested=1,
+        requesting_facility="brewery",
+    )
+    assert result.startswith("Allocated")
+
+
+def bench_restock_ingredients_batch(storage, measure):
+    result = measure(
+        storage.main.restock_ingredients_batch,
+        restocks_json=json.dumps(
+            [
+                {"ingredient_type": "hops", "ingredient_id": 1, "quantity": 1},
+                {"ingredient_type": "yeasts", "ingredient_id": 2, "quantity": 1},
+            ]
+        ),
+    )
+    assert result.startswith("Restocked")
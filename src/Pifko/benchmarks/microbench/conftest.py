@@ -0,0 +1,265 @@
+"""Fixtures of the tool microbenchmarks.
+
+Each service's main.py is imported in this process, against its own
+database, and its tools are called directly (tool.fn), without HTTP or MCP
+in between. The database is, in order of preference:
+
+    MICROBENCH_DATABASE_URL   an existing PostgreSQL server; throwaway
+                              microbench_<service> databases are created on it
+    pgserver                  an embedded PostgreSQL in a temporary directory,
+                              when the pgserver package is installed
+    SQLite                    a file per service; benchmarks marked postgres
+                              (upserts, date_trunc) are skipped
+
+Every benchmark runs once per --scale (1k, 100k, 1m rows). The peak Python
+allocation of one call is recorded next to the timings. Whenever
+baselines/<backend>-<scale>.json exists, the run is compared with it and
+fails when a median or an allocation peak regresses by more than the
+tolerance (--no-baseline skips this, --baseline requires the file);
+--save-baseline writes that file instead.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from pytest_benchmark.utils import parse_compare_fail
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlmodel import SQLModel
+
+from benchmarks.in_process import SERVICE_DIRS, Service, load_service
+from benchmarks.microbench import seed
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+ALLOC_NOISE_KIB = 64  # allocation growth below this never fails
+
+
+def _backend() -> str:
+    if os.getenv("MICROBENCH_DATABASE_URL"):
+        return "postgres"
+    try:
+        import pgserver  # noqa: F401
+    except ImportError:
+        return "sqlite"
+    return "postgres"
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("microbench")
+    group.addoption(
+        "--scale",
+        default="1k",
+        help="Comma separated data sizes to run: 1k, 100k, 1m (default 1k)",
+    )
+    group.addoption(
+        "--sqlite",
+        action="store_true",
+        help="Use SQLite even when PostgreSQL is available",
+    )
+    group.addoption(
+        "--baseline",
+        action="store_true",
+        help="Require baselines/<backend>-<scale>.json (compared whenever it exists)",
+    )
+    group.addoption(
+        "--no-baseline",
+        action="store_true",
+        help="Do not compare with the baseline",
+    )
+    group.addoption(
+        "--save-baseline",
+        action="store_true",
+        help="Write this run to baselines/<backend>-<scale>.json",
+    )
+    group.addoption(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed regression of medians and allocation peaks (default 0.25)",
+    )
+
+
+def pytest_configure(config):
+    scales = config.getoption("scale").split(",")
+    unknown = set(scales) - set(SCALES)
+    if unknown:
+        raise pytest.UsageError(
+            f"Unknown --scale {sorted(unknown)}; use {list(SCALES)}"
+        )
+    config.microbench_scales = scales
+    config.microbench_backend = "sqlite" if config.getoption("sqlite") else _backend()
+
+    baseline = BASELINE_DIR / f"{config.microbench_backend}-{'+'.join(scales)}.json"
+    config.microbench_alloc_baseline = {}
+    config.microbench_allocations = {}
+    if config.getoption("save_baseline"):
+        BASELINE_DIR.mkdir(exist_ok=True)
+        config.option.benchmark_json = baseline
+    elif config.getoption("baseline") or (
+        baseline.exists() and not config.getoption("no_baseline")
+    ):
+        if not baseline.exists():
+            raise pytest.UsageError(
+                f"No baseline at {baseline}; run with --save-baseline"
+            )
+        # pytest-benchmark compares the timings; allocation peaks are checked here
+        config.option.benchmark_compare = str(baseline)
+        config.option.benchmark_compare_fail = [
+            parse_compare_fail(f"median:{config.getoption('tolerance') * 100:g}%")
+        ]
+        config.microbench_alloc_baseline = {
+            bench["fullname"]: bench["extra_info"].get("peak_alloc_kib")
+            for bench in json.loads(baseline.read_text())["benchmarks"]
+        }
+
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        metafunc.parametrize(
+            "scale", metafunc.config.microbench_scales, scope="session"
+        )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.microbench_backend == "postgres":
+        return
+    skip = pytest.mark.skip(reason="needs PostgreSQL")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+# Databases
+@pytest.fixture(scope="session")
+def database_urls(pytestconfig, tmp_path_factory):
+    """service -> database URL, removed again at the end of the session"""
+    names = {service: f"microbench_{service}" for service in SERVICE_DIRS}
+    if pytestconfig.microbench_backend == "sqlite":
+        directory = tmp_path_factory.mktemp("sqlite")
+        yield {
+            service: f"sqlite:///{directory / name}.db"
+            for service, name in names.items()
+        }
+        return
+
+    server_url = os.getenv("MICROBENCH_DATABASE_URL")
+    if server_url:
+        admin = create_engine(server_url, isolation_level="AUTOCOMMIT")
+        url = make_url(server_url)
+
+        def database_url(name):
+            return url.set(database=name).render_as_string(hide_password=False)
+
+    else:
+        import pgserver
+
+        # Unix socket paths are limited to about 100 characters
+        server = pgserver.get_server(
+            tempfile.mkdtemp(prefix="pifko-pg-"), cleanup_mode="delete"
+        )
+        admin = create_engine(server.get_uri("postgres"), isolation_level="AUTOCOMMIT")
+        database_url = server.get_uri
+
+    with admin.connect() as conn:
+        for name in names.values():
+            conn.execute(text(f"DROP DATABASE IF EXISTS {name}"))
+            conn.execute(text(f"CREATE DATABASE {name}"))
+    try:
+        yield {service: database_url(name) for service, name in names.items()}
+    finally:
+        with admin.connect() as conn:
+            for name in names.values():
+                conn.execute(text(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)"))
+        admin.dispose()
+
+
+def _seeded(service: str, database_urls: dict, scale: str, seeder) -> Service:
+    loaded = load_service(service, database_urls[service])
+    SQLModel.metadata.drop_all(loaded.engine)
+    SQLModel.metadata.create_all(loaded.engine)
+    seeder(loaded.models, loaded.engine, SCALES[scale])
+    return loaded
+
+
+@pytest.fixture(scope="session")
+def orders(database_urls, scale) -> Service:
+    loaded = _seeded("orders", database_urls, scale, seed.seed_orders)
+
+    # Beer names come from the brewery; answer from here instead
+    async def fetch(beer_ids):
+        return [seed.beer(beer_id) for beer_id in beer_ids]
+
+    catalog = loaded.main.beer_catalog
+    catalog._fetch = fetch
+    catalog.invalidate()
+    return loaded
+
+
+@pytest.fixture(scope="session")
+def brewery(database_urls, scale) -> Service:
+    return _seeded("brewery", database_urls, scale, seed.seed_brewery)
+
+
+@pytest.fixture(scope="session")
+def storage(database_urls, scale) -> Service:
+    return _seeded("storage", database_urls, scale, seed.seed_storage)
+
+
+# Measuring
+@pytest.fixture(scope="session")
+def event_loop_():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def measure(benchmark, event_loop_, request):
+    """measure(tool, **arguments): benchmark one tool call and return its result"""
+    config = request.config
+
+    def measure(tool, **arguments):
+        def call():
+            return event_loop_.run_until_complete(tool.fn(**arguments))
+
+        result = benchmark(call)
+
+        # One more call once caches are warm, for its allocation peak
+        tracemalloc.start()
+        try:
+            call()
+            peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_alloc_kib"] = round(peak_kib, 1)
+        config.microbench_allocations[request.node.nodeid] = peak_kib
+
+        baseline = config.microbench_alloc_baseline.get(request.node.nodeid)
+        if baseline is not None:
+            allowed = max(
+                baseline * (1 + config.getoption("tolerance")),
+                baseline + ALLOC_NOISE_KIB,
+            )
+            if peak_kib > allowed:
+                pytest.fail(
+                    f"Allocation peak regressed: {peak_kib:.1f} KiB, baseline {baseline:.1f} KiB"
+                )
+        return result
+
+    return measure
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not config.microbench_allocations:
+        return
+    terminalreporter.section("peak Python allocation per call")
+    for nodeid, peak_kib in sorted(config.microbench_allocations.items()):
+        baseline = config.microbench_alloc_baseline.get(nodeid)
+        compared = f" (baseline {baseline:.1f})" if baseline is not None else ""
+        terminalreporter.write_line(f"{nodeid:70} {peak_kib:10.1f} KiB{compared}")
@@ -0,0 +1,216 @@
+"""Deterministic bulk data for the tool microbenchmarks.
+
+rows sets the size of each service's largest tables: order lines and
+invoices, local stock movements, and the storage ingredient catalog.
+Catalog tables that stay small in production (customers, beers, recipes)
+grow with rows / 100. Rows are written with Core executemany in chunks, so
+the ORM and the change feed are bypassed.
+"""
+
+import random
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, text
+
+CHUNK = 10_000
+COUNTRIES = ("Czechia", "Germany", "Poland", "USA", "UK", "Belgium", "New Zealand")
+STYLES = ("Lager", "Pilsner", "IPA", "Stout", "Porter", "Wheat")
+TODAY = date(2025, 6, 30)
+
+
+def beer(beer_id: int) -> dict:
+    """The brewery's view of a seeded beer, for the orders beer catalog"""
+    return {
+        "id": beer_id,
+        "name": f"Beer {beer_id}",
+        "style": STYLES[beer_id % len(STYLES)],
+    }
+
+
+def catalog_size(rows: int) -> int:
+    return max(10, rows // 100)
+
+
+def _insert(engine, model, rows) -> None:
+    rows = list(rows)
+    table = model.__table__
+    with engine.begin() as conn:
+        for start in range(0, len(rows), CHUNK):
+            conn.execute(insert(table), rows[start : start + CHUNK])
+        # Explicit IDs leave the serial sequence behind; move it past them
+        if rows and "id" in rows[0] and engine.dialect.name == "postgresql":
+            conn.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"(SELECT max(id) FROM {table.name}))"
+                )
+            )
+
+
+def seed_orders(models, engine, rows: int) -> None:
+    rng = random.Random(0)
+    customers = catalog_size(rows)
+    beers = catalog_size(rows)
+    _insert(
+        engine,
+        models.Customer,
+        ({"id": i, "customer_name": f"Customer {i}"} for i in range(1, customers + 1)),
+    )
+
+    inners, invoices, lines = [], [], []
+    beer_sales = defaultdict(lambda: [0, 0])
+    customer_sales = defaultdict(lambda: [0, 0])
+    statuses = list(models.OrderStatus)
+    inner_statuses = list(models.OrderStatusInner)
+    for order_id in range(1, rows + 1):
+        customer_id = rng.randint(1, customers)
+        order_date = TODAY - timedelta(days=rng.randrange(365))
+        quantities = {
+            beer_id: rng.randint(1, 20)
+            for beer_id in rng.sample(range(1, beers + 1), 2)
+        }
+        inners.append(
+            {
+                "id": order_id,
+                "status": rng.choice(inner_statuses).name,
+                "quantity_sum": sum(quantities.values()),
+            }
+        )
+        invoices.append(
+            {
+                "id": order_id,
+                "order_date": order_date,
+                "ship_date": order_date + timedelta(days=rng.randint(7, 60)),
+                "status": rng.choice(statuses).name,
+                "fk_customer": customer_id,
+                "fk_order_inner": order_id,
+            }
+        )
+        for beer_id, quantity in quantities.items():
+            lines.append(
+                {"fk_order": order_id, "fk_beer": beer_id, "quantity_hecto": quantity}
+            )
+            for sales in (
+                beer_sales[beer_id, order_date],
+                customer_sales[customer_id, order_date],
+            ):
+                sales[0] += quantity
+                sales[1] += 1
+
+    _insert(engine, models.OrderInner, inners)
+    _insert(engine, models.OrderInvoice, invoices)
+    _insert(engine, models.OrderInnerBeerAssociative, lines)
+    _insert(
+        engine,
+        models.BeerDailySales,
+        (
+            {"fk_beer": b, "sales_date": d, "quantity_hecto": q, "line_count": n}
+            for (b, d), (q, n) in beer_sales.items()
+        ),
+    )
+    _insert(
+        engine,
+        models.CustomerDailySales,
+        (
+            {"fk_customer": c, "sales_date": d, "quantity_hecto": q, "line_count": n}
+            for (c, d), (q, n) in customer_sales.items()
+        ),
+    )
+
+
+def seed_brewery(models, engine, rows: int) -> None:
+    rng = random.Random(0)
+    recipes = catalog_size(rows)
+    ingredients = catalog_size(rows)
+    _insert(
+        engine,
+        models.Recipe,
+        (
+            {
+                "id": i,
+                "fermentation_time": rng.randint(7, 21),
+                "aging_time": rng.randint(14, 90),
+            }
+            for i in range(1, recipes + 1)
+        ),
+    )
+    _insert(
+        engine,
+        models.Beer,
+        ({**beer(i), "fk_recipe": i} for i in range(1, recipes + 1)),
+    )
+    for model, column, per_recipe in (
+        (models.RecipeHopsAssociative, "fk_hop", 3),
+        (models.RecipeMaltsAssociative, "fk_malt", 2),
+        (models.RecipeYeastAssociative, "fk_yeast", 1),
+    ):
+        _insert(
+            engine,
+            model,
+            (
+                {
+                    "fk_recipe": recipe_id,
+                    column: ingredient_id,
+                    "quantity": rng.randint(1, 10),
+                }
+                for recipe_id in range(1, recipes + 1)
+                for ingredient_id in rng.sample(range(1, ingredients + 1), per_recipe)
+            ),
+        )
+    for model, key_column, stock_column in models.LOCAL_STORAGE.values():
+        _insert(
+            engine,
+            model,
+            (
+                {
+                    key_column: i,
+                    stock_column: rng.randint(0, 5_000),
+                    "min_stock_level": 100,
+                    "unit": "kg",
+                }
+                for i in range(1, ingredients + 1)
+            ),
+        )
+
+    start = datetime.combine(TODAY, datetime.min.time()) - timedelta(days=90)
+    _insert(
+        engine,
+        models.StockMovement,
+        (
+            {
+                "ingredient_type": rng.choice(tuple(models.LOCAL_STORAGE)),
+                "ingredient_id": rng.randint(1, ingredients),
+                "delta": rng.randint(1, 50) * (1 if reason == "allocation" else -1),
+                "reason": reason,
+                "created_at": start + timedelta(seconds=rng.randrange(90 * 86_400)),
+            }
+            for reason in rng.choices(("allocation", "consumption"), (1, 2), k=rows)
+        ),
+    )
+
+
+def seed_storage(models, engine, rows: int) -> None:
+    rng = random.Random(0)
+    per_type = max(10, rows // 3)
+    for model, storage_model, name, key_column, stock_column in (
+        (models.Hop, models.HopsStorage, "Hop", "fk_hop", "amount"),
+        (models.Malt, models.MaltsStorage, "Malt", "fk_malt", "quantity"),
+        (models.Yeast, models.YeastsStorage, "Yeast", "fk_yeast", "amount"),
+    ):
+        _insert(
+            engine,
+            model,
+            (
+                {"id": i, "name": f"{name} {i}", "country": rng.choice(COUNTRIES)}
+                for i in range(1, per_type + 1)
+            ),
+        )
+        _insert(
+            engine,
+            storage_model,
+            (
+                {key_column: i, stock_column: 1_000_000, "unit": "kg"}
+                for i in range(1, per_type + 1)
+            ),
+        )
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Replay recorded tool calls against a running stack, optionally sped up.
+
+Reads the files written with TRAFFIC_RECORD_PATH (see utils/traffic.py),
+drops calls between the services themselves, and re-issues the rest at
+their recorded offsets divided by --speed. Within one MCP session a call
+waits for every earlier call of that session that had finished before it
+started in the recording, since it may depend on that result. Calls that
+overlapped in the recording overlap again. Each recorded session is
+replayed on an MCP session of its own, so concurrency follows the recording.
+
+Latency is measured from the moment each call is issued. Answers that
+report a failure, such as insufficient stock, are counted as rejected
+instead of as fast calls. Idempotency keys
+get a per-run suffix so mutations are repeated rather than answered from
+the key table (--keep-idempotency-keys to disable). The report compares
+every tool with its recorded in-service latency, or with an earlier replay
+saved with --save:
+
+    uv run python -m benchmarks.replay /tmp/traffic-*.jsonl --speed 10 --save before.json
+    uv run python -m benchmarks.replay /tmp/traffic-*.jsonl --speed 10 --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from benchmarks.stats import is_rejected, summarize
+from utils.service_client import SERVICE_URLS, ServiceClient, ServiceCallError
+from utils.traffic import INTERNAL_CALLER
+
+# Client name of replayed calls, so a recording stack does not record them for replay
+REPLAY_CALLER = "pifko-replay"
+
+
+@dataclass
+class Call:
+    offset: float  # seconds after the first recorded call
+    service: str
+    tool: str
+    args: dict
+    recorded_ms: float
+    session: Optional[str]
+    # Waits for previous.ready, then for every call in after to be done
+    previous: Optional["Call"] = None
+    after: list["Call"] = field(default_factory=list)
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def label(self) -> str:
+        return f"{self.service}.{self.tool}"
+
+
+def load_trace(paths: list[str], include_internal: bool) -> list[Call]:
+    records = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    if not include_internal:
+        records = [r for r in records if r.get("caller") != INTERNAL_CALLER]
+    records = [r for r in records if r.get("caller") != REPLAY_CALLER]
+    records.sort(key=lambda r: r["t"])
+    if not records:
+        return []
+
+    first = records[0]["t"]
+    calls = []
+    # The calls a call depends on include those of the session's previous
+    # call, so each call only lists the ones that finished since; waiting
+    # for the previous call to be ready covers the rest.
+    last: dict[str, Call] = {}
+    # session -> [(recorded end, call)] not yet depended on
+    pending: dict[str, list[tuple[float, Call]]] = defaultdict(list)
+    for r in records:
+        call = Call(
+            offset=r["t"] - first,
+            service=r["service"],
+            tool=r["tool"],
+            args=r["args"],
+            recorded_ms=r["ms"],
+            session=r.get("session"),
+        )
+        if call.session is not None:
+            waiting = pending[call.session]
+            call.previous = last.get(call.session)
+            call.after = [c for end, c in waiting if end <= r["t"]]
+            waiting[:] = [(end, c) for end, c in waiting if end > r["t"]]
+            waiting.append((r["t"] + r["ms"] / 1000, call))
+            last[call.session] = call
+        calls.append(call)
+    return calls
+
+
+class Replay:
+    def __init__(
+        self, calls: list[Call], speed: float, concurrency: int, keep_keys: bool
+    ):
+        self.calls = calls
+        self.speed = speed
+        self.concurrency = concurrency
+        self.key_suffix = None if keep_keys else f"-replay-{uuid.uuid4().hex[:8]}"
+        # One client per recorded session and service, so calls share MCP
+        # sessions the way they did when recorded; closed after the last call
+        self.clients: dict[tuple, ServiceClient] = {}
+        self.remaining: dict[tuple, int] = defaultdict(int)
+        for call in calls:
+            self.remaining[call.session, call.service] += 1
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.rejected: dict[str, int] = defaultdict(int)
+        self.lag_ms: list[float] = []
+
+    def _arguments(self, call: Call) -> dict:
+        args = dict(call.args)
+        if self.key_suffix and args.get("idempotency_key"):
+            args["idempotency_key"] += self.key_suffix
+        return args
+
+    async def _issue(self, call: Call, start: float) -> None:
+        try:
+            delay = start + call.offset / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if call.previous is not None:
+                await call.previous.ready.wait()
+            for dependency in call.after:
+                await dependency.done.wait()
+            call.ready.set()
+            client = self._client(call)
+            try:
+                # The handshake of a new session is not part of the call
+                await client.connect()
+                issued = time.perf_counter()
+                self.lag_ms.append((issued - start - call.offset / self.speed) * 1000)
+                answer = await client.call(call.tool, self._arguments(call))
+            except ServiceCallError:
+                self.errors[call.label] += 1
+                return
+            if is_rejected(answer):
+                self.rejected[call.label] += 1
+                return
+            self.latencies[call.label].append((time.perf_counter() - issued) * 1000)
+        finally:
+            call.ready.set()
+            call.done.set()
+            await self._release(call)
+
+    def _client(self, call: Call) -> ServiceClient:
+        key = (call.session, call.service)
+        if key not in self.clients:
+            self.clients[key] = ServiceClient(
+                call.service,
+                SERVICE_URLS[call.service],
+                max_concurrency=self.concurrency,
+                client_name=REPLAY_CALLER,
+            )
+        return self.clients[key]
+
+    async def _release(self, call: Call) -> None:
+        key = (call.session, call.service)
+        self.remaining[key] -= 1
+        if not self.remaining[key] and key in self.clients:
+            await self.clients.pop(key).close()
+
+    async def run(self) -> float:
+        """Replay every call; returns the wall time taken"""
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(self._issue(call, start) for call in self.calls))
+        finally:
+            for client in list(self.clients.values()):
+                await client.close()
+        return time.perf_counter() - start
+
+
+def _ms(value: float) -> str:
+    return f"{value:9.2f}"
+
+
+def report(replay: Replay, elapsed: float, baseline: Optional[dict]) -> None:
+    if baseline is None:
+        reference_name = "recorded (in service)"
+        reference = defaultdict(list)
+        for call in replay.calls:
+            reference[call.label].append(call.recorded_ms)
+    else:
+        reference_name = f"replay {baseline['run']}"
+        reference = baseline["latencies"]
+
+    print(
+        f"{len(replay.calls)} calls in {elapsed:.1f}s at {replay.speed}x; p50/p95 ms vs {reference_name}"
+    )
+    print(
+        f"{'tool':<44} {'n':>6} {'ref p50':>9} {'p50':>9} {'ref p95':>9} {'p95':>9} {'p99':>9} {'p95 chg':>7} errors rejected"
+    )
+    for label in sorted(
+        set(replay.latencies) | set(replay.errors) | set(replay.rejected)
+    ):
+        ref = summarize(reference.get(label, []))
+        now = summarize(replay.latencies[label])
+        change = (
+            f"{(now['p95_ms'] / ref['p95_ms'] - 1) * 100:+6.0f}%"
+            if ref["count"] and now["count"] and ref["p95_ms"]
+            else f"{'-':>7}"
+        )
+        print(
+            f"{label:<44} {now['count']:>6} {_ms(ref['p50_ms'])} {_ms(now['p50_ms'])} "
+            f"{_ms(ref['p95_ms'])} {_ms(now['p95_ms'])} {_ms(now['p99_ms'])} {change} {replay.errors[label]:>6} {replay.rejected[label]:>8}"
+        )
+    lag = summarize(replay.lag_ms)
+    print(
+        f"issue lag behind schedule (waiting on earlier calls): "
+        f"p50={lag['p50_ms']:.1f}ms p99={lag['p99_ms']:.1f}ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "traces", nargs="+", help="Files recorded with TRAFFIC_RECORD_PATH"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Time compression, e.g. 1 to 50"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=256,
+        help="Calls in flight per recorded session and service",
+    )
+    parser.add_argument(
+        "--include-internal",
+        action="store_true",
+        help="Also replay calls between services",
+    )
+    parser.add_argument("--keep-idempotency-keys", action="store_true")
+    parser.add_argument("--save", help="Write this run's latencies to a JSON file")
+    parser.add_argument("--compare", help="Compare with a run written by --save")
+    opts = parser.parse_args()
+
+    calls = load_trace(opts.traces, opts.include_internal)
+    if not calls:
+        print("No calls to replay")
+        return
+    baseline = None
+    if opts.compare:
+        with open(opts.compare) as f:
+            baseline = json.load(f)
+
+    replay = Replay(calls, opts.speed, opts.concurrency, opts.keep_idempotency_keys)
+    elapsed = await replay.run()
+    report(replay, elapsed, baseline)
+
+    if opts.save:
+        with open(opts.save, "w") as f:
+            json.dump(
+                {
+                    "run": opts.save,
+                    "speed": opts.speed,
+                    "latencies": replay.latencies,
+                    "errors": replay.errors,
+                    "rejected": replay.rejected,
+                },
+                f,
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+"""Latency summaries shared by the benchmark scripts"""
+
+import math
+import re
+
+# Tools answer failures as text instead of raising; these are the forms they use
+REJECTION = re.compile(
+    r"(Insufficient|No storage|Invalid|Could not|Error|Date format error)\b"
+    r"|Idempotency key '.*' was already used"
+    r"|[^\n]{0,80} not found( in order \d+)?$"
+)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (q in 0..100)"""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def is_rejected(answer: str) -> bool:
+    """Whether a tool's text answer reports a failure rather than a result"""
+    return REJECTION.match(answer) is not None
+
+
+def summarize(latencies_ms: list[float]) -> dict:
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) if values else float("nan"),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else float("nan"),
+    }
+
+
+def format_row(label: str, summary: dict, width: int = 28) -> str:
+    return (
+        f"{label:<{width}} n={summary['count']:<6} "
+        f"mean={summary['mean_ms']:8.2f}ms p50={summary['p50_ms']:8.2f}ms "
+        f"p95={summary['p95_ms']:8.2f}ms p99={summary['p99_ms']:8.2f}ms "
+        f"max={summary['max_ms']:8.2f}ms"
+    )
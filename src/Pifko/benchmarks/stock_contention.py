@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""Concurrent stock mutations on one ingredient row, checked for linearizability.
+
+Workers fire a mix of allocations, restocks and absolute updates at a single
+ingredient and record when each call was issued and when it returned, with
+the amount it reported. Afterwards the history, ending with a read of the
+final amount, is checked against a sequential model of the stock counter:
+there must be one order of the calls, consistent with real time, in which
+every reported amount and every "insufficient stock" answer is right. A lost
+update or an oversold allocation has no such order.
+
+    --target storage   allocate_stock, restock_ingredient,
+                       restock_ingredients_batch, update_<x>_storage
+    --target brewery   adjust_local_storage_batch (negative and positive
+                       deltas), update_<x>s_storage
+
+Two ways to reach the tools:
+
+    --via mcp      the running services (SERVICE_URLS), over MCP
+    --via direct   the service imported in this process against
+                   --database-url, each worker in a thread of its own with
+                   its own event loop and database connection
+
+A single service process runs its tools one at a time, because they are
+synchronous inside async functions, so --via mcp measures throughput under
+contention but cannot race. --via direct has workers in separate
+transactions at once, as replicas of the service would be. Failed calls
+(lock timeouts, deadlocks, dropped connections) are counted per exception
+and may or may not have taken effect; the checker allows both.
+
+    uv run python -m benchmarks.stock_contention --via direct \\
+        --database-url $DATABASE_URL_HOST_STORAGE \\
+        --concurrency 1,4,16,64 --ops 2000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from benchmarks.stats import summarize
+
+# Operation mix per target: kind -> weight
+MIXES = {
+    "storage": {"allocate": 6, "restock": 2, "restock_batch": 2, "set": 1},
+    "brewery": {"allocate": 6, "restock": 3, "set": 1},
+}
+SINGULAR = {"hops": "hop", "malts": "malt", "yeasts": "yeast"}
+UNKNOWN = math.inf  # return time of a call whose outcome is unknown
+
+
+@dataclass
+class Op:
+    kind: str  # allocate, restock, restock_batch, set or read
+    value: int  # quantity, or the amount written by set
+    invoked: float
+    returned: float = UNKNOWN
+    ok: Optional[bool] = None  # allocate: False when stock was insufficient
+    observed: Optional[int] = None  # amount the service reported
+
+
+def _number(pattern: str, text: str) -> Optional[int]:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else None
+
+
+class Target:
+    """Tool names, arguments and answers of one service's stock tools"""
+
+    def __init__(self, service: str, ingredient_type: str, ingredient_id: int):
+        self.service = service
+        self.type = ingredient_type
+        self.id = ingredient_id
+        self.mix = MIXES[service]
+        singular = SINGULAR[ingredient_type]
+        column = "quantity" if ingredient_type == "malts" else "amount"
+        self.set_tool = (
+            f"update_{singular}_storage"
+            if service == "storage"
+            else f"update_{ingredient_type}_storage"
+        )
+        self.set_arguments = lambda value: {
+            f"{singular}_id": ingredient_id,
+            column: value,
+        }
+
+    def _adjust(self, delta: int) -> tuple[str, dict]:
+        adjustments = [
+            {"ingredient_type": self.type, "ingredient_id": self.id, "delta": delta}
+        ]
+        return "adjust_local_storage_batch", {
+            "adjustments_json": json.dumps(adjustments)
+        }
+
+    def call(self, kind: str, value: int) -> tuple[str, dict]:
+        if kind == "set":
+            return self.set_tool, self.set_arguments(value)
+        if kind == "read":
+            if self.service == "storage":
+                return f"get_{SINGULAR[self.type]}_storage", {
+                    f"{SINGULAR[self.type]}_id": self.id
+                }
+            return "check_stock_level", {
+                "ingredient_type": self.type,
+                "ingredient_id": self.id,
+                "quantity_needed": 0,
+            }
+        if kind == "restock_batch":
+            restocks = [
+                {
+                    "ingredient_type": self.type,
+                    "ingredient_id": self.id,
+                    "quantity": value,
+                }
+            ]
+            return "restock_ingredients_batch", {"restocks_json": json.dumps(restocks)}
+        if self.service == "brewery":
+            return self._adjust(-value if kind == "allocate" else value)
+        if kind == "allocate":
+            return "allocate_stock", {
+                "ingredient_type": self.type,
+                "ingredient_id": self.id,
+                "quantity_requested": value,
+                "requesting_facility": "stock-contention",
+            }
+        return "restock_ingredient", {
+            "ingredient_type": self.type,
+            "ingredient_id": self.id,
+            "quantity_to_add": value,
+        }
+
+    def parse(self, op: Op, result: str) -> None:
+        """Fill in op.ok and op.observed from the tool's answer"""
+        if op.kind == "set":
+            if "not found" in result:
+                raise RuntimeError(result)
+            return
+        if op.kind == "read":
+            op.observed = _number(r"'(?:amount|quantity)': (-?\d+)", result)
+            if op.observed is None:
+                op.observed = _number(r"Available (-?\d+)", result)
+        elif op.kind == "restock_batch":
+            op.observed = _number(r"'new_total': (-?\d+)", result)
+        elif self.service == "storage":
+            op.observed = _number(r"(?:Remaining|New total): (-?\d+)", result)
+            if op.observed is None:
+                op.observed = _number(r"Available: (-?\d+)", result)
+                op.ok = False if op.observed is not None else None
+            else:
+                op.ok = True
+        else:
+            op.observed = _number(r"'new_amount': (-?\d+)", result)
+            if op.observed is None:
+                op.observed = _number(r"have (-?\d+)", result)
+                op.ok = False if op.observed is not None else None
+            else:
+                op.ok = True
+        if op.observed is None:
+            raise RuntimeError(result)
+
+
+# Sequential model
+def apply(state: int, op: Op) -> Optional[int]:
+    """State after op, or None if op cannot have happened at state"""
+    if op.kind == "set":
+        return op.value
+    if op.kind == "read":
+        return state if op.observed == state else None
+    if op.kind in ("restock", "restock_batch"):
+        after = state + op.value
+        return after if op.observed in (None, after) else None
+    # allocate
+    if op.ok is None:  # unknown outcome: allocates if there was enough
+        return state - op.value if state >= op.value else state
+    if op.ok:
+        after = state - op.value
+        return after if after >= 0 and op.observed in (None, after) else None
+    return state if state < op.value and op.observed == state else None
+
+
+def check_linearizable(
+    ops: list[Op], initial: int, budget: int = 1_000_000
+) -> tuple[Optional[bool], int]:
+    """(verdict, states explored); verdict is None when the budget ran out.
+
+    Depth-first search over the calls that may come next (Wing and Gong,
+    with Lowe's memo of visited states). A call may be linearized next if it
+    was invoked before every remaining call returned. Calls with an unknown
+    outcome may be left out.
+    """
+    ops = sorted(ops, key=lambda o: o.invoked)
+    required = 0
+    for index, op in enumerate(ops):
+        if op.returned != UNKNOWN:
+            required |= 1 << index
+
+    seen = set()
+    stack = [(0, initial)]
+    while stack:
+        done, state = stack.pop()
+        if done & required == required:
+            return True, len(seen)
+        # Every call before the first remaining one is done, so shift it out
+        first = (~done & (done + 1)).bit_length() - 1
+        key = (first, done >> first, state)
+        if key in seen:
+            continue
+        seen.add(key)
+        if len(seen) > budget:
+            return None, len(seen)
+
+        # Candidates are invoked before the earliest return among remaining
+        # calls; as calls are sorted by invocation, they form a prefix
+        earliest_return = UNKNOWN
+        candidates = []
+        index = first
+        while index < len(ops) and ops[index].invoked <= earliest_return:
+            if not done >> index & 1:
+                op = ops[index]
+                after = apply(state, op)
+                if after is not None:
+                    candidates.append((done | 1 << index, after))
+                earliest_return = min(earliest_return, op.returned)
+            index += 1
+        # Earliest invoked on top of the stack
+        stack.extend(reversed(candidates))
+    return False, len(seen)
+
+
+# Running
+Caller = Callable[[str, dict], Awaitable[str]]
+
+
+async def _worker(
+    call: Caller,
+    target: Target,
+    rng: random.Random,
+    take: Callable[[], bool],
+    history: list[Op],
+    latencies: dict,
+    errors: Counter,
+) -> None:
+    kinds, weights = list(target.mix), list(target.mix.values())
+    while take():
+        kind = rng.choices(kinds, weights)[0]
+        op = Op(
+            kind,
+            rng.randint(0, 200) if kind == "set" else rng.randint(1, 5),
+            time.monotonic(),
+        )
+        history.append(op)
+        tool, arguments = target.call(op.kind, op.value)
+        try:
+            result = await call(tool, arguments)
+            returned = time.monotonic()
+            target.parse(op, result)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+            continue
+        op.returned = returned
+        latencies[kind].append((returned - op.invoked) * 1000)
+
+
+class Remaining:
+    """Hands out the next of a fixed number of operations, across threads"""
+
+    def __init__(self, total: int):
+        self.left = total
+        self.lock = threading.Lock()
+
+    def __call__(self) -> bool:
+        with self.lock:
+            self.left -= 1
+            return self.left >= 0
+
+
+async def _call_once(call: Caller, target: Target, kind: str, value: int) -> Op:
+    op = Op(kind, value, time.monotonic())
+    tool, arguments = target.call(kind, value)
+    target.parse(op, await call(tool, arguments))
+    op.returned = time.monotonic()
+    return op
+
+
+def run_level(opts, target: Target, concurrency: int, direct) -> dict:
+    """Run opts.ops calls with concurrency workers; returns the level's results"""
+    history: list[Op] = []
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    take = Remaining(opts.ops)
+    rngs = [random.Random(opts.seed * 1000 + i) for i in range(concurrency)]
+
+    if direct is not None:
+        call = direct
+        initial_op = asyncio.run(_call_once(call, target, "set", opts.initial))
+        start = time.monotonic()
+        threads = [
+            threading.Thread(
+                target=asyncio.run,
+                args=(_worker(call, target, rng, take, history, latencies, errors),),
+            )
+            for rng in rngs
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        final = asyncio.run(_call_once(call, target, "read", 0))
+    else:
+        from utils.service_client import SERVICE_URLS, ServiceClient
+
+        async def over_mcp():
+            client = ServiceClient(
+                target.service,
+                SERVICE_URLS[target.service],
+                max_concurrency=concurrency,
+                client_name="pifko-stock-contention",
+            )
+            try:
+                await client.connect()
+                initial = await _call_once(client.call, target, "set", opts.initial)
+                start = time.monotonic()
+                await asyncio.gather(
+                    *(
+                        _worker(
+                            client.call, target, rng, take, history, latencies, errors
+                        )
+                        for rng in rngs
+                    )
+                )
+                elapsed = time.monotonic() - start
+                final = await _call_once(client.call, target, "read", 0)
+                return initial, elapsed, final
+            finally:
+                await client.close()
+
+        initial_op, elapsed, final = asyncio.run(over_mcp())
+
+    verdict, explored = check_linearizable(
+        history + [final], initial_op.value, opts.budget
+    )
+    return {
+        "concurrency": concurrency,
+        "mix": target.mix,
+        "elapsed": elapsed,
+        "history": history,
+        "latencies": latencies,
+        "errors": errors,
+        "final": final.observed,
+        "verdict": verdict,
+        "explored": explored,
+    }
+
+
+def direct_caller(target: Target, database_url: str) -> Caller:
+    from benchmarks.in_process import load_service
+
+    main = load_service(target.service, database_url).main
+
+    async def call(tool: str, arguments: dict) -> str:
+        return await getattr(main, tool).fn(**arguments)
+
+    return call
+
+
+def report(level: dict) -> None:
+    history = level["history"]
+    completed = [op for op in history if op.returned != UNKNOWN]
+    insufficient = sum(1 for op in completed if op.kind == "allocate" and not op.ok)
+    failed = sum(level["errors"].values())
+    verdict = {True: "linearizable", False: "NOT LINEARIZABLE", None: "undecided"}[
+        level["verdict"]
+    ]
+    print(
+        f"concurrency {level['concurrency']:>4}: {len(completed) / level['elapsed']:8.1f} ops/s, "
+        f"{insufficient} insufficient, {failed} failed ({failed / max(len(history), 1):.1%}), "
+        f"final amount {level['final']}, {verdict} ({level['explored']} states)"
+    )
+    for kind in level["mix"]:
+        summary = summarize(level["latencies"][kind])
+        print(
+            f"    {kind:<13} n={summary['count']:<6} p50={summary['p50_ms']:8.2f}ms "
+            f"p99={summary['p99_ms']:8.2f}ms"
+        )
+    for error, count in level["errors"].most_common():
+        print(f"    {error}: {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=("storage", "brewery"), default="storage")
+    parser.add_argument("--type", choices=tuple(SINGULAR), default="hops")
+    parser.add_argument("--ingredient-id", type=int, default=1)
+    parser.add_argument("--via", choices=("mcp", "direct"), default="mcp")
+    parser.add_argument(
+        "--database-url", help="The target service's database, for --via direct"
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,4,16,64",
+        help="Comma separated numbers of workers, one run each",
+    )
+    parser.add_argument("--ops", type=int, default=2000, help="Calls per run")
+    parser.add_argument(
+        "--initial",
+        type=int,
+        default=100,
+        help="Amount set before each run; low values make allocations fail",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=1_000_000,
+        help="States the linearizability check may explore",
+    )
+    opts = parser.parse_args()
+    if opts.via == "direct" and not opts.database_url:
+        parser.error("--via direct needs --database-url")
+
+    target = Target(opts.target, opts.type, opts.ingredient_id)
+    direct = direct_caller(target, opts.database_url) if opts.via == "direct" else None
+    print(
+        f"{opts.ops} calls per run on {opts.target} {opts.type} {opts.ingredient_id} "
+        f"via {opts.via}, mix {target.mix}"
+    )
+    broken = False
+    for concurrency in (int(c) for c in opts.concurrency.split(",")):
+        level = run_level(opts, target, concurrency, direct)
+        report(level)
+        broken |= level["verdict"] is False
+    if broken:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
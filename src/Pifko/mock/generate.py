@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""Large, consistent mock data for all three databases, loaded with COPY.
+
+mock_db.py writes a handful of hand-picked rows; this writes as many as
+asked. Storage gets --ingredients hops, malts and yeasts with stock, the
+brewery gets local stock of the same ingredients, --recipes recipes using
+them and --beers beers brewing those recipes, and orders gets --customers
+customers and --orders orders with 1 to --max-lines lines on those beers.
+IDs therefore match across the databases.
+
+Rows are streamed to COPY ... FROM STDIN in chunks of CHUNK orders, one
+process per chunk, and the databases load concurrently. Every chunk draws
+from a random generator seeded with --seed and the chunk's position, so the
+same options give the same data whatever --jobs is. Afterwards sequences
+are moved past the written IDs, the sales rollups are rebuilt and the
+tables analyzed. Target databases should be empty (uv run clean_db.py).
+
+    uv run python -m mock.generate --orders 2000000 --seed 7    (about 10M rows)
+"""
+
+import argparse
+import io
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from types import ModuleType
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, SQLModel
+
+from services.brewery_service.db import models as brewery_models
+from services.orders_service.db import models as orders_models
+from services.orders_service.db.aggregates import rebuild_sales_rollups
+from services.storage_service.db import models as storage_models
+from utils import logger
+
+CHUNK = 50_000  # orders or stock movements per process and COPY round
+MODELS = {
+    "orders": orders_models,
+    "brewery": brewery_models,
+    "storage": storage_models,
+}
+# Ingredient type -> (table, storage table, local storage table, key column, stock column)
+INGREDIENTS = {
+    "hops": ("hops", "hops_storage", "local_hops_storage", "fk_hop", "amount"),
+    "malts": ("malts", "malts_storage", "local_malts_storage", "fk_malt", "quantity"),
+    "yeasts": (
+        "yeasts",
+        "yeasts_storage",
+        "local_yeasts_storage",
+        "fk_yeast",
+        "amount",
+    ),
+}
+RECIPE_INGREDIENTS = {
+    "hops": ("recipe_hops_associative", 3),
+    "malts": ("recipe_malts_associative", 2),
+    "yeasts": ("recipe_yeast_associative", 1),
+}
+COUNTRIES = ("Germany", "Czech Republic", "USA", "UK", "Belgium", "New Zealand")
+STYLES = ("Pilsner", "Lager", "Weissbier", "IPA", "Märzen", "Stout", "Porter")
+CITIES = ("München", "Berlin", "Hamburg", "Praha", "Wrocław", "Kraków", "Wien")
+# Orders older than this are done (or were cancelled)
+OPEN_ORDER_DAYS = 60
+
+
+def database_urls() -> dict[str, str]:
+    """service -> host database URL, from .env like the other mock scripts"""
+    load_dotenv()  # Load .env from host
+    urls = {
+        service: os.getenv(f"DATABASE_URL_HOST_{service.upper()}") for service in MODELS
+    }
+    missing = [service for service, url in urls.items() if not url]
+    if missing:
+        raise SystemExit(
+            f"Set {', '.join(f'DATABASE_URL_HOST_{s.upper()}' for s in missing)}"
+        )
+    return urls
+
+
+def _tables(models: ModuleType) -> list:
+    return [
+        value.__table__
+        for value in vars(models).values()
+        if isinstance(value, type)
+        and issubclass(value, SQLModel)
+        and value.__module__ == models.__name__
+        and hasattr(value, "__table__")
+    ]
+
+
+def _copy(cursor, table: str, columns: tuple, rows) -> int:
+    """COPY rows into table; returns how many were written"""
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(r"\N" if v is None else str(v) for v in row))
+        buffer.write("\n")
+        count += 1
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    return count
+
+
+def _run(url: str, load, *args) -> int:
+    """Run load(cursor, *args) in a transaction of its own; returns rows written"""
+    engine = create_engine(url, poolclass=NullPool)
+    connection = engine.raw_connection()
+    try:
+        rows = load(connection.cursor(), *args)
+        connection.commit()
+        return rows
+    finally:
+        connection.close()
+        engine.dispose()
+
+
+def _rng(opts, name: str, first: int = 0) -> random.Random:
+    return random.Random(f"{opts.seed}:{name}:{first}")
+
+
+def _skewed(rng: random.Random, count: int) -> int:
+    """1..count, low IDs far more often, like regular customers and best sellers"""
+    return 1 + int(count * rng.random() ** 2)
+
+
+# Loaders, each run in a worker process
+def load_storage(cursor, opts) -> int:
+    rng = _rng(opts, "storage")
+    rows = 0
+    for ingredient_type, (table, storage_table, _, key, stock) in INGREDIENTS.items():
+        name = ingredient_type[:-1].title()
+        rows += _copy(
+            cursor,
+            table,
+            ("id", "name", "country"),
+            (
+                (i, f"{name} {i}", rng.choice(COUNTRIES))
+                for i in range(1, opts.ingredients + 1)
+            ),
+        )
+        rows += _copy(
+            cursor,
+            storage_table,
+            (key, stock, "unit"),
+            (
+                (i, rng.randint(1_000, 100_000), "kg")
+                for i in range(1, opts.ingredients + 1)
+            ),
+        )
+    return rows
+
+
+def load_brewery_catalog(cursor, opts) -> int:
+    rng = _rng(opts, "brewery")
+    rows = _copy(
+        cursor,
+        "recipes",
+        ("id", "fermentation_time", "aging_time"),
+        (
+            (i, rng.randint(7, 28), rng.randint(14, 90))
+            for i in range(1, opts.recipes + 1)
+        ),
+    )
+    rows += _copy(
+        cursor,
+        "beer",
+        ("id", "name", "style", "fk_recipe"),
+        (
+            (i, f"Pifko {i}", rng.choice(STYLES), rng.randint(1, opts.recipes))
+            for i in range(1, opts.beers + 1)
+        ),
+    )
+    for ingredient_type, (table, per_recipe) in RECIPE_INGREDIENTS.items():
+        key = INGREDIENTS[ingredient_type][3]
+        rows += _copy(
+            cursor,
+            table,
+            ("fk_recipe", key, "quantity"),
+            (
+                (recipe_id, ingredient_id, rng.randint(1, 10))
+                for recipe_id in range(1, opts.recipes + 1)
+                for ingredient_id in rng.sample(
+                    range(1, opts.ingredients + 1),
+                    min(per_recipe, opts.ingredients),
+                )
+            ),
+        )
+    for _, _, local_table, key, stock in INGREDIENTS.values():
+        rows += _copy(
+            cursor,
+            local_table,
+            (key, stock, "min_stock_level", "unit"),
+            (
+                (i, rng.randint(0, 2_000), rng.randint(50, 200), "kg")
+                for i in range(1, opts.ingredients + 1)
+            ),
+        )
+    return rows
+
+
+def load_customers(cursor, opts) -> int:
+    rng = _rng(opts, "customers")
+    return _copy(
+        cursor,
+        "customer",
+        ("id", "customer_name"),
+        (
+            (i, f"Beer Shop {rng.choice(CITIES)} {i}")
+            for i in range(1, opts.customers + 1)
+        ),
+    )
+
+
+def _statuses(rng: random.Random, age_days: int) -> tuple:
+    """(invoice status, inner status) of an order placed age_days ago"""
+    Status, Inner = orders_models.OrderStatus, orders_models.OrderStatusInner
+    if age_days > OPEN_ORDER_DAYS:
+        if rng.random() < 0.03:
+            return Status.CANCELLED, Inner.PENDING
+        return Status.DONE, Inner.DONE
+    status = rng.choice((Status.PENDING, Status.CONFIRMED, Status.IN_PRODUCTION))
+    if status == Status.PENDING:
+        return status, Inner.PENDING
+    if status == Status.CONFIRMED:
+        return status, Inner.READY_FOR_FERMENTING
+    return status, rng.choice(
+        (
+            Inner.FERMENTING,
+            Inner.DONE_FERMENTING,
+            Inner.READY_FOR_AGING,
+            Inner.AGING,
+            Inner.DONE_AGING,
+            Inner.READY_FOR_PRODUCTION,
+        )
+    )
+
+
+def load_orders(cursor, opts, first: int, last: int) -> int:
+    """Orders first..last with their invoices and lines"""
+    rng = _rng(opts, "orders", first)
+    until = opts.until
+    inners, invoices, lines = [], [], []
+    for order_id in range(first, last + 1):
+        order_date = until - timedelta(days=rng.randrange(opts.days))
+        status, inner_status = _statuses(rng, (until - order_date).days)
+        if status == orders_models.OrderStatus.PENDING:
+            ship_date = None
+        elif status == orders_models.OrderStatus.DONE:
+            ship_date = order_date + timedelta(days=rng.randint(7, 45))
+        else:  # deadline of an open order
+            ship_date = order_date + timedelta(days=rng.randint(30, 90))
+
+        quantities = {
+            _skewed(rng, opts.beers): rng.randint(1, 20)
+            for _ in range(rng.randint(1, opts.max_lines))
+        }
+        inners.append((order_id, inner_status.name, sum(quantities.values())))
+        invoices.append(
+            (
+                order_id,
+                order_date,
+                ship_date,
+                status.name,
+                _skewed(rng, opts.customers),
+                order_id,
+            )
+        )
+        lines.extend(
+            (order_id, beer_id, quantity) for beer_id, quantity in quantities.items()
+        )
+
+    rows = _copy(cursor, "order_inner", ("id", "status", "quantity_sum"), inners)
+    rows += _copy(
+        cursor,
+        "order_invoice",
+        ("id", "order_date", "ship_date", "status", "fk_customer", "fk_order_inner"),
+        invoices,
+    )
+    rows += _copy(
+        cursor,
+        "order_inner_beer_associative",
+        ("fk_order", "fk_beer", "quantity_hecto"),
+        lines,
+    )
+    return rows
+
+
+def load_movements(cursor, opts, first: int, last: int) -> int:
+    """Local stock movements first..last, the history behind reorder points"""
+    rng = _rng(opts, "movements", first)
+    start = datetime.combine(opts.until, datetime.min.time()) - timedelta(
+        days=opts.days
+    )
+    movements = []
+    for movement_id in range(first, last + 1):
+        reason = rng.choices(("allocation", "consumption"), (1, 2))[0]
+        movements.append(
+            (
+                movement_id,
+                rng.choice(tuple(INGREDIENTS)),
+                rng.randint(1, opts.ingredients),
+                rng.randint(1, 50) * (1 if reason == "allocation" else -1),
+                reason,
+                start + timedelta(seconds=rng.randrange(opts.days * 86_400)),
+            )
+        )
+    return _copy(
+        cursor,
+        "local_stock_movement",
+        ("id", "ingredient_type", "ingredient_id", "delta", "reason", "created_at"),
+        movements,
+    )
+
+
+def finish(service: str, url: str) -> None:
+    """Move sequences past the written IDs, rebuild derived data, analyze"""
+    engine = create_engine(url, poolclass=NullPool)
+    try:
+        with Session(engine) as session:
+            for table in _tables(MODELS[service]):
+                if "id" in table.c:
+                    session.exec(
+                        text(
+                            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                            f"(SELECT max(id) FROM {table.name}))"
+                        )
+                    )
+            if service == "orders":
+                rebuild_sales_rollups(session)
+            session.commit()
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(
+                text("ANALYZE")
+            )
+    finally:
+        engine.dispose()
+
+
+def _chunks(count: int):
+    for first in range(1, count + 1, CHUNK):
+        yield first, min(first + CHUNK - 1, count)
+
+
+def prepare(urls: dict[str, str]) -> None:
+    """Create missing tables and refuse to load into databases holding data"""
+    for service, url in urls.items():
+        engine = create_engine(url, poolclass=NullPool)
+        try:
+            tables = _tables(MODELS[service])
+            SQLModel.metadata.create_all(engine, tables=tables)
+            with engine.connect() as conn:
+                filled = [
+                    table.name
+                    for table in tables
+                    if conn.execute(
+                        text(f"SELECT EXISTS (SELECT 1 FROM {table.name})")
+                    ).scalar()
+                ]
+        finally:
+            engine.dispose()
+        if filled:
+            raise SystemExit(
+                f"{service} already has data in {', '.join(filled)}; run clean_db.py first"
+            )
+
+
+def generate(opts) -> None:
+    urls = database_urls()
+    prepare(urls)
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(opts.jobs) as pool:
+        # Catalogs first: orders and lines point at them
+        catalogs = [
+            pool.submit(_run, urls["storage"], load_storage, opts),
+            pool.submit(_run, urls["brewery"], load_brewery_catalog, opts),
+            pool.submit(_run, urls["orders"], load_customers, opts),
+        ]
+        rows = sum(future.result() for future in catalogs)
+        logger.info("Loaded catalogs", extra={"count": rows, "emoji": "🍺"})
+
+        chunks = [
+            pool.submit(_run, urls["orders"], load_orders, opts, first, last)
+            for first, last in _chunks(opts.orders)
+        ] + [
+            pool.submit(_run, urls["brewery"], load_movements, opts, first, last)
+            for first, last in _chunks(opts.movements)
+        ]
+        for future in chunks:
+            rows += future.result()
+        logger.info("Loaded orders and movements", extra={"count": rows, "emoji": "🍺"})
+
+        for future in [
+            pool.submit(finish, service, url) for service, url in urls.items()
+        ]:
+            future.result()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Generated {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)",
+        extra={"status": "✅"},
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--ingredients", type=int, default=200, help="Hops, malts and yeasts each"
+    )
+    parser.add_argument("--recipes", type=int, default=100)
+    parser.add_argument("--beers", type=int, default=150)
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--max-lines", type=int, default=5, help="Beers per order")
+    parser.add_argument(
+        "--movements", type=int, default=100_000, help="Brewery local stock movements"
+    )
+    parser.add_argument(
+        "--days", type=int, default=730, help="Order history before --until"
+    )
+    parser.add_argument(
+        "--until",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="Last order date (default today); fix it to repeat a dataset exactly",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(), help="Loader processes"
+    )
+    opts = parser.parse_args()
+    if min(opts.ingredients, opts.recipes, opts.beers, opts.customers) < 1:
+        parser.error("--ingredients, --recipes, --beers and --customers must be >= 1")
+    generate(opts)
+
+
+if __name__ == "__main__":
+    main()
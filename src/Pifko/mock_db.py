@@ -1,3 +1,5 @@
+from concurrent.futures import ProcessPoolExecutor
+
 from mock.mock_brewery import inject_mock_data as inject_brewery_mock_data
 
 from mock.mock_storage import inject_mock_data as inject_storage_mock_data
@@ -7,12 +9,20 @@ from utils import logger
 
 
 def mock_db() -> None:
-    logger.info("\n\nMocking brewery...\n\n")
-    inject_brewery_mock_data()
-    logger.info("\n\nMocking storage...\n\n")
-    inject_storage_mock_data()
-    logger.info("\n\nMocking orders...\n\n")
-    inject_orders_mock_data()
+    # Each mock script points DATABASE_URL at its own database before
+    # connecting, so they run in separate processes to seed concurrently
+    logger.info("\n\nMocking brewery, storage and orders...\n\n")
+    with ProcessPoolExecutor(3) as pool:
+        futures = [
+            pool.submit(inject)
+            for inject in (
+                inject_brewery_mock_data,
+                inject_storage_mock_data,
+                inject_orders_mock_data,
+            )
+        ]
+        for future in futures:
+            future.result()
     logger.info("\n\nMocking complete!\n\n")
 
 
@@ -2,7 +2,9 @@
 """Data cleansing script for Brewery Service - removes all data but keeps schema"""
 
 
-from sqlmodel import delete
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine, delete
 from utils.logger import get_logger
 
 from .models import (
@@ -14,6 +16,9 @@ from .models import (
     RecipeHopsAssociative,
     RecipeMaltsAssociative,
     RecipeYeastAssociative,
+    IdempotencyKey,
+    OutboxEvent,
+    StockMovement,
 )
 import os
 from dotenv import load_dotenv
@@ -36,6 +41,14 @@ def cleanse_data():
     with get_db_session() as session:
         # Delete in reverse order of dependencies to avoid foreign key constraints
 
+        # 0. Delete idempotency keys
+        session.exec(delete(IdempotencyKey))
+        logger.info("Deleted idempotency keys", extra={"emoji": "🗑️"})
+        session.exec(delete(OutboxEvent))
+        logger.info("Deleted outbox events", extra={"emoji": "🗑️"})
+        session.exec(delete(StockMovement))
+        logger.info("Deleted stock movements", extra={"emoji": "🗑️"})
+
         # 1. Delete recipe associations first
         hops_assoc_deleted = session.exec(delete(RecipeHopsAssociative))
         logger.info(
@@ -151,5 +164,32 @@ def cleanse_data():
         )
 
 
+def truncate_data():
+    """Remove all data from brewery database in one TRUNCATE, restarting ID sequences"""
+    load_dotenv()  # Load .env from host
+    engine = create_engine(os.getenv("DATABASE_URL_HOST_BREWERY"), poolclass=NullPool)
+    tables = ", ".join(
+        model.__tablename__
+        for model in (
+            Recipe,
+            Beer,
+            LocalHopsStorage,
+            LocalMaltsStorage,
+            LocalYeastsStorage,
+            RecipeHopsAssociative,
+            RecipeMaltsAssociative,
+            RecipeYeastAssociative,
+            IdempotencyKey,
+            OutboxEvent,
+            StockMovement,
+        )
+    )
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+    finally:
+        engine.dispose()
+
+
 if __name__ == "__main__":
     cleanse_data()
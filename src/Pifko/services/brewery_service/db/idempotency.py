@@ -0,0 +1,12 @@
+"""Idempotency keys of the brewery service (see utils/idempotency.py)."""
+
+from utils.idempotency import IdempotencyKeys, request_fingerprint
+
+from .connection import get_db_session
+from .models import IdempotencyKey
+
+idempotency_keys = IdempotencyKeys(IdempotencyKey, get_db_session)
+
+replay = idempotency_keys.replay
+commit_with_key = idempotency_keys.commit_with_key
+purge_expired_keys_periodically = idempotency_keys.purge_expired_keys_periodically
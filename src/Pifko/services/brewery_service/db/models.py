@@ -1,5 +1,7 @@
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
+from datetime import datetime
+from sqlalchemy import Index
 
 # Brewery Operations & Local Storage Database Models
 
@@ -50,6 +52,13 @@ class LocalYeastsStorage(SQLModel, table=True):
     min_stock_level: Optional[int]
     unit: Optional[str]
 
+# ingredient type -> (local storage model, key column, stock column)
+LOCAL_STORAGE = {
+    "hops": (LocalHopsStorage, "fk_hop", "amount"),
+    "malts": (LocalMaltsStorage, "fk_malt", "quantity"),
+    "yeasts": (LocalYeastsStorage, "fk_yeast", "amount"),
+}
+
 # Recipe Associations (quantities needed for recipes)
 class RecipeHopsAssociative(SQLModel, table=True):
     __tablename__ = "recipe_hops_associative"
@@ -78,6 +87,48 @@ class RecipeYeastAssociative(SQLModel, table=True):
     # Relationships
     recipe: Recipe = Relationship(back_populates="yeasts")
 
+# Idempotency keys for retried mutating tools
+class IdempotencyKey(SQLModel, table=True):
+    __tablename__ = "brewery_idempotency_key"
+    key: str = Field(primary_key=True, max_length=128)
+    tool: str
+    request_hash: str = Field(max_length=32)
+    response: str
+    expires_at: datetime = Field(index=True)
+
+
+# Transactional outbox feeding the change feed
+class OutboxEvent(SQLModel, table=True):
+    __tablename__ = "brewery_outbox_event"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str = Field(index=True)
+    entity: str
+    entity_id: str
+    payload: str
+    created_at: datetime
+    published_at: Optional[datetime] = Field(default=None, index=True)
+
+
+# Local stock movements, the history behind computed reorder points
+class StockMovement(SQLModel, table=True):
+    __tablename__ = "local_stock_movement"
+    __table_args__ = (
+        Index(
+            "ix_local_stock_movement_reason_created_at_ingredient",
+            "reason",
+            "created_at",
+            "ingredient_type",
+            "ingredient_id",
+        ),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ingredient_type: str
+    ingredient_id: int
+    delta: int
+    reason: str = Field(description="allocation, consumption or release")
+    created_at: datetime
+
+
 # Pydantic models for API communication
 class IngredientRequirement(SQLModel):
     ingredient_id: int
@@ -0,0 +1,58 @@
+"""Change feed of the brewery service (see utils/change_feed.py)."""
+
+from utils.change_feed import ChangeFeed, Tracked
+
+from .connection import engine
+from .models import (
+    Beer,
+    LocalHopsStorage,
+    LocalMaltsStorage,
+    LocalYeastsStorage,
+    OutboxEvent,
+    Recipe,
+)
+
+
+def _below_threshold(stock_column: str):
+    """Derive below_threshold when stock drops under min_stock_level"""
+
+    def derive(op: str, row, changes: dict) -> list[str]:
+        if op == "deleted":
+            return []
+        stock = getattr(row, stock_column)
+        minimum = row.min_stock_level
+        old_stock, new_stock = changes.get(stock_column, (stock, stock))
+        old_min, new_min = changes.get("min_stock_level", (minimum, minimum))
+        now_below = new_min is not None and (new_stock or 0) < new_min
+        was_below = (
+            op == "updated" and old_min is not None and (old_stock or 0) < old_min
+        )
+        return ["below_threshold"] if now_below and not was_below else []
+
+    return derive
+
+
+change_feed = ChangeFeed(
+    "brewery",
+    engine,
+    OutboxEvent,
+    {
+        Recipe: Tracked("recipe", ("fermentation_time", "aging_time")),
+        Beer: Tracked("beer", ("name", "style", "fk_recipe")),
+        LocalHopsStorage: Tracked(
+            "local_hops_storage",
+            ("amount", "min_stock_level", "unit"),
+            derive=_below_threshold("amount"),
+        ),
+        LocalMaltsStorage: Tracked(
+            "local_malts_storage",
+            ("quantity", "min_stock_level", "unit"),
+            derive=_below_threshold("quantity"),
+        ),
+        LocalYeastsStorage: Tracked(
+            "local_yeasts_storage",
+            ("amount", "min_stock_level", "unit"),
+            derive=_below_threshold("amount"),
+        ),
+    },
+)
@@ -0,0 +1,192 @@
+"""Reorder points for local storage, computed from recorded stock movements.
+
+Every change made through adjust_local_storage_batch or the
+update_*_storage tools is logged in local_stock_movement with a reason.
+Stock arriving from master storage is an allocation. Stock drawn down for
+brewing is a consumption; setting a lower amount directly counts as one.
+Stock handed back by a compensated saga or a cancelled order is a release,
+which counts as neither. The refresh reads daily consumption over the history window and
+aggregates it per ingredient with one grouped query. Days without
+consumption count as zero. Those totals give the mean and variance of daily
+usage, and from them
+
+    safety stock  = z * sigma_daily * sqrt(lead time)
+    reorder point = mean_daily * lead time + safety stock
+
+where z is the standard normal quantile of the target service level. The
+reorder point becomes min_stock_level. Ingredients without consumption in
+the window keep their manually entered level.
+"""
+
+import asyncio
+import math
+import os
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from utils.logger import get_logger
+
+from .connection import get_db_session
+from .models import LOCAL_STORAGE, StockMovement
+
+logger = get_logger("reorder")
+
+MOVEMENT_REASONS = ("allocation", "consumption", "release")
+
+SERVICE_LEVEL = float(os.getenv("REORDER_SERVICE_LEVEL", 0.95))
+LEAD_TIME_DAYS = float(os.getenv("REORDER_LEAD_TIME_DAYS", 2))
+HISTORY_DAYS = int(os.getenv("REORDER_HISTORY_DAYS", 90))
+REFRESH_INTERVAL_SECONDS = int(os.getenv("REORDER_REFRESH_INTERVAL_SECONDS", 86_400))
+
+
+def default_reason(delta: int) -> str:
+    return "allocation" if delta > 0 else "consumption"
+
+
+def record_movements(session: Session, movements: list[dict], reason=None) -> None:
+    """Log (ingredient_type, ingredient_id, delta) movements in the session's transaction"""
+    now = datetime.now()
+    session.add_all(
+        StockMovement(
+            ingredient_type=m["ingredient_type"],
+            ingredient_id=m["ingredient_id"],
+            delta=m["delta"],
+            reason=reason or default_reason(m["delta"]),
+            created_at=now,
+        )
+        for m in movements
+        if m["delta"]
+    )
+
+
+def usage_statistics(session: Session, since: datetime) -> list[tuple]:
+    """(type, id, days, total, sum of squares, allocated) per ingredient, one query"""
+    day = func.date_trunc("day", StockMovement.created_at)
+    daily = (
+        select(
+            StockMovement.ingredient_type,
+            StockMovement.ingredient_id,
+            StockMovement.reason,
+            day.label("day"),
+            func.sum(func.abs(StockMovement.delta)).label("quantity"),
+        )
+        .where(StockMovement.created_at >= since)
+        .where(StockMovement.reason.in_(("allocation", "consumption")))
+        .group_by(
+            StockMovement.ingredient_type,
+            StockMovement.ingredient_id,
+            StockMovement.reason,
+            day,
+        )
+        .subquery()
+    )
+    consumed = daily.c.reason == "consumption"
+    rows = session.exec(
+        select(
+            daily.c.ingredient_type,
+            daily.c.ingredient_id,
+            func.min(daily.c.day).filter(consumed),
+            func.sum(daily.c.quantity).filter(consumed),
+            func.sum(daily.c.quantity * daily.c.quantity).filter(consumed),
+            func.sum(daily.c.quantity).filter(daily.c.reason == "allocation"),
+        ).group_by(daily.c.ingredient_type, daily.c.ingredient_id)
+    ).all()
+
+    # New ingredients are averaged over the days since their first usage
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    window = (today - since).days + 1
+    return [
+        (
+            ingredient_type,
+            ingredient_id,
+            min(window, (today - first_day).days + 1) if first_day else window,
+            float(total or 0),
+            float(squares or 0),
+            float(allocated or 0),
+        )
+        for ingredient_type, ingredient_id, first_day, total, squares, allocated in rows
+    ]
+
+
+def reorder_point(
+    days: int, total: float, squares: float, service_level: float, lead_time: float
+) -> tuple[float, float, float, int]:
+    """(mean daily usage, daily std deviation, safety stock, reorder point)"""
+    mean = total / days
+    variance = (squares - days * mean * mean) / (days - 1) if days > 1 else 0.0
+    sigma = math.sqrt(max(variance, 0.0))
+    z = NormalDist().inv_cdf(service_level)
+    safety = z * sigma * math.sqrt(lead_time)
+    return mean, sigma, safety, math.ceil(mean * lead_time + safety)
+
+
+def refresh_reorder_points(
+    session: Session,
+    service_level: float = SERVICE_LEVEL,
+    lead_time_days: float = LEAD_TIME_DAYS,
+    history_days: int = HISTORY_DAYS,
+    apply: bool = True,
+) -> list[dict]:
+    """Recompute min_stock_level for every ingredient with recent consumption"""
+    if not 0 < service_level < 1:
+        raise ValueError("service_level must be between 0 and 1")
+
+    since = datetime.now().replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) - timedelta(days=history_days - 1)
+    points: dict[str, dict[int, dict]] = {}
+    for (
+        ingredient_type,
+        ingredient_id,
+        days,
+        total,
+        squares,
+        allocated,
+    ) in usage_statistics(session, since):
+        if not total or ingredient_type not in LOCAL_STORAGE:
+            continue
+        mean, sigma, safety, point = reorder_point(
+            days, total, squares, service_level, lead_time_days
+        )
+        points.setdefault(ingredient_type, {})[ingredient_id] = {
+            "ingredient_type": ingredient_type,
+            "ingredient_id": ingredient_id,
+            "daily_usage": round(mean, 2),
+            "daily_usage_std": round(sigma, 2),
+            "daily_allocation": round(allocated / days, 2),
+            "safety_stock": math.ceil(safety),
+            "reorder_point": point,
+        }
+
+    results = []
+    for ingredient_type, by_id in sorted(points.items()):
+        storage_model, key_column, stock_column = LOCAL_STORAGE[ingredient_type]
+        key = getattr(storage_model, key_column)
+        # One locked read per type; the ORM flush then batches the UPDATEs
+        # and the change feed sees every new level
+        storage_rows = session.exec(
+            select(storage_model).where(key.in_(by_id)).with_for_update()
+        ).all()
+        for storage in storage_rows:
+            point = by_id[getattr(storage, key_column)]
+            point["previous_min_stock_level"] = storage.min_stock_level
+            point["stock"] = getattr(storage, stock_column)
+            if apply and storage.min_stock_level != point["reorder_point"]:
+                storage.min_stock_level = point["reorder_point"]
+                session.add(storage)
+            results.append(point)
+    return results
+
+
+async def refresh_reorder_points_periodically() -> None:
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+        try:
+            with get_db_session() as session:
+                updated = refresh_reorder_points(session)
+            logger.info(f"Refreshed reorder points of {len(updated)} ingredients")
+        except Exception as e:
+            logger.warning(f"Refreshing reorder points failed: {e}")
@@ -1,4 +1,7 @@
 import os
+import json
+import asyncio
+from collections import defaultdict
 from fastmcp import FastMCP
 from typing import Annotated, List, Optional
 from sqlmodel import Session, select
@@ -6,6 +9,7 @@ from contextlib import asynccontextmanager
 
 # Import models and database
 from db.models import (
+    LOCAL_STORAGE,
     Recipe,
     Beer,
     LocalHopsStorage,
@@ -15,7 +19,27 @@ from db.models import (
     RecipeMaltsAssociative,
     RecipeYeastAssociative,
 )
-from db.connection import get_session, create_db_and_tables
+from db.connection import engine, get_session, create_db_and_tables, query_stats
+from db.outbox import change_feed
+from utils.metrics import instrument
+from utils.profiler import add_profiler
+from utils.tracing import setup_tracing
+from utils.traffic import record_traffic
+from db.reorder import (
+    HISTORY_DAYS,
+    LEAD_TIME_DAYS,
+    MOVEMENT_REASONS,
+    SERVICE_LEVEL,
+    record_movements,
+    refresh_reorder_points,
+    refresh_reorder_points_periodically,
+)
+from db.idempotency import (
+    commit_with_key,
+    purge_expired_keys_periodically,
+    replay,
+    request_fingerprint,
+)
 
 
 # Initialize FastMCP
@@ -23,11 +47,28 @@ from db.connection import get_session, create_db_and_tables
 @asynccontextmanager
 async def lifespan(app):
     create_db_and_tables()
+    key_purger = asyncio.create_task(purge_expired_keys_periodically())
+    outbox_relay = asyncio.create_task(change_feed.run_relay())
+    reorder_refresh = asyncio.create_task(refresh_reorder_points_periodically())
     yield
+    key_purger.cancel()
+    outbox_relay.cancel()
+    reorder_refresh.cancel()
 
 
 # Pass lifespan to FastMCP
 mcp = FastMCP("Brewery MCP Server", lifespan=lifespan)
+metrics = instrument(mcp, "brewery", engine)
+setup_tracing(mcp, "brewery", engine)
+add_profiler(mcp)
+record_traffic(mcp, "brewery")
+
+# ingredient type -> (recipe association model, ingredient column)
+RECIPE_INGREDIENTS = {
+    "hops": (RecipeHopsAssociative, "fk_hop"),
+    "malts": (RecipeMaltsAssociative, "fk_malt"),
+    "yeasts": (RecipeYeastAssociative, "fk_yeast"),
+}
 
 
 # Beer Tools
@@ -42,6 +83,33 @@ async def get_beers() -> str:
         session.close()
 
 
+@mcp.tool()
+async def get_beers_by_ids(beer_ids: List[int]) -> str:
+    """Get many beers with their recipe timings in one call, as a JSON list"""
+    session = next(get_session())
+    try:
+        rows = session.exec(
+            select(Beer, Recipe)
+            .join(Recipe, Beer.fk_recipe == Recipe.id)
+            .where(Beer.id.in_(beer_ids))
+        ).all()
+        return json.dumps(
+            [
+                {
+                    "id": beer.id,
+                    "name": beer.name,
+                    "style": beer.style,
+                    "recipe_id": beer.fk_recipe,
+                    "fermentation_time": recipe.fermentation_time,
+                    "aging_time": recipe.aging_time,
+                }
+                for beer, recipe in rows
+            ]
+        )
+    finally:
+        session.close()
+
+
 @mcp.tool()
 async def create_beer(name: str, style: str, recipe_id: int) -> str:
     """Create a new beer"""
@@ -194,12 +262,17 @@ async def update_hops_storage(
     """Update or create hops storage entry"""
     session = next(get_session())
     try:
-        hop_storage = session.get(LocalHopsStorage, hop_id)
+        hop_storage = session.get(LocalHopsStorage, hop_id, with_for_update=True)
         if not hop_storage:
             hop_storage = LocalHopsStorage(fk_hop=hop_id)
 
         if amount is not None:
+            delta = amount - (hop_storage.amount or 0)
             hop_storage.amount = amount
+            record_movements(
+                session,
+                [{"ingredient_type": "hops", "ingredient_id": hop_id, "delta": delta}],
+            )
         if min_stock_level is not None:
             hop_storage.min_stock_level = min_stock_level
         if unit is not None:
@@ -222,12 +295,23 @@ async def update_malts_storage(
     """Update or create malts storage entry"""
     session = next(get_session())
     try:
-        malt_storage = session.get(LocalMaltsStorage, malt_id)
+        malt_storage = session.get(LocalMaltsStorage, malt_id, with_for_update=True)
         if not malt_storage:
             malt_storage = LocalMaltsStorage(fk_malt=malt_id)
 
         if quantity is not None:
+            delta = quantity - (malt_storage.quantity or 0)
             malt_storage.quantity = quantity
+            record_movements(
+                session,
+                [
+                    {
+                        "ingredient_type": "malts",
+                        "ingredient_id": malt_id,
+                        "delta": delta,
+                    }
+                ],
+            )
         if min_stock_level is not None:
             malt_storage.min_stock_level = min_stock_level
         if unit is not None:
@@ -250,12 +334,23 @@ async def update_yeasts_storage(
     """Update or create yeasts storage entry"""
     session = next(get_session())
     try:
-        yeast_storage = session.get(LocalYeastsStorage, yeast_id)
+        yeast_storage = session.get(LocalYeastsStorage, yeast_id, with_for_update=True)
         if not yeast_storage:
             yeast_storage = LocalYeastsStorage(fk_yeast=yeast_id)
 
         if amount is not None:
+            delta = amount - (yeast_storage.amount or 0)
             yeast_storage.amount = amount
+            record_movements(
+                session,
+                [
+                    {
+                        "ingredient_type": "yeasts",
+                        "ingredient_id": yeast_id,
+                        "delta": delta,
+                    }
+                ],
+            )
         if min_stock_level is not None:
             yeast_storage.min_stock_level = min_stock_level
         if unit is not None:
@@ -410,6 +505,170 @@ async def check_stock_level(
         session.close()
 
 
+@mcp.tool()
+async def get_ingredient_requirements(beer_orders_json: str) -> str:
+    """Total ingredients needed to brew several beers, compared with local storage, as JSON
+    beer_orders_json should be a JSON string like: '[{"beer_id": 1, "quantity_hecto": 5}, {"beer_id": 2, "quantity_hecto": 3}]'
+    """
+    session = next(get_session())
+    try:
+        hectolitres = defaultdict(int)
+        for beer_order in json.loads(beer_orders_json):
+            hectolitres[beer_order["beer_id"]] += beer_order["quantity_hecto"]
+
+        beers = session.exec(select(Beer).where(Beer.id.in_(hectolitres))).all()
+        recipe_hectolitres = defaultdict(int)
+        for beer in beers:
+            recipe_hectolitres[beer.fk_recipe] += hectolitres[beer.id]
+
+        ingredients = []
+        for ingredient_type, (assoc_model, ingredient_column) in RECIPE_INGREDIENTS.items():
+            needed = defaultdict(int)
+            for assoc in session.exec(
+                select(assoc_model).where(assoc_model.fk_recipe.in_(recipe_hectolitres))
+            ):
+                needed[getattr(assoc, ingredient_column)] += (
+                    assoc.quantity or 0
+                ) * recipe_hectolitres[assoc.fk_recipe]
+
+            storage_model, key_column, stock_column = LOCAL_STORAGE[ingredient_type]
+            available = {
+                getattr(row, key_column): getattr(row, stock_column) or 0
+                for row in session.exec(
+                    select(storage_model).where(
+                        getattr(storage_model, key_column).in_(needed)
+                    )
+                )
+            }
+            for ingredient_id, quantity in sorted(needed.items()):
+                local = available.get(ingredient_id, 0)
+                ingredients.append(
+                    {
+                        "ingredient_type": ingredient_type,
+                        "ingredient_id": ingredient_id,
+                        "needed": quantity,
+                        "local_available": local,
+                        "shortfall": max(0, quantity - local),
+                    }
+                )
+
+        missing_beers = sorted(set(hectolitres) - {b.id for b in beers})
+        return json.dumps(
+            {
+                "missing_beers": missing_beers,
+                "ingredients": ingredients,
+                "feasible_locally": not missing_beers
+                and all(i["shortfall"] == 0 for i in ingredients),
+            }
+        )
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return "Invalid JSON format for beer_orders_json"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def adjust_local_storage_batch(
+    adjustments_json: str,
+    idempotency_key: Optional[str] = None,
+    reason: Optional[str] = None,
+) -> str:
+    """Add or remove local stock for many ingredients in one transaction
+    adjustments_json should be a JSON string like: '[{"ingredient_type": "hops", "ingredient_id": 1, "delta": 20}]'
+    reason is recorded with each movement: allocation, consumption or release (stock handed back).
+    By default additions are allocations and removals are consumption.
+    Nothing is changed if any entry would drop below zero.
+    """
+    if reason is not None and reason not in MOVEMENT_REASONS:
+        return f"Invalid reason: {reason}. Use: {', '.join(MOVEMENT_REASONS)}"
+    session = next(get_session())
+    try:
+        fingerprint = request_fingerprint(
+            "adjust_local_storage_batch",
+            adjustments_json=adjustments_json,
+            reason=reason,
+        )
+        replayed = replay(
+            session, idempotency_key, "adjust_local_storage_batch", fingerprint
+        )
+        if replayed is not None:
+            return replayed
+
+        # Lock rows in a fixed order so concurrent batches cannot deadlock
+        adjustments = sorted(
+            json.loads(adjustments_json),
+            key=lambda a: (a["ingredient_type"], a["ingredient_id"]),
+        )
+        results = []
+        for adjustment in adjustments:
+            ingredient_type = adjustment["ingredient_type"]
+            ingredient_id = adjustment["ingredient_id"]
+            delta = adjustment["delta"]
+            if ingredient_type not in LOCAL_STORAGE:
+                return f"Invalid ingredient type: {ingredient_type}. Use: hops, malts, or yeasts"
+
+            storage_model, key_column, stock_column = LOCAL_STORAGE[ingredient_type]
+            storage = session.exec(
+                select(storage_model)
+                .where(getattr(storage_model, key_column) == ingredient_id)
+                .with_for_update()
+            ).first()
+            if not storage:
+                storage = storage_model(**{key_column: ingredient_id, stock_column: 0})
+
+            new_amount = (getattr(storage, stock_column) or 0) + delta
+            if new_amount < 0:
+                session.rollback()
+                return f"Insufficient local {ingredient_type} stock for ID {ingredient_id}: have {getattr(storage, stock_column) or 0}, delta {delta}"
+
+            setattr(storage, stock_column, new_amount)
+            session.add(storage)
+            results.append(
+                {
+                    "ingredient_type": ingredient_type,
+                    "ingredient_id": ingredient_id,
+                    "new_amount": new_amount,
+                }
+            )
+
+        record_movements(session, adjustments, reason)
+        return commit_with_key(
+            session,
+            idempotency_key,
+            "adjust_local_storage_batch",
+            fingerprint,
+            f"Adjusted local storage ({len(results)}): {results}",
+        )
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return "Invalid JSON format for adjustments_json"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def refresh_reorder_points_now(
+    service_level: float = SERVICE_LEVEL,
+    lead_time_days: float = LEAD_TIME_DAYS,
+    history_days: int = HISTORY_DAYS,
+    apply: bool = True,
+) -> str:
+    """Recompute min_stock_level of local ingredients from their daily consumption.
+    reorder point = mean daily usage * lead time + z(service_level) * daily std * sqrt(lead time).
+    Ingredients without consumption in the last history_days keep their level. Use apply=False to preview.
+    """
+    session = next(get_session())
+    try:
+        points = refresh_reorder_points(
+            session, service_level, lead_time_days, history_days, apply
+        )
+        session.commit()
+        return f"Reorder points ({len(points)}, service level {service_level}, lead time {lead_time_days} days): {points}"
+    except ValueError as e:
+        return str(e)
+    finally:
+        session.close()
+
+
 # Recipe Association Tools
 @mcp.tool()
 async def add_hop_to_recipe(recipe_id: int, hop_id: int, quantity: int) -> str:
@@ -456,6 +715,45 @@ async def add_yeast_to_recipe(recipe_id: int, yeast_id: int, quantity: int) -> s
         session.close()
 
 
+# Query Stats Tools
+@mcp.tool()
+async def get_top_queries(
+    limit: int = 10, order_by: str = "total", reset: bool = False
+) -> str:
+    """Get the SQL statements (normalised to fingerprints) that cost the most since startup.
+    order_by: total, mean, max or calls. reset=True clears the statistics after reading them.
+    """
+    if order_by not in ("total", "mean", "max", "calls"):
+        return f"Invalid order_by: {order_by}. Use: total, mean, max or calls"
+    queries = query_stats.top(limit, order_by)
+    if reset:
+        query_stats.reset()
+    return f"Top queries by {order_by} ({len(queries)}): {queries}"
+
+
+# Change Feed Tools
+@mcp.tool()
+async def get_changes(
+    after_id: int = 0,
+    topic: Optional[str] = None,
+    limit: int = 100,
+    as_json: bool = False,
+) -> str:
+    """Get change events after a known event ID, oldest first.
+    topic may use * wildcards, e.g. "local_*.below_threshold". Live events are also published via LISTEN on the "brewery_changes" channel.
+    as_json returns {"last_id": newest event ID, "changes": [...]} as JSON, for services following the feed.
+    """
+    session = next(get_session())
+    try:
+        changes = change_feed.read_events(session, after_id, topic, limit)
+        if as_json:
+            last_id = change_feed.last_event_id(session)
+            return json.dumps({"last_id": last_id, "changes": changes})
+        return f"Changes ({len(changes)}): {changes}"
+    finally:
+        session.close()
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8002))
     mcp.run(transport="streamable-http", host="0.0.0.0", port=port)
@@ -0,0 +1,186 @@
+"""Consolidation of open order lines into shared, tank-sized production batches.
+
+Open lines (pending or confirmed invoices) are grouped by beer, then swept in
+ship date order into windows: a window holds the lines that ship within
+window_days of its earliest line. Each window is packed into tanks with
+first-fit decreasing. A line larger than a tank fills whole tanks first, and
+only its remainder is packed.
+
+Every batch gets one combined ingredient allocation, computed from the
+recipe requirements per hectolitre. Those come from one brewery call per
+distinct beer, made concurrently. The plan is compared with brewing every
+line on its own, which takes ceil(quantity / capacity) tanks and one
+allocation per ingredient for each line.
+"""
+
+import asyncio
+import json
+import math
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlmodel import Session, select
+
+from db.models import OrderInnerBeerAssociative, OrderInvoice, OrderStatus
+from utils.service_client import get_service_client
+
+TANK_CAPACITY_HECTO = int(os.getenv("TANK_CAPACITY_HECTO", 50))
+
+
+def first_fit_decreasing(items: list[tuple[int, dict]], capacity: int) -> list[list]:
+    """Pack (size, item) pairs into as few bins of capacity as the heuristic finds"""
+    bins: list[list] = []
+    free: list[int] = []
+    for size, item in sorted(items, key=lambda pair: pair[0], reverse=True):
+        for i, room in enumerate(free):
+            if size <= room:
+                bins[i].append((size, item))
+                free[i] -= size
+                break
+        else:
+            bins.append([(size, item)])
+            free.append(capacity - size)
+    return bins
+
+
+def ship_windows(lines: list[dict], window_days: int) -> list[list[dict]]:
+    """Split lines of one beer into groups shipping within window_days of each other.
+
+    Lines without a ship date have no deadline to keep apart, so they all
+    share one window, after the dated ones:
+
+    >>> undated = [{"ship_date": None}] * 3
+    >>> dated = [{"ship_date": date(2025, 1, day)} for day in (1, 5, 20)]
+    >>> [len(window) for window in ship_windows(dated + undated, 7)]
+    [2, 1, 3]
+    """
+    windows: list[list[dict]] = []
+    start: Optional[date] = None
+    dated = [l for l in lines if l["ship_date"] is not None]
+    for line in sorted(dated, key=lambda l: l["ship_date"]):
+        if windows and line["ship_date"] - start <= timedelta(days=window_days):
+            windows[-1].append(line)
+        else:
+            windows.append([line])
+            start = line["ship_date"]
+    undated = [l for l in lines if l["ship_date"] is None]
+    if undated:
+        windows.append(undated)
+    return windows
+
+
+def open_lines(session: Session) -> list[dict]:
+    rows = session.exec(
+        select(
+            OrderInvoice.id,
+            OrderInvoice.ship_date,
+            OrderInnerBeerAssociative.fk_order,
+            OrderInnerBeerAssociative.fk_beer,
+            OrderInnerBeerAssociative.quantity_hecto,
+        )
+        .join(
+            OrderInnerBeerAssociative,
+            OrderInnerBeerAssociative.fk_order == OrderInvoice.fk_order_inner,
+        )
+        .where(OrderInvoice.status.in_([OrderStatus.PENDING, OrderStatus.CONFIRMED]))
+        .where(OrderInnerBeerAssociative.quantity_hecto > 0)
+    ).all()
+    return [
+        {
+            "invoice_id": invoice_id,
+            "ship_date": ship_date,
+            "order_inner_id": order_inner_id,
+            "beer_id": beer_id,
+            "quantity_hecto": quantity,
+        }
+        for invoice_id, ship_date, order_inner_id, beer_id, quantity in rows
+    ]
+
+
+async def ingredients_per_hecto(beer_ids: list[int]) -> dict[int, list[dict]]:
+    """Recipe ingredients for one hectolitre of each beer"""
+    brewery = get_service_client("brewery")
+    results = await asyncio.gather(
+        *(
+            brewery.call_json(
+                "get_ingredient_requirements",
+                {"beer_orders_json": json.dumps([{"beer_id": b, "quantity_hecto": 1}])},
+            )
+            for b in beer_ids
+        )
+    )
+    return {
+        beer_id: [
+            {
+                "ingredient_type": i["ingredient_type"],
+                "ingredient_id": i["ingredient_id"],
+                "per_hecto": i["needed"],
+            }
+            for i in result["ingredients"]
+        ]
+        for beer_id, result in zip(beer_ids, results)
+    }
+
+
+async def plan_batches(
+    lines: list[dict], window_days: int, capacity: int = TANK_CAPACITY_HECTO
+) -> dict:
+    by_beer: dict[int, list[dict]] = {}
+    for line in lines:
+        by_beer.setdefault(line["beer_id"], []).append(line)
+    recipes = await ingredients_per_hecto(sorted(by_beer))
+
+    batches = []
+    for beer_id, beer_lines in sorted(by_beer.items()):
+        for window in ship_windows(beer_lines, window_days):
+            items = []
+            for line in window:
+                full_tanks, remainder = divmod(line["quantity_hecto"], capacity)
+                # Lines over capacity fill whole tanks of their own first
+                for _ in range(full_tanks):
+                    batches.append([(capacity, line)])
+                if remainder:
+                    items.append((remainder, line))
+            batches.extend(first_fit_decreasing(items, capacity))
+
+    plan = []
+    for tank in batches:
+        beer_id = tank[0][1]["beer_id"]
+        hecto = sum(size for size, _ in tank)
+        ship_dates = [l["ship_date"] for _, l in tank if l["ship_date"]]
+        plan.append(
+            {
+                "beer_id": beer_id,
+                "quantity_hecto": hecto,
+                "fill": round(hecto / capacity, 2),
+                "ship_by": str(min(ship_dates)) if ship_dates else None,
+                "lines": [
+                    {"invoice_id": l["invoice_id"], "quantity_hecto": size}
+                    for size, l in tank
+                ],
+                "allocation": [
+                    {
+                        "ingredient_type": i["ingredient_type"],
+                        "ingredient_id": i["ingredient_id"],
+                        "quantity": i["per_hecto"] * hecto,
+                    }
+                    for i in recipes[beer_id]
+                ],
+            }
+        )
+    plan.sort(key=lambda b: (b["ship_by"] or "9999", b["beer_id"]))
+
+    separate_tanks = sum(math.ceil(l["quantity_hecto"] / capacity) for l in lines)
+    separate_allocations = sum(len(recipes[l["beer_id"]]) for l in lines)
+    batched_allocations = sum(len(b["allocation"]) for b in plan)
+    return {
+        "tank_capacity_hecto": capacity,
+        "window_days": window_days,
+        "open_lines": len(lines),
+        "batches": plan,
+        "tanks": len(plan),
+        "tanks_saved": separate_tanks - len(plan),
+        "allocation_calls": batched_allocations,
+        "allocation_calls_saved": separate_allocations - batched_allocations,
+    }
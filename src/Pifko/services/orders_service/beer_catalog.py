@@ -0,0 +1,125 @@
+"""Orders-side cache of beer details owned by the brewery service.
+
+Order lines only hold fk_beer. Listing tools resolve every beer ID of a page
+through BeerCatalog.get_many, which serves hits from an LRU/TTL cache and
+fetches all misses with a single get_beers_by_ids call to the brewery. Beers
+edited in the brewery are evicted within a poll of its get_changes tool
+instead of waiting for the TTL.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from utils.logger import get_logger
+from utils.service_client import get_service_client
+
+logger = get_logger("beer_catalog")
+
+
+class BeerCatalog:
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # beer_id -> (expires_at, beer dict or None when the brewery has no such beer)
+        self._entries: OrderedDict[int, tuple[float, Optional[dict]]] = OrderedDict()
+
+    def _lookup(self, beer_id: int, now: float):
+        entry = self._entries.get(beer_id)
+        if entry is None or entry[0] <= now:
+            return False, None
+        self._entries.move_to_end(beer_id)
+        return True, entry[1]
+
+    def _store(self, beer_id: int, beer: Optional[dict], now: float) -> None:
+        self._entries[beer_id] = (now + self.ttl_seconds, beer)
+        self._entries.move_to_end(beer_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, beer_ids: list[int]) -> list[dict]:
+        return await get_service_client("brewery").call_json(
+            "get_beers_by_ids", {"beer_ids": beer_ids}
+        )
+
+    async def get_many(self, beer_ids: Iterable[int]) -> dict[int, Optional[dict]]:
+        """Resolve beer IDs to brewery details; unknown or unreachable beers map to None"""
+        now = time.monotonic()
+        found: dict[int, Optional[dict]] = {}
+        missing = []
+        for beer_id in set(beer_ids):
+            hit, beer = self._lookup(beer_id, now)
+            if hit:
+                found[beer_id] = beer
+            else:
+                missing.append(beer_id)
+
+        if not missing:
+            return found
+
+        try:
+            fetched = {beer["id"]: beer for beer in await self._fetch(sorted(missing))}
+        except Exception as e:
+            # Degrade to raw IDs rather than failing the listing
+            logger.warning(f"Beer lookup in brewery service failed: {e}")
+            found.update({beer_id: None for beer_id in missing})
+            return found
+
+        for beer_id in missing:
+            beer = fetched.get(beer_id)
+            self._store(beer_id, beer, now)
+            found[beer_id] = beer
+        return found
+
+    def invalidate(self, beer_id: Optional[int] = None) -> None:
+        if beer_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(beer_id, None)
+
+
+beer_catalog = BeerCatalog(
+    max_entries=int(os.getenv("BEER_CACHE_SIZE", 10_000)),
+    ttl_seconds=float(os.getenv("BEER_CACHE_TTL_SECONDS", 300)),
+)
+
+
+async def _brewery_changes(brewery, after_id: int, limit: int) -> dict:
+    return await brewery.call_json(
+        "get_changes",
+        {"after_id": after_id, "topic": "beer.*", "limit": limit, "as_json": True},
+    )
+
+
+async def follow_brewery_changes(poll_seconds: float, page_size: int = 500) -> None:
+    """Evict beers from the cache as the brewery changes them"""
+    brewery = get_service_client("brewery")
+    after_id = None
+    while True:
+        try:
+            if after_id is None:
+                # Follow from the newest event; anything cached before is suspect
+                after_id = (await _brewery_changes(brewery, 0, 0))["last_id"]
+                beer_catalog.invalidate()
+            changes = (await _brewery_changes(brewery, after_id, page_size))["changes"]
+            for change in changes:
+                beer_catalog.invalidate(int(change["entity_id"]))
+                after_id = change["id"]
+            if len(changes) == page_size:
+                continue
+        except Exception as e:
+            logger.warning(f"Polling brewery changes failed: {e}")
+        await asyncio.sleep(poll_seconds)
+
+
+def beer_line(beer_id: int, quantity_hecto: Optional[int], beers: dict) -> dict:
+    """Order line enriched with the beer's name and style when known"""
+    beer = beers.get(beer_id) or {}
+    return {
+        "beer_id": beer_id,
+        "name": beer.get("name"),
+        "style": beer.get("style"),
+        "quantity_hecto": quantity_hecto,
+    }
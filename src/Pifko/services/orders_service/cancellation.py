@@ -0,0 +1,167 @@
+"""Order cancellation that gives back everything held for the order.
+
+Completed production sagas moved ingredients from master storage into
+brewery local storage. If brewing has not started yet, those ingredients
+are taken back out of local storage with one batch adjustment and returned
+to master storage with one batched restock. Both calls use idempotency keys
+derived from the invoice ID, so a retried cancellation never returns stock
+twice. The invoice is marked CANCELLED only after the stock is back, under a
+lock that re-checks the order and its sagas, and in the same transaction its
+readiness record is removed. Its stage timer is
+cancelled, and the production queue drops it through the change feed.
+"""
+
+import json
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlmodel import select
+
+from db.connection import get_db_session
+from db.models import (
+    OrderInvoice,
+    OrderStatus,
+    OrderStatusInner,
+    ProductionReadiness,
+    SagaRun,
+    SagaStatus,
+    SagaStep,
+    SagaStepStatus,
+)
+from stage_timers import stage_scheduler
+from utils.service_client import get_service_client
+
+# Ingredients of orders in these stages are already in the tanks
+BREWING_STARTED = {
+    OrderStatusInner.FERMENTING,
+    OrderStatusInner.DONE_FERMENTING,
+    OrderStatusInner.READY_FOR_AGING,
+    OrderStatusInner.AGING,
+    OrderStatusInner.DONE_AGING,
+    OrderStatusInner.DONE,
+}
+
+
+def _held_stock(session, invoice_id: int) -> list[dict]:
+    """Ingredients transferred to the brewery by the order's completed sagas"""
+    transfers = session.exec(
+        select(SagaStep.payload)
+        .join(SagaRun, SagaRun.id == SagaStep.fk_saga)
+        .where(SagaRun.fk_invoice == invoice_id)
+        .where(SagaRun.status == SagaStatus.COMPLETED)
+        .where(SagaStep.kind == "transfer")
+        .where(SagaStep.status == SagaStepStatus.DONE)
+    ).all()
+    totals = defaultdict(int)
+    for payload in transfers:
+        for item in json.loads(payload)["items"]:
+            totals[(item["ingredient_type"], item["ingredient_id"])] += item["quantity"]
+    return [
+        {"ingredient_type": t, "ingredient_id": i, "quantity": q}
+        for (t, i), q in sorted(totals.items())
+        if q > 0
+    ]
+
+
+async def _return_stock(invoice_id: int, held: list[dict]) -> str:
+    released = await get_service_client("brewery").call(
+        "adjust_local_storage_batch",
+        {
+            "adjustments_json": json.dumps(
+                [
+                    {
+                        "ingredient_type": h["ingredient_type"],
+                        "ingredient_id": h["ingredient_id"],
+                        "delta": -h["quantity"],
+                    }
+                    for h in held
+                ]
+            ),
+            "idempotency_key": f"cancel-invoice-{invoice_id}-release",
+            "reason": "release",
+        },
+    )
+    if not released.startswith("Adjusted"):
+        # Other orders already used the stock; it stays with the brewery
+        return f"ingredients kept in brewery local storage ({released})"
+
+    restocked = await get_service_client("storage").call(
+        "restock_ingredients_batch",
+        {
+            "restocks_json": json.dumps(held),
+            "idempotency_key": f"cancel-invoice-{invoice_id}-restock",
+        },
+    )
+    if not restocked.startswith("Restocked"):
+        raise RuntimeError(f"restock of released ingredients failed: {restocked}")
+    return f"returned to master storage: {held}"
+
+
+def _refusal(session, invoice_id: int, invoice) -> Optional[str]:
+    """Why the order cannot be cancelled right now, or None"""
+    if not invoice:
+        return f"Order Invoice with ID {invoice_id} not found"
+    if invoice.status == OrderStatus.CANCELLED:
+        return f"Order {invoice_id} is already cancelled"
+    if invoice.status == OrderStatus.DONE:
+        return f"Order {invoice_id} is done and can no longer be cancelled"
+
+    running = session.exec(
+        select(SagaRun.id)
+        .where(SagaRun.fk_invoice == invoice_id)
+        .where(SagaRun.status.in_([SagaStatus.RUNNING, SagaStatus.COMPENSATING]))
+    ).first()
+    if running:
+        return f"Order {invoice_id} has production saga {running} in progress; retry once it finishes"
+    return None
+
+
+def _locked_invoice(session, invoice_id: int) -> Optional[OrderInvoice]:
+    # Sagas lock the invoice when they start, so this serializes with them
+    return session.exec(
+        select(OrderInvoice).where(OrderInvoice.id == invoice_id).with_for_update()
+    ).first()
+
+
+async def cancel_order(invoice_id: int) -> str:
+    with get_db_session() as session:
+        invoice = session.get(OrderInvoice, invoice_id)
+        refusal = _refusal(session, invoice_id, invoice)
+        if refusal:
+            return refusal
+
+        order_inner_id = invoice.fk_order_inner
+        brewing = invoice.order_inner.status in BREWING_STARTED
+        held = [] if brewing else _held_stock(session, invoice_id)
+
+    if brewing:
+        stock = "ingredients already used in brewing"
+    elif held:
+        try:
+            stock = await _return_stock(invoice_id, held)
+        except Exception as e:
+            return f"Could not cancel order {invoice_id}: {e}. Retrying is safe."
+    else:
+        stock = "no ingredients were allocated"
+
+    with get_db_session() as session:
+        invoice = _locked_invoice(session, invoice_id)
+        refusal = _refusal(session, invoice_id, invoice)
+        if refusal:
+            return f"{refusal} (changed while cancelling; {stock})"
+        if (invoice.order_inner.status in BREWING_STARTED) != brewing or (
+            not brewing and _held_stock(session, invoice_id) != held
+        ):
+            return f"Order {invoice_id} changed while cancelling ({stock}); retry to cancel it"
+
+        invoice.status = OrderStatus.CANCELLED
+        session.add(invoice)
+        session.exec(
+            delete(ProductionReadiness).where(
+                ProductionReadiness.fk_invoice == invoice_id
+            )
+        )
+    stage_scheduler.cancel([order_inner_id])
+
+    return f"Cancelled order {invoice_id}: {stock}; stage timer and production queue slot released"
@@ -0,0 +1,287 @@
+"""Derived order data kept in sync with order lines"""
+
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Date, cast, delete, func, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from .models import (
+    BeerDailySales,
+    CustomerDailySales,
+    OrderInner,
+    OrderInnerBeerAssociative,
+    OrderInvoice,
+)
+
+SALES_BUCKETS = ("day", "week", "month", "quarter", "year")
+
+
+def apply_quantity_delta(session: Session, order_inner_id: int, delta: int) -> None:
+    """Shift OrderInner.quantity_sum by delta inside the caller's transaction.
+
+    The update is a single atomic statement, so concurrent line changes on the
+    same order never overwrite each other's totals.
+    """
+    if not delta:
+        return
+    session.exec(
+        update(OrderInner)
+        .where(OrderInner.id == order_inner_id)
+        .values(quantity_sum=func.coalesce(OrderInner.quantity_sum, 0) + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def find_quantity_drift(session: Session) -> list[dict]:
+    """Return orders whose stored quantity_sum differs from the sum of their lines"""
+    line_sums = (
+        select(
+            OrderInnerBeerAssociative.fk_order.label("order_id"),
+            func.sum(OrderInnerBeerAssociative.quantity_hecto).label("line_sum"),
+        )
+        .group_by(OrderInnerBeerAssociative.fk_order)
+        .subquery()
+    )
+    actual = func.coalesce(line_sums.c.line_sum, 0)
+    rows = session.exec(
+        select(OrderInner.id, OrderInner.quantity_sum, actual)
+        .outerjoin(line_sums, line_sums.c.order_id == OrderInner.id)
+        .where(OrderInner.quantity_sum.is_distinct_from(actual))
+    ).all()
+    return [
+        {"id": order_id, "stored": stored, "actual": int(actual_sum)}
+        for order_id, stored, actual_sum in rows
+    ]
+
+
+def repair_quantity_drift(session: Session) -> int:
+    """Rewrite every drifted quantity_sum in one statement; returns rows fixed"""
+    line_sum = (
+        select(func.coalesce(func.sum(OrderInnerBeerAssociative.quantity_hecto), 0))
+        .where(OrderInnerBeerAssociative.fk_order == OrderInner.id)
+        .scalar_subquery()
+    )
+    result = session.exec(
+        update(OrderInner)
+        .where(OrderInner.quantity_sum.is_distinct_from(line_sum))
+        .values(quantity_sum=line_sum)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+# Sales rollups
+def _upsert_sales(session: Session, model, key_name: str, deltas: dict) -> None:
+    """Add (quantity, lines) deltas keyed by (key_id, sales_date) into a rollup table"""
+    rows = [
+        {
+            key_name: key_id,
+            "sales_date": sales_date,
+            "quantity_hecto": quantity,
+            "line_count": lines,
+        }
+        for (key_id, sales_date), (quantity, lines) in deltas.items()
+        if quantity or lines
+    ]
+    if not rows:
+        return
+
+    stmt = pg_insert(model).values(rows)
+    session.exec(
+        stmt.on_conflict_do_update(
+            index_elements=[key_name, "sales_date"],
+            set_={
+                "quantity_hecto": model.quantity_hecto + stmt.excluded.quantity_hecto,
+                "line_count": model.line_count + stmt.excluded.line_count,
+            },
+        )
+    )
+
+
+def _invoice_key(session: Session, order_inner_id: int) -> Optional[tuple[int, date]]:
+    row = session.exec(
+        select(OrderInvoice.fk_customer, OrderInvoice.order_date).where(
+            OrderInvoice.fk_order_inner == order_inner_id
+        )
+    ).first()
+    if not row or row[1] is None:
+        return None
+    return row[0], row[1]
+
+
+def apply_line_rollup(
+    session: Session,
+    order_inner_id: int,
+    beer_id: int,
+    quantity_delta: int,
+    line_delta: int = 0,
+) -> None:
+    """Fold a single order line change into the per-beer and per-customer rollups"""
+    key = _invoice_key(session, order_inner_id)
+    if key is None:
+        # Orders without a dated invoice are picked up once the invoice exists
+        return
+    customer_id, order_date = key
+    delta = {(beer_id, order_date): (quantity_delta, line_delta)}
+    _upsert_sales(session, BeerDailySales, "fk_beer", delta)
+    delta = {(customer_id, order_date): (quantity_delta, line_delta)}
+    _upsert_sales(session, CustomerDailySales, "fk_customer", delta)
+
+
+def apply_order_rollup(session: Session, order_inner_id: int, sign: int) -> None:
+    """Add (sign=1) or withdraw (sign=-1) every line of an order from the rollups.
+
+    Used when the invoice that dates and owns the order is created, re-pointed
+    or deleted, so the rollups follow the invoice's customer and order_date.
+    """
+    key = _invoice_key(session, order_inner_id)
+    if key is None:
+        return
+    customer_id, order_date = key
+
+    lines = session.exec(
+        select(
+            OrderInnerBeerAssociative.fk_beer, OrderInnerBeerAssociative.quantity_hecto
+        ).where(OrderInnerBeerAssociative.fk_order == order_inner_id)
+    ).all()
+    if not lines:
+        return
+
+    beer_deltas = defaultdict(lambda: (0, 0))
+    for beer_id, quantity in lines:
+        quantity_sum, line_count = beer_deltas[(beer_id, order_date)]
+        beer_deltas[(beer_id, order_date)] = (
+            quantity_sum + sign * (quantity or 0),
+            line_count + sign,
+        )
+    total = sum(quantity or 0 for _, quantity in lines)
+
+    _upsert_sales(session, BeerDailySales, "fk_beer", beer_deltas)
+    _upsert_sales(
+        session,
+        CustomerDailySales,
+        "fk_customer",
+        {(customer_id, order_date): (sign * total, sign * len(lines))},
+    )
+
+
+def rebuild_sales_rollups(session: Session) -> tuple[int, int]:
+    """Recompute both rollup tables from the order lines in two INSERT ... SELECTs"""
+    session.exec(delete(BeerDailySales))
+    session.exec(delete(CustomerDailySales))
+
+    dated_lines = (
+        select(
+            OrderInnerBeerAssociative.fk_beer,
+            OrderInvoice.fk_customer,
+            OrderInvoice.order_date,
+            OrderInnerBeerAssociative.quantity_hecto,
+        )
+        .join(
+            OrderInvoice,
+            OrderInvoice.fk_order_inner == OrderInnerBeerAssociative.fk_order,
+        )
+        .where(OrderInvoice.order_date.is_not(None))
+        .subquery()
+    )
+
+    beer_rows = session.exec(
+        insert(BeerDailySales).from_select(
+            ["fk_beer", "sales_date", "quantity_hecto", "line_count"],
+            select(
+                dated_lines.c.fk_beer,
+                dated_lines.c.order_date,
+                func.coalesce(func.sum(dated_lines.c.quantity_hecto), 0),
+                func.count(),
+            ).group_by(dated_lines.c.fk_beer, dated_lines.c.order_date),
+        )
+    ).rowcount
+    customer_rows = session.exec(
+        insert(CustomerDailySales).from_select(
+            ["fk_customer", "sales_date", "quantity_hecto", "line_count"],
+            select(
+                dated_lines.c.fk_customer,
+                dated_lines.c.order_date,
+                func.coalesce(func.sum(dated_lines.c.quantity_hecto), 0),
+                func.count(),
+            ).group_by(dated_lines.c.fk_customer, dated_lines.c.order_date),
+        )
+    ).rowcount
+    return beer_rows, customer_rows
+
+
+def _date_filtered(query, model, start_date: Optional[date], end_date: Optional[date]):
+    if start_date:
+        query = query.where(model.sales_date >= start_date)
+    if end_date:
+        query = query.where(model.sales_date <= end_date)
+    return query
+
+
+def sales_by_bucket(
+    session: Session,
+    model,
+    key_name: str,
+    bucket: str,
+    key_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> list[dict]:
+    """Sum a rollup table into day/week/month/quarter/year buckets per key"""
+    if bucket not in SALES_BUCKETS:
+        raise ValueError(
+            f"Invalid bucket: {bucket}. Valid options: {list(SALES_BUCKETS)}"
+        )
+
+    key_column = getattr(model, key_name)
+    period = cast(func.date_trunc(bucket, model.sales_date), Date).label("period")
+    query = select(
+        period,
+        key_column,
+        func.sum(model.quantity_hecto),
+        func.sum(model.line_count),
+    )
+    if key_id is not None:
+        query = query.where(key_column == key_id)
+    query = _date_filtered(query, model, start_date, end_date)
+
+    rows = session.exec(
+        query.group_by(period, key_column)
+        .having(func.sum(model.line_count) > 0)
+        .order_by(period, key_column)
+    ).all()
+    return [
+        {
+            "period": str(period_start),
+            key_name: key,
+            "quantity_hecto": int(quantity),
+            "lines": int(lines),
+        }
+        for period_start, key, quantity, lines in rows
+    ]
+
+
+def top_sales(
+    session: Session,
+    model,
+    key_name: str,
+    limit: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> list[tuple[int, int, int]]:
+    """Return the top keys by hectolitres as (key, quantity_hecto, lines)"""
+    key_column = getattr(model, key_name)
+    total = func.sum(model.quantity_hecto).label("total")
+    query = select(key_column, total, func.sum(model.line_count))
+    query = _date_filtered(query, model, start_date, end_date)
+
+    rows = session.exec(
+        query.group_by(key_column)
+        .having(func.sum(model.line_count) > 0)
+        .order_by(total.desc(), key_column)
+        .limit(limit)
+    ).all()
+    return [(key, int(quantity), int(lines)) for key, quantity, lines in rows]
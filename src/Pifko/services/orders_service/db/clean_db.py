@@ -2,9 +2,26 @@
 """Data cleansing script for Orders Service - removes all data but keeps schema"""
 
 
-from .models import Customer, OrderInner, OrderInvoice, OrderInnerBeerAssociative
+from .models import (
+    Customer,
+    OrderInner,
+    OrderInvoice,
+    OrderInnerBeerAssociative,
+    BeerDailySales,
+    CustomerDailySales,
+    BeerDemandForecast,
+    IdempotencyKey,
+    OutboxEvent,
+    SagaRun,
+    SagaStep,
+    StageTimer,
+    CustomerPriority,
+    ProductionReadiness,
+)
 from dotenv import load_dotenv
-from sqlmodel import delete
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine, delete
 import os
 
 
@@ -28,6 +45,24 @@ def cleanse_data():
     with get_db_session() as session:
         # Delete in reverse order of dependencies to avoid foreign key constraints
 
+        # 0. Delete derived sales rollups
+        session.exec(delete(BeerDailySales))
+        session.exec(delete(CustomerDailySales))
+        session.exec(delete(BeerDemandForecast))
+        logger.info("Deleted sales rollups and forecasts", extra={"emoji": "🗑️"})
+        session.exec(delete(IdempotencyKey))
+        logger.info("Deleted idempotency keys", extra={"emoji": "🗑️"})
+        session.exec(delete(OutboxEvent))
+        logger.info("Deleted outbox events", extra={"emoji": "🗑️"})
+        session.exec(delete(SagaStep))
+        session.exec(delete(SagaRun))
+        logger.info("Deleted production sagas", extra={"emoji": "🗑️"})
+        session.exec(delete(StageTimer))
+        logger.info("Deleted stage timers", extra={"emoji": "🗑️"})
+        session.exec(delete(CustomerPriority))
+        session.exec(delete(ProductionReadiness))
+        logger.info("Deleted production queue inputs", extra={"emoji": "🗑️"})
+
         # 1. Delete beer order associations first
         beer_orders_deleted = session.exec(delete(OrderInnerBeerAssociative))
         logger.info(
@@ -91,5 +126,35 @@ def cleanse_data():
         )
 
 
+def truncate_data():
+    """Remove all data from orders database in one TRUNCATE, restarting ID sequences"""
+    load_dotenv()  # Load .env from host
+    engine = create_engine(os.getenv("DATABASE_URL_HOST_ORDERS"), poolclass=NullPool)
+    tables = ", ".join(
+        model.__tablename__
+        for model in (
+            Customer,
+            OrderInner,
+            OrderInvoice,
+            OrderInnerBeerAssociative,
+            BeerDailySales,
+            CustomerDailySales,
+            BeerDemandForecast,
+            IdempotencyKey,
+            OutboxEvent,
+            SagaRun,
+            SagaStep,
+            StageTimer,
+            CustomerPriority,
+            ProductionReadiness,
+        )
+    )
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+    finally:
+        engine.dispose()
+
+
 if __name__ == "__main__":
     cleanse_data()
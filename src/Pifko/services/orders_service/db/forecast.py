@@ -0,0 +1,183 @@
+"""Weekly beer demand forecasting with Holt's linear exponential smoothing.
+
+The smoothing state (level and trend) of every beer is cached in
+beer_demand_forecast. A refresh only folds in the weeks completed since the
+last refresh, read with one grouped query over the beer_daily_sales rollup,
+and steps all beers forward together one week at a time.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, cast, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from .models import BeerDailySales, BeerDemandForecast
+
+ALPHA = float(os.getenv("FORECAST_ALPHA", 0.5))  # level smoothing
+BETA = float(os.getenv("FORECAST_BETA", 0.2))  # trend smoothing
+
+
+def week_start(day: date) -> date:
+    """Monday of the week containing day (matches date_trunc('week'))"""
+    return day - timedelta(days=day.weekday())
+
+
+def last_complete_week(today: Optional[date] = None) -> date:
+    return week_start(today or date.today()) - timedelta(weeks=1)
+
+
+def forecast_watermark(session: Session) -> Optional[date]:
+    """Last week folded into the cached state, or None if the cache is empty"""
+    return session.exec(select(func.max(BeerDemandForecast.last_week))).one()
+
+
+def _weekly_sales(
+    session: Session, after_week: Optional[date], through_week: date
+) -> dict[date, dict[int, int]]:
+    """Hectolitres per beer per week in (after_week, through_week], one query"""
+    week = cast(func.date_trunc("week", BeerDailySales.sales_date), Date)
+    query = select(
+        week, BeerDailySales.fk_beer, func.sum(BeerDailySales.quantity_hecto)
+    )
+    if after_week is not None:
+        query = query.where(
+            BeerDailySales.sales_date >= after_week + timedelta(weeks=1)
+        )
+    query = query.where(BeerDailySales.sales_date < through_week + timedelta(weeks=1))
+
+    weeks: dict[date, dict[int, int]] = {}
+    for week_date, beer_id, quantity in session.exec(
+        query.group_by(week, BeerDailySales.fk_beer)
+    ):
+        weeks.setdefault(week_date, {})[beer_id] = int(quantity or 0)
+    return weeks
+
+
+def refresh_forecasts(
+    session: Session,
+    full: bool = False,
+    today: Optional[date] = None,
+    alpha: float = ALPHA,
+    beta: float = BETA,
+) -> tuple[int, int]:
+    """Fold completed weeks into the cached smoothing state.
+
+    Returns (weeks folded, beers updated). Orders dated into weeks that were
+    already folded are only picked up by a full rebuild.
+    """
+    through_week = last_complete_week(today)
+
+    if full:
+        session.exec(delete(BeerDemandForecast))
+        watermark = None
+    else:
+        watermark = forecast_watermark(session)
+        if watermark is not None and watermark >= through_week:
+            return 0, 0
+
+    sales = _weekly_sales(session, watermark, through_week)
+    if watermark is None:
+        if not sales:
+            return 0, 0
+        first_week = min(sales)
+    else:
+        first_week = watermark + timedelta(weeks=1)
+
+    states = session.exec(select(BeerDemandForecast)).all() if watermark else []
+    beer_ids = [s.fk_beer for s in states]
+    levels = [s.level for s in states]
+    trends = [s.trend for s in states]
+    observed = [s.weeks_observed for s in states]
+    position = {beer_id: i for i, beer_id in enumerate(beer_ids)}
+
+    weeks_folded = 0
+    week = first_week
+    while week <= through_week:
+        week_sales = sales.get(week, {})
+
+        # Beers seen for the first time start from their first week's demand
+        for beer_id, quantity in week_sales.items():
+            if beer_id not in position:
+                position[beer_id] = len(beer_ids)
+                beer_ids.append(beer_id)
+                levels.append(float(quantity))
+                trends.append(0.0)
+                observed.append(0)
+
+        y = [week_sales.get(beer_id, 0) for beer_id in beer_ids]
+        new_levels = [
+            alpha * obs + (1 - alpha) * (lvl + trd)
+            for obs, lvl, trd in zip(y, levels, trends)
+        ]
+        trends = [
+            beta * (new - old) + (1 - beta) * trd
+            for new, old, trd in zip(new_levels, levels, trends)
+        ]
+        levels = new_levels
+        observed = [n + 1 for n in observed]
+
+        weeks_folded += 1
+        week += timedelta(weeks=1)
+
+    if not beer_ids:
+        return weeks_folded, 0
+
+    now = datetime.now()
+    rows = [
+        {
+            "fk_beer": beer_id,
+            "level": lvl,
+            "trend": trd,
+            "last_week": through_week,
+            "weeks_observed": n,
+            "updated_at": now,
+        }
+        for beer_id, lvl, trd, n in zip(beer_ids, levels, trends, observed)
+    ]
+    stmt = pg_insert(BeerDemandForecast).values(rows)
+    session.exec(
+        stmt.on_conflict_do_update(
+            index_elements=["fk_beer"],
+            set_={
+                column: stmt.excluded[column]
+                for column in (
+                    "level",
+                    "trend",
+                    "last_week",
+                    "weeks_observed",
+                    "updated_at",
+                )
+            },
+        )
+    )
+    return weeks_folded, len(rows)
+
+
+def read_forecasts(
+    session: Session, weeks_ahead: int, beer_id: Optional[int] = None
+) -> list[dict]:
+    """Project cached states weeks_ahead weeks past the last folded week"""
+    query = select(BeerDemandForecast)
+    if beer_id is not None:
+        query = query.where(BeerDemandForecast.fk_beer == beer_id)
+
+    forecasts = []
+    for state in session.exec(query.order_by(BeerDemandForecast.fk_beer)):
+        forecasts.append(
+            {
+                "beer_id": state.fk_beer,
+                "weeks": [
+                    {
+                        "week": str(state.last_week + timedelta(weeks=h)),
+                        "quantity_hecto": round(
+                            max(0.0, state.level + h * state.trend), 2
+                        ),
+                    }
+                    for h in range(1, weeks_ahead + 1)
+                ],
+            }
+        )
+    return forecasts
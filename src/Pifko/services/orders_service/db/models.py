@@ -1,6 +1,7 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, text
 from typing import Optional, List
-from datetime import date
+from datetime import date, datetime
 from enum import Enum
 
 
@@ -13,6 +14,7 @@ class OrderStatus(str, Enum):
 
 
 class OrderStatusInner(str, Enum):
+    PENDING = "pending"
     READY_FOR_FERMENTING = "ready_for_fermenting"
     FERMENTING = "fermenting"
     DONE_FERMENTING = "done_fermenting"
@@ -48,6 +50,14 @@ class OrderInner(SQLModel, table=True):
 
 class OrderInvoice(SQLModel, table=True):
     __tablename__ = "order_invoice"
+    # Loads the production queue: confirmed invoices by deadline
+    __table_args__ = (
+        Index(
+            "ix_order_invoice_confirmed_ship_date",
+            "ship_date",
+            postgresql_where=text("status = 'CONFIRMED'"),
+        ),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     order_date: Optional[date]
     ship_date: Optional[date]
@@ -70,6 +80,126 @@ class OrderInnerBeerAssociative(SQLModel, table=True):
     order: OrderInner = Relationship(back_populates="beer_orders")
 
 
+# Sales rollups - derived from order lines, maintained incrementally
+class BeerDailySales(SQLModel, table=True):
+    __tablename__ = "beer_daily_sales"
+    fk_beer: int = Field(primary_key=True)  # Reference to Beer in Brewery DB
+    sales_date: date = Field(primary_key=True, index=True)
+    quantity_hecto: int = 0
+    line_count: int = 0
+
+
+class CustomerDailySales(SQLModel, table=True):
+    __tablename__ = "customer_daily_sales"
+    fk_customer: int = Field(primary_key=True)
+    sales_date: date = Field(primary_key=True, index=True)
+    quantity_hecto: int = 0
+    line_count: int = 0
+
+
+# Demand forecast cache - Holt smoothing state per beer over weekly sales
+class BeerDemandForecast(SQLModel, table=True):
+    __tablename__ = "beer_demand_forecast"
+    fk_beer: int = Field(primary_key=True)  # Reference to Beer in Brewery DB
+    level: float
+    trend: float
+    last_week: date = Field(index=True, description="Last week folded into the state")
+    weeks_observed: int = 0
+    updated_at: datetime
+
+
+# Idempotency keys for retried mutating tools
+class IdempotencyKey(SQLModel, table=True):
+    __tablename__ = "orders_idempotency_key"
+    key: str = Field(primary_key=True, max_length=128)
+    tool: str
+    request_hash: str = Field(max_length=32)
+    response: str
+    expires_at: datetime = Field(index=True)
+
+
+# Saga log - persisted progress of multi-service workflows
+class SagaStatus(str, Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    COMPENSATING = "compensating"
+    COMPENSATED = "compensated"
+    FAILED = "failed"  # compensation could not finish, needs manual attention
+
+
+class SagaStepStatus(str, Enum):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    COMPENSATED = "compensated"
+    COMPENSATION_FAILED = "compensation_failed"
+
+
+class SagaRun(SQLModel, table=True):
+    __tablename__ = "saga_run"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    saga_type: str
+    fk_invoice: int = Field(foreign_key="order_invoice.id", index=True)
+    status: SagaStatus = Field(index=True)
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    # Relationships
+    steps: List["SagaStep"] = Relationship(back_populates="saga")
+
+
+class SagaStep(SQLModel, table=True):
+    __tablename__ = "saga_step"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    fk_saga: int = Field(foreign_key="saga_run.id", index=True)
+    stage: int = Field(description="Steps of one stage run concurrently")
+    kind: str = Field(description="Selects the action and compensation to run")
+    payload: str = Field(description="JSON arguments, enough to redo or undo the step")
+    status: SagaStepStatus
+    result: Optional[str] = None
+    updated_at: datetime
+
+    # Relationships
+    saga: SagaRun = Relationship(back_populates="steps")
+
+
+# Pending automatic stage transitions (FERMENTING -> DONE_FERMENTING, AGING -> DONE_AGING)
+class StageTimer(SQLModel, table=True):
+    __tablename__ = "stage_timer"
+    fk_order_inner: int = Field(foreign_key="order_inner.id", primary_key=True)
+    from_status: OrderStatusInner
+    to_status: OrderStatusInner
+    due_at: datetime = Field(index=True)
+    created_at: datetime
+
+
+# Production queue inputs
+class CustomerPriority(SQLModel, table=True):
+    __tablename__ = "customer_priority"
+    fk_customer: int = Field(primary_key=True)
+    priority: int = Field(default=0, description="Higher is produced first")
+
+
+class ProductionReadiness(SQLModel, table=True):
+    __tablename__ = "production_readiness"
+    fk_invoice: int = Field(primary_key=True)
+    ready: bool = Field(description="Brewery local storage covers all ingredients")
+    checked_at: datetime
+
+
+# Transactional outbox feeding the change feed
+class OutboxEvent(SQLModel, table=True):
+    __tablename__ = "orders_outbox_event"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str = Field(index=True)
+    entity: str
+    entity_id: str
+    payload: str
+    created_at: datetime
+    published_at: Optional[datetime] = Field(default=None, index=True)
+
+
 # Pydantic models for API communication
 class BeerOrderRequest(SQLModel):
     beer_id: int
@@ -0,0 +1,35 @@
+"""Change feed of the orders service (see utils/change_feed.py)."""
+
+from utils.change_feed import ChangeFeed, Tracked
+
+from .connection import engine
+from .models import (
+    Customer,
+    OrderInner,
+    OrderInnerBeerAssociative,
+    OrderInvoice,
+    OutboxEvent,
+)
+
+
+def _status_changed(op: str, row, changes: dict) -> list[str]:
+    return ["status_changed"] if op == "updated" and "status" in changes else []
+
+
+change_feed = ChangeFeed(
+    "orders",
+    engine,
+    OutboxEvent,
+    {
+        Customer: Tracked("customer", ("customer_name",)),
+        OrderInvoice: Tracked(
+            "order_invoice",
+            ("fk_customer", "fk_order_inner", "order_date", "ship_date", "status"),
+            derive=_status_changed,
+        ),
+        OrderInner: Tracked("order_inner", ("status",), derive=_status_changed),
+        OrderInnerBeerAssociative: Tracked(
+            "order_line", ("fk_order", "fk_beer", "quantity_hecto")
+        ),
+    },
+)
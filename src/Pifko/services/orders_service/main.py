@@ -1,7 +1,10 @@
 import os
+import json
+import asyncio
 from fastmcp import FastMCP
 from typing import Optional, List
 from sqlmodel import Session, select
+from sqlalchemy.orm import joinedload
 from datetime import date
 from contextlib import asynccontextmanager
 
@@ -12,22 +15,87 @@ from db.models import (
     OrderInvoice,
     OrderInnerBeerAssociative,
     OrderStatus,
+    OrderStatusInner,
     BeerOrderRequest,
     CreateOrderRequest,
     OrderResponse,
+    BeerDailySales,
+    CustomerDailySales,
+    StageTimer,
 )
-from db.connection import get_session, create_db_and_tables
+from db.connection import engine, get_session, create_db_and_tables, query_stats
+from db.outbox import change_feed
+from utils.metrics import instrument
+from utils.profiler import add_profiler
+from utils.tracing import setup_tracing
+from utils.traffic import record_traffic
+from beer_catalog import beer_catalog, beer_line, follow_brewery_changes
+from utils.service_client import close_service_clients
+from db.aggregates import (
+    apply_line_rollup,
+    apply_order_rollup,
+    apply_quantity_delta,
+    find_quantity_drift,
+    rebuild_sales_rollups,
+    repair_quantity_drift,
+    sales_by_bucket,
+    top_sales,
+)
+from db.idempotency import (
+    commit_with_key,
+    purge_expired_keys_periodically,
+    replay,
+    request_fingerprint,
+)
+from db.forecast import (
+    forecast_watermark,
+    last_complete_week,
+    read_forecasts,
+    refresh_forecasts,
+)
+from cancellation import cancel_order
+from saga import describe_saga, recover_sagas_periodically, start_production
+from stage_timers import stage_scheduler
+from batching import TANK_CAPACITY_HECTO, open_lines, plan_batches
+from production_queue import (
+    check_readiness,
+    production_queue,
+    set_customer_priority as save_customer_priority,
+)
+from utils.resource_subscriptions import ResourceSubscriptions
 
 
 # Initialize FastMCP
 @asynccontextmanager
 async def lifespan(app):
     create_db_and_tables()
+    key_purger = asyncio.create_task(purge_expired_keys_periodically())
+    # Subscribers start before the relay so they see its first batch
+    stage_timers = asyncio.create_task(stage_scheduler.run())
+    queue_updates = asyncio.create_task(production_queue.run())
+    outbox_relay = asyncio.create_task(change_feed.run_relay())
+    resource_updates = asyncio.create_task(subscriptions.run())
+    saga_recovery = asyncio.create_task(recover_sagas_periodically())
+    beer_evictions = asyncio.create_task(
+        follow_brewery_changes(float(os.getenv("BEER_CHANGES_POLL_SECONDS", 5)))
+    )
     yield
+    key_purger.cancel()
+    outbox_relay.cancel()
+    stage_timers.cancel()
+    queue_updates.cancel()
+    resource_updates.cancel()
+    saga_recovery.cancel()
+    beer_evictions.cancel()
+    await close_service_clients()
 
 
 # Pass lifespan to FastMCP
 mcp = FastMCP("Orders MCP Server", lifespan=lifespan)
+metrics = instrument(mcp, "orders", engine)
+tracing_exporter = setup_tracing(mcp, "orders", engine)
+add_profiler(mcp)
+record_traffic(mcp, "orders")
 
 
 # Customer Tools
@@ -134,16 +202,14 @@ async def create_order_inner(status: str, quantity_sum: Optional[int] = None) ->
     """Create a new order inner"""
     session = next(get_session())
     try:
-        order_status = OrderStatus(status)
+        order_status = OrderStatusInner(status)
         order = OrderInner(status=order_status, quantity_sum=quantity_sum)
         session.add(order)
         session.commit()
         session.refresh(order)
         return f"Created order inner ID: {order.id} (status: {order.status.value})"
     except ValueError:
-        return (
-            f"Invalid status: {status}. Valid options: {[s.value for s in OrderStatus]}"
-        )
+        return f"Invalid status: {status}. Valid options: {[s.value for s in OrderStatusInner]}"
     finally:
         session.close()
 
@@ -163,11 +229,15 @@ async def update_order_inner(
 
         if status:
             try:
-                order.status = OrderStatus(status)
+                order.status = OrderStatusInner(status)
             except ValueError:
-                return f"Invalid status: {status}. Valid options: {[s.value for s in OrderStatus]}"
+                return f"Invalid status: {status}. Valid options: {[s.value for s in OrderStatusInner]}"
 
         if quantity_sum is not None:
+            # The sales rollups count the beer lines, so their total wins
+            line_total = sum(line.quantity_hecto or 0 for line in order.beer_orders)
+            if order.beer_orders and line_total != quantity_sum:
+                return f"quantity_sum of order inner {order_inner_id} follows its beer lines ({line_total} hl); change the lines instead"
             order.quantity_sum = quantity_sum
 
         session.add(order)
@@ -185,9 +255,17 @@ async def delete_order_inner(order_inner_id: int) -> str:
         order = session.get(OrderInner, order_inner_id)
         if not order:
             return f"Order Inner with ID {order_inner_id} not found"
-
+        if order.invoice:
+            return f"Order Inner {order_inner_id} has invoice {order.invoice.id}; delete the invoice first"
+
+        timer = session.get(StageTimer, order_inner_id)
+        if timer:
+            session.delete(timer)
+        for line in order.beer_orders:
+            session.delete(line)
         session.delete(order)
         session.commit()
+        stage_scheduler.cancel([order_inner_id])
         return f"Deleted order inner ID: {order_inner_id}"
     finally:
         session.close()
@@ -247,6 +325,8 @@ async def create_order_invoice(
 
         invoice = OrderInvoice(**invoice_data)
         session.add(invoice)
+        session.flush()
+        apply_order_rollup(session, order_inner_id, 1)
         session.commit()
         session.refresh(invoice)
         return f"Created order invoice ID: {invoice.id}"
@@ -271,6 +351,9 @@ async def update_order_invoice(
         if not invoice:
             return f"Order Invoice with ID {invoice_id} not found"
 
+        # Withdraw the order from the sales rollups under its current key
+        apply_order_rollup(session, invoice.fk_order_inner, -1)
+
         if customer_id:
             customer = session.get(Customer, customer_id)
             if not customer:
@@ -289,6 +372,8 @@ async def update_order_invoice(
             invoice.ship_date = date.fromisoformat(ship_date)
 
         session.add(invoice)
+        session.flush()
+        apply_order_rollup(session, invoice.fk_order_inner, 1)
         session.commit()
         return f"Updated order invoice ID: {invoice.id}"
     except ValueError as e:
@@ -306,6 +391,7 @@ async def delete_order_invoice(invoice_id: int) -> str:
         if not invoice:
             return f"Order Invoice with ID {invoice_id} not found"
 
+        apply_order_rollup(session, invoice.fk_order_inner, -1)
         session.delete(invoice)
         session.commit()
         return f"Deleted order invoice ID: {invoice_id}"
@@ -320,7 +406,8 @@ async def get_order_beer_associations() -> str:
     session = next(get_session())
     try:
         associations = session.exec(select(OrderInnerBeerAssociative)).all()
-        return f"Order-Beer Associations ({len(associations)}): {[{'order_id': a.fk_order, 'beer_id': a.fk_beer, 'quantity_hecto': a.quantity_hecto} for a in associations]}"
+        beers = await beer_catalog.get_many(a.fk_beer for a in associations)
+        return f"Order-Beer Associations ({len(associations)}): {[{'order_id': a.fk_order, **beer_line(a.fk_beer, a.quantity_hecto, beers)} for a in associations]}"
     finally:
         session.close()
 
@@ -341,6 +428,8 @@ async def add_beer_to_order(
             fk_order=order_inner_id, fk_beer=beer_id, quantity_hecto=quantity_hecto
         )
         session.add(association)
+        apply_quantity_delta(session, order_inner_id, quantity_hecto)
+        apply_line_rollup(session, order_inner_id, beer_id, quantity_hecto, 1)
         session.commit()
         return f"Added beer {beer_id} to order {order_inner_id} (quantity: {quantity_hecto} hl)"
     finally:
@@ -358,13 +447,17 @@ async def update_beer_in_order(
             select(OrderInnerBeerAssociative)
             .where(OrderInnerBeerAssociative.fk_order == order_inner_id)
             .where(OrderInnerBeerAssociative.fk_beer == beer_id)
+            .with_for_update()
         ).first()
 
         if not association:
             return f"Beer {beer_id} not found in order {order_inner_id}"
 
+        delta = quantity_hecto - (association.quantity_hecto or 0)
         association.quantity_hecto = quantity_hecto
         session.add(association)
+        apply_quantity_delta(session, order_inner_id, delta)
+        apply_line_rollup(session, order_inner_id, beer_id, delta)
         session.commit()
         return (
             f"Updated beer {beer_id} in order {order_inner_id} to {quantity_hecto} hl"
@@ -382,12 +475,16 @@ async def remove_beer_from_order(order_inner_id: int, beer_id: int) -> str:
             select(OrderInnerBeerAssociative)
             .where(OrderInnerBeerAssociative.fk_order == order_inner_id)
             .where(OrderInnerBeerAssociative.fk_beer == beer_id)
+            .with_for_update()
         ).first()
 
         if not association:
             return f"Beer {beer_id} not found in order {order_inner_id}"
 
         session.delete(association)
+        removed = association.quantity_hecto or 0
+        apply_quantity_delta(session, order_inner_id, -removed)
+        apply_line_rollup(session, order_inner_id, beer_id, -removed, -1)
         session.commit()
         return f"Removed beer {beer_id} from order {order_inner_id}"
     finally:
@@ -405,21 +502,100 @@ async def get_order_beers(order_inner_id: int) -> str:
             )
         ).all()
 
-        return f"Order {order_inner_id} beers ({len(associations)}): {[{'beer_id': a.fk_beer, 'quantity_hecto': a.quantity_hecto} for a in associations]}"
+        beers = await beer_catalog.get_many(a.fk_beer for a in associations)
+        return f"Order {order_inner_id} beers ({len(associations)}): {[beer_line(a.fk_beer, a.quantity_hecto, beers) for a in associations]}"
+    finally:
+        session.close()
+
+
+# Order Detail Tools
+async def _order_details(session: Session, invoice_ids: List[int]) -> list[dict]:
+    """Load invoices with customer, inner order and beer lines in two queries,
+    then name the beers with one batched brewery lookup"""
+    invoices = session.exec(
+        select(OrderInvoice)
+        .where(OrderInvoice.id.in_(invoice_ids))
+        .options(
+            joinedload(OrderInvoice.customer),
+            joinedload(OrderInvoice.order_inner).selectinload(OrderInner.beer_orders),
+        )
+        .order_by(OrderInvoice.id)
+    ).all()
+    beers = await beer_catalog.get_many(
+        a.fk_beer for i in invoices for a in i.order_inner.beer_orders
+    )
+
+    return [
+        {
+            "invoice_id": i.id,
+            "status": i.status.value if i.status else None,
+            "order_date": str(i.order_date),
+            "ship_date": str(i.ship_date),
+            "customer": {"id": i.customer.id, "name": i.customer.customer_name},
+            "order_inner": {
+                "id": i.order_inner.id,
+                "status": i.order_inner.status.value,
+                "quantity_sum": i.order_inner.quantity_sum,
+            },
+            "beers": [
+                beer_line(a.fk_beer, a.quantity_hecto, beers)
+                for a in i.order_inner.beer_orders
+            ],
+        }
+        for i in invoices
+    ]
+
+
+@mcp.tool()
+async def get_order_details(invoice_id: int) -> str:
+    """Get an order's invoice, customer, inner order and beer lines in one call"""
+    session = next(get_session())
+    try:
+        details = await _order_details(session, [invoice_id])
+        if not details:
+            return f"Order Invoice with ID {invoice_id} not found"
+
+        return f"Order {invoice_id}: {details[0]}"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def get_order_details_batch(invoice_ids: List[int]) -> str:
+    """Get invoice, customer, inner order and beer lines for many invoices in one call"""
+    session = next(get_session())
+    try:
+        details = await _order_details(session, invoice_ids)
+        missing = sorted(set(invoice_ids) - {d["invoice_id"] for d in details})
+        return f"Orders ({len(details)}): {details}, Not found: {missing}"
     finally:
         session.close()
 
 
 # Complex Operations
 @mcp.tool()
-async def create_complete_order(customer_id: int, beer_orders_json: str) -> str:
+async def create_complete_order(
+    customer_id: int, beer_orders_json: str, idempotency_key: Optional[str] = None
+) -> str:
     """Create a complete order with customer, order inner, invoice, and beer associations
     beer_orders_json should be a JSON string like: '[{"beer_id": 1, "quantity_hecto": 5}, {"beer_id": 2, "quantity_hecto": 3}]'
+    Pass an idempotency_key to make retries return the original order instead of creating a new one.
     """
     session = next(get_session())
     try:
         import json
 
+        fingerprint = request_fingerprint(
+            "create_complete_order",
+            customer_id=customer_id,
+            beer_orders_json=beer_orders_json,
+        )
+        replayed = replay(
+            session, idempotency_key, "create_complete_order", fingerprint
+        )
+        if replayed is not None:
+            return replayed
+
         beer_orders = json.loads(beer_orders_json)
 
         # Validate customer exists
@@ -430,23 +606,21 @@ async def create_complete_order(customer_id: int, beer_orders_json: str) -> str:
         # Calculate total quantity
         total_quantity = sum(order.get("quantity_hecto", 0) for order in beer_orders)
 
-        # Create order inner
+        # Create order inner (invoice and beer associations share its transaction)
         order_inner = OrderInner(
-            status=OrderStatus.PENDING, quantity_sum=total_quantity
+            status=OrderStatusInner.PENDING, quantity_sum=total_quantity
         )
         session.add(order_inner)
-        session.commit()
-        session.refresh(order_inner)
+        session.flush()
 
         # Create invoice
         invoice = OrderInvoice(
             fk_customer=customer_id,
             fk_order_inner=order_inner.id,
             order_date=date.today(),
+            status=OrderStatus.PENDING,
         )
         session.add(invoice)
-        session.commit()
-        session.refresh(invoice)
 
         # Add beer associations
         for beer_order in beer_orders:
@@ -457,8 +631,15 @@ async def create_complete_order(customer_id: int, beer_orders_json: str) -> str:
             )
             session.add(association)
 
-        session.commit()
-        return f"Created complete order: Invoice ID {invoice.id}, Order Inner ID {order_inner.id}, Total quantity: {total_quantity} hl"
+        session.flush()
+        apply_order_rollup(session, order_inner.id, 1)
+        return commit_with_key(
+            session,
+            idempotency_key,
+            "create_complete_order",
+            fingerprint,
+            f"Created complete order: Invoice ID {invoice.id}, Order Inner ID {order_inner.id}, Total quantity: {total_quantity} hl",
+        )
 
     except json.JSONDecodeError:
         return "Invalid JSON format for beer_orders_json"
@@ -468,6 +649,264 @@ async def create_complete_order(customer_id: int, beer_orders_json: str) -> str:
         session.close()
 
 
+@mcp.tool()
+async def verify_order_totals(repair: bool = True) -> str:
+    """Find orders whose quantity_sum drifted from their beer lines and optionally repair them in bulk"""
+    session = next(get_session())
+    try:
+        drifted = find_quantity_drift(session)
+        if not drifted or not repair:
+            return f"Orders with drifted totals ({len(drifted)}): {drifted}"
+
+        repaired = repair_quantity_drift(session)
+        session.commit()
+        return f"Repaired {repaired} order totals: {drifted}"
+    finally:
+        session.close()
+
+
+# Production Saga Tools
+@mcp.tool()
+async def start_order_production(invoice_id: int) -> str:
+    """Allocate missing ingredients from storage, move them to the brewery and put the order into production.
+    Every step is logged; if any step fails the completed ones are undone.
+    """
+    return await start_production(invoice_id)
+
+
+@mcp.tool()
+async def get_saga_status(saga_id: int) -> str:
+    """Get a production saga's status and the outcome of each of its steps"""
+    saga = describe_saga(saga_id)
+    if not saga:
+        return f"Saga with ID {saga_id} not found"
+    return f"Saga: {saga}"
+
+
+@mcp.tool()
+async def cancel_order_and_release(invoice_id: int) -> str:
+    """Cancel an order at any stage and release what it holds: ingredients moved to the brewery
+    go back to master storage in one batched restock (unless brewing has started), and its
+    stage timer and production queue slot are freed. Safe to retry.
+    """
+    return await cancel_order(invoice_id)
+
+
+# Production Stage Timer Tools
+@mcp.tool()
+async def get_stage_timers() -> str:
+    """Get pending automatic transitions (FERMENTING -> DONE_FERMENTING, AGING -> DONE_AGING) with their due times"""
+    session = next(get_session())
+    try:
+        timers = session.exec(select(StageTimer).order_by(StageTimer.due_at)).all()
+        return f"Stage timers ({len(timers)}): {[{'order_inner_id': t.fk_order_inner, 'from_status': t.from_status.value, 'to_status': t.to_status.value, 'due_at': str(t.due_at)} for t in timers]}"
+    finally:
+        session.close()
+
+
+# Production Queue Tools
+@mcp.tool()
+async def get_next_production_batch(limit: int = 5) -> str:
+    """Get the next confirmed orders to produce: earliest ship date first, then customer priority, then orders whose ingredients are already in brewery storage"""
+    batch = production_queue.next_batch(limit)
+    return f"Next production batch ({len(batch)} of {len(production_queue)} queued): {batch}"
+
+
+@mcp.tool()
+async def get_queue_position(invoice_id: int) -> str:
+    """Get a confirmed order's position in the production queue"""
+    entry = production_queue.position(invoice_id)
+    if not entry:
+        return f"Order {invoice_id} is not waiting for production (only confirmed orders are queued)"
+    return f"Order {invoice_id} is #{entry['position']} of {len(production_queue)}: {entry}"
+
+
+@mcp.tool()
+async def set_customer_priority(customer_id: int, priority: int) -> str:
+    """Set a customer's production priority (higher goes first among orders with the same ship date)"""
+    save_customer_priority(customer_id, priority)
+    return f"Customer {customer_id} priority set to {priority}"
+
+
+@mcp.tool()
+async def refresh_production_readiness() -> str:
+    """Re-check with the brewery which queued orders have all ingredients in local storage"""
+    readiness = await check_readiness(production_queue.invoice_ids())
+    ready = sorted(i for i, r in readiness.items() if r)
+    return f"Checked {len(readiness)} queued orders, ready: {ready}"
+
+
+# Production Batching Tools
+@mcp.tool()
+async def plan_production_batches(
+    window_days: int = 7, tank_capacity_hecto: int = TANK_CAPACITY_HECTO
+) -> str:
+    """Group open order lines of the same beer shipping within window_days of each other into shared tank-sized batches, each with one combined ingredient allocation.
+    Reports how many tanks and allocation calls this saves compared with brewing every line separately.
+    """
+    if tank_capacity_hecto <= 0:
+        return "tank_capacity_hecto must be positive"
+    session = next(get_session())
+    try:
+        lines = open_lines(session)
+    finally:
+        session.close()
+    if not lines:
+        return "No open order lines to batch"
+
+    plan = await plan_batches(lines, window_days, tank_capacity_hecto)
+    return f"Production batches: {plan}"
+
+
+# Sales Analytics Tools
+@mcp.tool()
+async def get_beer_sales(
+    bucket: str = "week",
+    beer_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> str:
+    """Get hectolitres ordered per beer per time bucket (day, week, month, quarter, year)"""
+    session = next(get_session())
+    try:
+        rows = sales_by_bucket(
+            session,
+            BeerDailySales,
+            "fk_beer",
+            bucket,
+            key_id=beer_id,
+            start_date=date.fromisoformat(start_date) if start_date else None,
+            end_date=date.fromisoformat(end_date) if end_date else None,
+        )
+        return f"Beer sales per {bucket} ({len(rows)}): {rows}"
+    except ValueError as e:
+        return f"Invalid parameters: {e}"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def get_customer_sales(
+    bucket: str = "month",
+    customer_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> str:
+    """Get hectolitres ordered per customer per time bucket (day, week, month, quarter, year)"""
+    session = next(get_session())
+    try:
+        rows = sales_by_bucket(
+            session,
+            CustomerDailySales,
+            "fk_customer",
+            bucket,
+            key_id=customer_id,
+            start_date=date.fromisoformat(start_date) if start_date else None,
+            end_date=date.fromisoformat(end_date) if end_date else None,
+        )
+        return f"Customer sales per {bucket} ({len(rows)}): {rows}"
+    except ValueError as e:
+        return f"Invalid parameters: {e}"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def get_top_beers(
+    start_date: Optional[str] = None, end_date: Optional[str] = None, limit: int = 10
+) -> str:
+    """Get the most ordered beers by hectolitres in a date range"""
+    session = next(get_session())
+    try:
+        rows = top_sales(
+            session,
+            BeerDailySales,
+            "fk_beer",
+            limit,
+            start_date=date.fromisoformat(start_date) if start_date else None,
+            end_date=date.fromisoformat(end_date) if end_date else None,
+        )
+        beers = await beer_catalog.get_many(b for b, _, _ in rows)
+        return f"Top beers ({len(rows)}): {[{**beer_line(b, q, beers), 'lines': n} for b, q, n in rows]}"
+    except ValueError as e:
+        return f"Date format error: {e}. Use YYYY-MM-DD format"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def get_top_customers(
+    start_date: Optional[str] = None, end_date: Optional[str] = None, limit: int = 10
+) -> str:
+    """Get the customers ordering the most hectolitres in a date range"""
+    session = next(get_session())
+    try:
+        rows = top_sales(
+            session,
+            CustomerDailySales,
+            "fk_customer",
+            limit,
+            start_date=date.fromisoformat(start_date) if start_date else None,
+            end_date=date.fromisoformat(end_date) if end_date else None,
+        )
+        names = dict(
+            session.exec(
+                select(Customer.id, Customer.customer_name).where(
+                    Customer.id.in_([c for c, _, _ in rows])
+                )
+            ).all()
+        )
+        return f"Top customers ({len(rows)}): {[{'customer_id': c, 'name': names.get(c), 'quantity_hecto': q, 'lines': n} for c, q, n in rows]}"
+    except ValueError as e:
+        return f"Date format error: {e}. Use YYYY-MM-DD format"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def rebuild_sales_analytics() -> str:
+    """Recompute the sales rollup tables from all order lines"""
+    session = next(get_session())
+    try:
+        beer_rows, customer_rows = rebuild_sales_rollups(session)
+        session.commit()
+        return f"Rebuilt sales rollups: {beer_rows} beer-day rows, {customer_rows} customer-day rows"
+    finally:
+        session.close()
+
+
+# Demand Forecasting Tools
+@mcp.tool()
+async def forecast_beer_demand(
+    weeks_ahead: int = 4, beer_id: Optional[int] = None
+) -> str:
+    """Forecast weekly hectolitre demand per beer from order history"""
+    session = next(get_session())
+    try:
+        # Fold in any weeks completed since the last refresh before reading
+        watermark = forecast_watermark(session)
+        if watermark is None or watermark < last_complete_week():
+            refresh_forecasts(session)
+            session.commit()
+
+        forecasts = read_forecasts(session, weeks_ahead, beer_id)
+        return f"Beer demand forecast for {weeks_ahead} weeks ({len(forecasts)} beers): {forecasts}"
+    finally:
+        session.close()
+
+
+@mcp.tool()
+async def refresh_demand_forecast(full: bool = False) -> str:
+    """Refresh cached demand forecasts; full=True rebuilds them from all history"""
+    session = next(get_session())
+    try:
+        weeks, beers = refresh_forecasts(session, full=full)
+        session.commit()
+        return f"Refreshed demand forecast: {weeks} weeks folded for {beers} beers"
+    finally:
+        session.close()
+
+
 @mcp.tool()
 async def get_customer_invoices(customer_id: int) -> str:
     """Get all invoices for a specific customer"""
@@ -487,19 +926,122 @@ async def search_orders_by_status(status: str) -> str:
     """Search order inners by status"""
     session = next(get_session())
     try:
-        order_status = OrderStatus(status)
+        order_status = OrderStatusInner(status)
         orders = session.exec(
             select(OrderInner).where(OrderInner.status == order_status)
         ).all()
         return f"Orders with status '{status}' ({len(orders)}): {[{'id': o.id, 'quantity_sum': o.quantity_sum} for o in orders]}"
     except ValueError:
-        return (
-            f"Invalid status: {status}. Valid options: {[s.value for s in OrderStatus]}"
-        )
+        return f"Invalid status: {status}. Valid options: {[s.value for s in OrderStatusInner]}"
     finally:
         session.close()
 
 
+# Query Stats Tools
+@mcp.tool()
+async def get_top_queries(
+    limit: int = 10, order_by: str = "total", reset: bool = False
+) -> str:
+    """Get the SQL statements (normalised to fingerprints) that cost the most since startup.
+    order_by: total, mean, max or calls. reset=True clears the statistics after reading them.
+    """
+    if order_by not in ("total", "mean", "max", "calls"):
+        return f"Invalid order_by: {order_by}. Use: total, mean, max or calls"
+    queries = query_stats.top(limit, order_by)
+    if reset:
+        query_stats.reset()
+    return f"Top queries by {order_by} ({len(queries)}): {queries}"
+
+
+# Change Feed Tools
+@mcp.tool()
+async def get_changes(
+    after_id: int = 0,
+    topic: Optional[str] = None,
+    limit: int = 100,
+    as_json: bool = False,
+) -> str:
+    """Get change events after a known event ID, oldest first.
+    topic may use * wildcards, e.g. "order_invoice.status_changed". Live events are also published via LISTEN on the "orders_changes" channel.
+    as_json returns {"last_id": newest event ID, "changes": [...]} as JSON, for services following the feed.
+    """
+    session = next(get_session())
+    try:
+        changes = change_feed.read_events(session, after_id, topic, limit)
+        if as_json:
+            last_id = change_feed.last_event_id(session)
+            return json.dumps({"last_id": last_id, "changes": changes})
+        return f"Changes ({len(changes)}): {changes}"
+    finally:
+        session.close()
+
+
+# Resources (subscribe to get notifications/resources/updated on change)
+@mcp.resource("orders://invoice/{invoice_id}", mime_type="application/json")
+async def invoice_resource(invoice_id: int) -> str:
+    """Order invoice with its customer, inner order status and beer lines"""
+    session = next(get_session())
+    try:
+        details = await _order_details(session, [int(invoice_id)])
+        return json.dumps(details[0] if details else None)
+    finally:
+        session.close()
+
+
+@mcp.resource("orders://invoices/status/{status}", mime_type="application/json")
+async def invoices_by_status_resource(status: str) -> str:
+    """IDs of the invoices currently in a status"""
+    session = next(get_session())
+    try:
+        invoice_ids = session.exec(
+            select(OrderInvoice.id)
+            .where(OrderInvoice.status == OrderStatus(status))
+            .order_by(OrderInvoice.id)
+        ).all()
+        return json.dumps({"status": status, "invoice_ids": invoice_ids})
+    finally:
+        session.close()
+
+
+def _changed_resources(changes: list[dict]) -> set[str]:
+    """Resource URIs affected by a batch of change events"""
+    invoice_ids, inner_ids, customer_ids, statuses = set(), set(), set(), set()
+    for change in changes:
+        entity, entity_id = change["entity"], change["entity_id"]
+        if entity == "order_invoice":
+            invoice_ids.add(int(entity_id))
+            payload = change["payload"] or {}
+            statuses.add((payload.get("row") or {}).get("status"))
+            statuses.update(payload.get("changes", {}).get("status", ()))
+        elif entity == "order_inner":
+            inner_ids.add(int(entity_id))
+        elif entity == "order_line":
+            inner_ids.add(int(entity_id.split(":")[0]))
+        elif entity == "customer":
+            customer_ids.add(int(entity_id))
+
+    if inner_ids or customer_ids:
+        session = next(get_session())
+        try:
+            invoice_ids.update(
+                session.exec(
+                    select(OrderInvoice.id).where(
+                        OrderInvoice.fk_order_inner.in_(inner_ids)
+                        | OrderInvoice.fk_customer.in_(customer_ids)
+                    )
+                ).all()
+            )
+        finally:
+            session.close()
+
+    return {f"orders://invoice/{i}" for i in invoice_ids} | {
+        f"orders://invoices/status/{s}" for s in statuses if s
+    }
+
+
+subscriptions = ResourceSubscriptions(mcp, change_feed, _changed_resources)
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8001))
     mcp.run(transport="streamable-http", host="0.0.0.0", port=port)
@@ -0,0 +1,375 @@
+"""Earliest-deadline-first queue of confirmed orders waiting for production.
+
+Confirmed invoices are ordered by
+
+    (ship_date, -customer priority, not ingredient-ready, invoice id)
+
+so the nearest deadline comes first, and ties go to higher-priority
+customers, then to orders whose ingredients are already in brewery local
+storage. Invoices without a ship date go last.
+
+The queue is an order-statistic treap: insert, remove and the position of an
+invoice are O(log n), and the next k entries cost O(k + log n). The queue is
+loaded once from the partial index on confirmed invoices. After that it is
+updated incrementally from order_invoice change events, priority changes
+and readiness checks.
+"""
+
+import asyncio
+import json
+import random
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import select
+
+from db.connection import get_db_session
+from db.models import (
+    CustomerPriority,
+    OrderInnerBeerAssociative,
+    OrderInvoice,
+    OrderStatus,
+    ProductionReadiness,
+)
+from db.outbox import change_feed
+from utils.logger import get_logger
+from utils.service_client import get_service_client
+
+logger = get_logger("production_queue")
+
+
+class _Node:
+    __slots__ = ("key", "weight", "left", "right", "size")
+
+    def __init__(self, key, weight: float):
+        self.key = key
+        self.weight = weight
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+        self.size = 1
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node else 0
+
+
+def _update(node: _Node) -> _Node:
+    node.size = 1 + _size(node.left) + _size(node.right)
+    return node
+
+
+class OrderStatisticTreap:
+    """Sorted set of unique keys with O(log n) expected insert, remove and rank"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self._root: Optional[_Node] = None
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def _split(self, node: Optional[_Node], key) -> tuple:
+        """Split into keys < key and keys >= key"""
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = self._split(node.right, key)
+            return _update(node), right
+        left, node.left = self._split(node.left, key)
+        return left, _update(node)
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]):
+        if left is None or right is None:
+            return left or right
+        if left.weight > right.weight:
+            left.right = self._merge(left.right, right)
+            return _update(left)
+        right.left = self._merge(left, right.left)
+        return _update(right)
+
+    def insert(self, key) -> None:
+        left, right = self._split(self._root, key)
+        node = _Node(key, self._random.random())
+        self._root = self._merge(self._merge(left, node), right)
+
+    def remove(self, key) -> None:
+        self._root = self._remove(self._root, key)
+
+    def _remove(self, node: Optional[_Node], key):
+        if node is None:
+            return None
+        if key == node.key:
+            return self._merge(node.left, node.right)
+        if key < node.key:
+            node.left = self._remove(node.left, key)
+        else:
+            node.right = self._remove(node.right, key)
+        return _update(node)
+
+    def rank(self, key) -> int:
+        """Number of keys smaller than key"""
+        rank, node = 0, self._root
+        while node is not None:
+            if node.key < key:
+                rank += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return rank
+
+    def smallest(self, k: int) -> list:
+        """The k smallest keys in order"""
+        keys, stack, node = [], [], self._root
+        while (stack or node) and len(keys) < k:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            keys.append(node.key)
+            node = node.right
+        return keys
+
+
+class ProductionQueue:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self) -> None:
+        self._tree = OrderStatisticTreap()
+        self._keys: dict[int, tuple] = {}
+        self._invoices: dict[int, dict] = {}
+        self._priority: dict[int, int] = {}
+        self._ready: dict[int, bool] = {}
+        self._by_customer: dict[int, set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+    def _key(self, invoice_id: int) -> tuple:
+        invoice = self._invoices[invoice_id]
+        return (
+            invoice["ship_date"] or date.max,
+            -self._priority.get(invoice["customer_id"], 0),
+            not self._ready.get(invoice_id, False),
+            invoice_id,
+        )
+
+    def _place(self, invoice_id: int) -> None:
+        old_key = self._keys.get(invoice_id)
+        new_key = self._key(invoice_id)
+        if old_key == new_key:
+            return
+        if old_key is not None:
+            self._tree.remove(old_key)
+        self._tree.insert(new_key)
+        self._keys[invoice_id] = new_key
+
+    # Incremental updates
+    def upsert(self, invoice_id: int, customer_id: int, ship_date: Optional[date]):
+        previous = self._invoices.get(invoice_id)
+        if previous and previous["customer_id"] != customer_id:
+            self._by_customer[previous["customer_id"]].discard(invoice_id)
+        self._invoices[invoice_id] = {
+            "customer_id": customer_id,
+            "ship_date": ship_date,
+        }
+        self._by_customer.setdefault(customer_id, set()).add(invoice_id)
+        self._place(invoice_id)
+
+    def remove(self, invoice_id: int) -> None:
+        key = self._keys.pop(invoice_id, None)
+        if key is None:
+            return
+        self._tree.remove(key)
+        invoice = self._invoices.pop(invoice_id)
+        self._by_customer[invoice["customer_id"]].discard(invoice_id)
+        self._ready.pop(invoice_id, None)
+
+    def set_priority(self, customer_id: int, priority: int) -> None:
+        self._priority[customer_id] = priority
+        for invoice_id in self._by_customer.get(customer_id, ()):
+            self._place(invoice_id)
+
+    def set_ready(self, invoice_id: int, ready: bool) -> None:
+        if invoice_id in self._invoices:
+            self._ready[invoice_id] = ready
+            self._place(invoice_id)
+
+    def has_readiness(self, invoice_id: int) -> bool:
+        return invoice_id in self._ready
+
+    # Queries
+    def _describe(self, key: tuple, position: int) -> dict:
+        invoice_id = key[-1]
+        invoice = self._invoices[invoice_id]
+        return {
+            "position": position,
+            "invoice_id": invoice_id,
+            "ship_date": str(invoice["ship_date"]),
+            "customer_id": invoice["customer_id"],
+            "customer_priority": self._priority.get(invoice["customer_id"], 0),
+            "ingredients_ready": self._ready.get(invoice_id),
+        }
+
+    def next_batch(self, limit: int) -> list[dict]:
+        return [
+            self._describe(key, position)
+            for position, key in enumerate(self._tree.smallest(limit), start=1)
+        ]
+
+    def position(self, invoice_id: int) -> Optional[dict]:
+        key = self._keys.get(invoice_id)
+        if key is None:
+            return None
+        return self._describe(key, self._tree.rank(key) + 1)
+
+    def invoice_ids(self) -> list[int]:
+        return list(self._invoices)
+
+    # Loading and following changes
+    def load(self) -> int:
+        """Fill the queue from confirmed invoices (partial index on ship_date)"""
+        with get_db_session() as session:
+            invoices = session.exec(
+                select(
+                    OrderInvoice.id, OrderInvoice.fk_customer, OrderInvoice.ship_date
+                )
+                .where(OrderInvoice.status == OrderStatus.CONFIRMED)
+                .order_by(OrderInvoice.ship_date)
+            ).all()
+            priorities = session.exec(
+                select(CustomerPriority.fk_customer, CustomerPriority.priority)
+            ).all()
+            readiness = session.exec(
+                select(ProductionReadiness.fk_invoice, ProductionReadiness.ready)
+            ).all()
+
+        self._reset()
+        self._priority = dict(priorities)
+        confirmed = {invoice_id for invoice_id, _, _ in invoices}
+        self._ready = {i: ready for i, ready in readiness if i in confirmed}
+        for invoice_id, customer_id, ship_date in invoices:
+            self.upsert(invoice_id, customer_id, ship_date)
+        return len(invoices)
+
+    def on_changes(self, changes: list[dict]) -> list[int]:
+        """Apply order_invoice events; returns invoices that just entered the queue"""
+        entered = []
+        for change in changes:
+            if change["entity"] != "order_invoice" or not change["payload"]:
+                continue
+            invoice_id = int(change["entity_id"])
+            row = change["payload"]["row"]
+            if (
+                change["topic"] != "order_invoice.deleted"
+                and row["status"] == OrderStatus.CONFIRMED.value
+            ):
+                if invoice_id not in self._invoices:
+                    entered.append(invoice_id)
+                ship_date = row["ship_date"]
+                self.upsert(
+                    invoice_id,
+                    row["fk_customer"],
+                    date.fromisoformat(ship_date) if ship_date else None,
+                )
+            else:
+                self.remove(invoice_id)
+        return entered
+
+    async def run(self) -> None:
+        """Load the queue and keep it in sync; run as a lifespan task"""
+        with change_feed.subscribe("order_invoice.*") as changes:
+            self.load()
+            unchecked = [i for i in self._invoices if not self.has_readiness(i)]
+            if unchecked:
+                await _check_readiness_logged(unchecked)
+            while True:
+                batch = [await changes.get()]
+                while not changes.queue.empty():
+                    batch.append(changes.queue.get_nowait())
+                entered = self.on_changes(batch)
+                if entered:
+                    await _check_readiness_logged(entered)
+
+
+production_queue = ProductionQueue()
+
+
+def set_customer_priority(customer_id: int, priority: int) -> None:
+    stmt = pg_insert(CustomerPriority).values(
+        fk_customer=customer_id, priority=priority
+    )
+    with get_db_session() as session:
+        session.exec(
+            stmt.on_conflict_do_update(
+                index_elements=["fk_customer"], set_={"priority": priority}
+            )
+        )
+    production_queue.set_priority(customer_id, priority)
+
+
+async def check_readiness(invoice_ids: Iterable[int]) -> dict[int, bool]:
+    """Ask the brewery whether local storage covers each invoice, concurrently"""
+    invoice_ids = list(invoice_ids)
+    if not invoice_ids:
+        return {}
+    with get_db_session() as session:
+        lines = session.exec(
+            select(
+                OrderInvoice.id,
+                OrderInnerBeerAssociative.fk_beer,
+                OrderInnerBeerAssociative.quantity_hecto,
+            )
+            .join(
+                OrderInnerBeerAssociative,
+                OrderInnerBeerAssociative.fk_order == OrderInvoice.fk_order_inner,
+            )
+            .where(OrderInvoice.id.in_(invoice_ids))
+        ).all()
+    beer_orders: dict[int, list] = {invoice_id: [] for invoice_id in invoice_ids}
+    for invoice_id, beer_id, quantity in lines:
+        beer_orders[invoice_id].append(
+            {"beer_id": beer_id, "quantity_hecto": quantity or 0}
+        )
+
+    brewery = get_service_client("brewery")
+    results = await asyncio.gather(
+        *(
+            brewery.call_json(
+                "get_ingredient_requirements",
+                {"beer_orders_json": json.dumps(orders)},
+            )
+            for orders in beer_orders.values()
+        )
+    )
+    readiness = {
+        invoice_id: bool(result["feasible_locally"])
+        for invoice_id, result in zip(beer_orders, results)
+    }
+
+    now = datetime.now()
+    stmt = pg_insert(ProductionReadiness).values(
+        [
+            {"fk_invoice": invoice_id, "ready": ready, "checked_at": now}
+            for invoice_id, ready in readiness.items()
+        ]
+    )
+    with get_db_session() as session:
+        session.exec(
+            stmt.on_conflict_do_update(
+                index_elements=["fk_invoice"],
+                set_={"ready": stmt.excluded.ready, "checked_at": now},
+            )
+        )
+    for invoice_id, ready in readiness.items():
+        production_queue.set_ready(invoice_id, ready)
+    return readiness
+
+
+async def _check_readiness_logged(invoice_ids: list[int]) -> None:
+    try:
+        await check_readiness(invoice_ids)
+    except Exception as e:
+        # Unchecked orders rank as not ready until the next refresh
+        logger.warning(f"Ingredient readiness check failed: {e}")
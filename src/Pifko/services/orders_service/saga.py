@@ -0,0 +1,455 @@
+"""Saga coordinator taking an order into production across the three services.
+
+start_production runs these stages in order:
+
+    0. requirements  - brewery: ingredients needed vs. local stock (read-only)
+    1. allocate      - storage: allocate every shortfall, all concurrently
+    2. transfer      - brewery: add the allocated stock to local storage
+       set_status    - orders: invoice IN_PRODUCTION, inner READY_FOR_PRODUCTION
+                       (runs concurrently with transfer)
+
+Every step is written to saga_step before it runs and updated after, and each
+remote call carries an idempotency key derived from the step ID. If a stage
+fails, or the process dies mid-saga, compensation walks back through the
+stages in reverse. A step left pending by a crash is first re-issued with its
+key, which either replays the original result or performs it. It is then
+undone like any other completed step.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlmodel import select
+
+from db.connection import get_db_session
+from db.models import (
+    OrderInner,
+    OrderInnerBeerAssociative,
+    OrderInvoice,
+    OrderStatus,
+    OrderStatusInner,
+    SagaRun,
+    SagaStatus,
+    SagaStep,
+    SagaStepStatus,
+)
+from utils.logger import get_logger
+from utils.service_client import ServiceCallError, get_service_client
+
+logger = get_logger("saga")
+
+PRODUCTION_SAGA = "order_to_production"
+RECOVERY_INTERVAL_SECONDS = int(os.getenv("SAGA_RECOVERY_INTERVAL_SECONDS", 60))
+STALE_AFTER = timedelta(seconds=int(os.getenv("SAGA_STALE_SECONDS", 300)))
+
+# Sagas driven by this process right now; recovery leaves them alone
+_active_sagas: set[int] = set()
+
+
+class SagaStepFailed(Exception):
+    """A step ran and reported a business failure (it did not apply)"""
+
+
+# Step actions and compensations
+async def _check_requirements(step_id: int, payload: dict) -> str:
+    return await get_service_client("brewery").call(
+        "get_ingredient_requirements",
+        {"beer_orders_json": json.dumps(payload["beer_orders"])},
+    )
+
+
+async def _allocate(step_id: int, payload: dict) -> str:
+    result = await get_service_client("storage").call(
+        "allocate_stock",
+        {
+            "ingredient_type": payload["ingredient_type"],
+            "ingredient_id": payload["ingredient_id"],
+            "quantity_requested": payload["quantity"],
+            "requesting_facility": "brewery",
+            "idempotency_key": f"saga-step-{step_id}",
+        },
+    )
+    if not result.startswith("Allocated"):
+        raise SagaStepFailed(result)
+    return result
+
+
+async def _release_allocation(step_id: int, payload: dict) -> str:
+    result = await get_service_client("storage").call(
+        "restock_ingredient",
+        {
+            "ingredient_type": payload["ingredient_type"],
+            "ingredient_id": payload["ingredient_id"],
+            "quantity_to_add": payload["quantity"],
+            "idempotency_key": f"saga-step-{step_id}-undo",
+        },
+    )
+    if not result.startswith("Restocked"):
+        raise SagaStepFailed(result)
+    return result
+
+
+async def _adjust_local_storage(step_id: int, payload: dict, sign: int) -> str:
+    adjustments = [
+        {
+            "ingredient_type": item["ingredient_type"],
+            "ingredient_id": item["ingredient_id"],
+            "delta": sign * item["quantity"],
+        }
+        for item in payload["items"]
+    ]
+    result = await get_service_client("brewery").call(
+        "adjust_local_storage_batch",
+        {
+            "adjustments_json": json.dumps(adjustments),
+            "idempotency_key": f"saga-step-{step_id}" + ("" if sign > 0 else "-undo"),
+            "reason": "allocation" if sign > 0 else "release",
+        },
+    )
+    if not result.startswith("Adjusted"):
+        raise SagaStepFailed(result)
+    return result
+
+
+async def _transfer(step_id: int, payload: dict) -> str:
+    return await _adjust_local_storage(step_id, payload, 1)
+
+
+async def _return_transfer(step_id: int, payload: dict) -> str:
+    return await _adjust_local_storage(step_id, payload, -1)
+
+
+def _write_statuses(invoice_id: int, status: str, inner_status: str) -> str:
+    with get_db_session() as session:
+        invoice = session.get(OrderInvoice, invoice_id)
+        invoice.status = OrderStatus(status)
+        invoice.order_inner.status = OrderStatusInner(inner_status)
+        session.add(invoice)
+    return f"Order {invoice_id} set to {status}/{inner_status}"
+
+
+async def _set_status(step_id: int, payload: dict) -> str:
+    return _write_statuses(
+        payload["invoice_id"], payload["status"], payload["inner_status"]
+    )
+
+
+async def _revert_status(step_id: int, payload: dict) -> str:
+    return _write_statuses(
+        payload["invoice_id"],
+        payload["previous_status"],
+        payload["previous_inner_status"],
+    )
+
+
+# kind -> (action, compensation); None means there is nothing to undo
+STEP_KINDS = {
+    "requirements": (_check_requirements, None),
+    "allocate": (_allocate, _release_allocation),
+    "transfer": (_transfer, _return_transfer),
+    "set_status": (_set_status, _revert_status),
+}
+
+
+# Saga log
+def _set_saga_status(
+    saga_id: int, status: SagaStatus, error: Optional[str] = None
+) -> None:
+    with get_db_session() as session:
+        saga = session.get(SagaRun, saga_id)
+        saga.status = status
+        saga.error = error
+        saga.updated_at = datetime.now()
+        session.add(saga)
+
+
+def _record_stage(saga_id: int, stage: int, steps: list[tuple[str, dict]]) -> list:
+    """Persist a stage's steps as pending before any of them runs"""
+    now = datetime.now()
+    with get_db_session() as session:
+        rows = [
+            SagaStep(
+                fk_saga=saga_id,
+                stage=stage,
+                kind=kind,
+                payload=json.dumps(payload),
+                status=SagaStepStatus.PENDING,
+                updated_at=now,
+            )
+            for kind, payload in steps
+        ]
+        session.add_all(rows)
+        session.flush()
+        return [(row.id, kind, payload) for row, (kind, payload) in zip(rows, steps)]
+
+
+def _finish_step(step_id: int, status: SagaStepStatus, result: str) -> None:
+    with get_db_session() as session:
+        step = session.get(SagaStep, step_id)
+        step.status = status
+        step.result = result
+        step.updated_at = datetime.now()
+        session.add(step)
+
+
+async def _run_step(step_id: int, kind: str, payload: dict) -> str:
+    action, _ = STEP_KINDS[kind]
+    try:
+        result = await action(step_id, payload)
+    except SagaStepFailed as e:
+        _finish_step(step_id, SagaStepStatus.FAILED, str(e))
+        raise
+    # Unreachable peers leave the step pending: its outcome is unknown
+    _finish_step(step_id, SagaStepStatus.DONE, result)
+    return result
+
+
+async def _run_stage(saga_id: int, stage: int, steps: list[tuple[str, dict]]) -> list:
+    """Run a stage's independent steps concurrently; raise if any failed"""
+    recorded = _record_stage(saga_id, stage, steps)
+    results = await asyncio.gather(
+        *(_run_step(step_id, kind, payload) for step_id, kind, payload in recorded),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise SagaStepFailed("; ".join(str(e) for e in errors))
+    return results
+
+
+# Compensation and recovery
+async def _undo_step(step: SagaStep) -> bool:
+    """Undo one step; returns False if it must be retried later"""
+    action, compensation = STEP_KINDS[step.kind]
+    payload = json.loads(step.payload)
+
+    if step.status == SagaStepStatus.PENDING:
+        if compensation is None:
+            _finish_step(step.id, SagaStepStatus.COMPENSATED, "Not applied")
+            return True
+        # Outcome unknown after a crash: roll forward with the same key first
+        try:
+            await action(step.id, payload)
+        except SagaStepFailed as e:
+            _finish_step(step.id, SagaStepStatus.FAILED, str(e))
+            return True
+        except ServiceCallError:
+            return False
+
+    if compensation is None:
+        _finish_step(step.id, SagaStepStatus.COMPENSATED, step.result or "")
+        return True
+    try:
+        result = await compensation(step.id, payload)
+    except SagaStepFailed as e:
+        _finish_step(step.id, SagaStepStatus.COMPENSATION_FAILED, str(e))
+        return True
+    except ServiceCallError:
+        return False
+    _finish_step(step.id, SagaStepStatus.COMPENSATED, result)
+    return True
+
+
+async def compensate(saga_id: int) -> SagaStatus:
+    """Undo a saga's steps stage by stage in reverse, each stage concurrently"""
+    _set_saga_status(saga_id, SagaStatus.COMPENSATING)
+    with get_db_session() as session:
+        steps = session.exec(
+            select(SagaStep)
+            .where(SagaStep.fk_saga == saga_id)
+            .where(SagaStep.status.in_([SagaStepStatus.PENDING, SagaStepStatus.DONE]))
+            .order_by(SagaStep.stage.desc())
+        ).all()
+        session.expunge_all()
+
+    for stage in sorted({s.stage for s in steps}, reverse=True):
+        stage_steps = [s for s in steps if s.stage == stage]
+        finished = await asyncio.gather(*(_undo_step(s) for s in stage_steps))
+        if not all(finished):
+            # A peer is unreachable; the recovery loop picks this saga up again
+            return SagaStatus.COMPENSATING
+
+    with get_db_session() as session:
+        failed = session.exec(
+            select(SagaStep)
+            .where(SagaStep.fk_saga == saga_id)
+            .where(SagaStep.status == SagaStepStatus.COMPENSATION_FAILED)
+        ).first()
+    status = SagaStatus.FAILED if failed else SagaStatus.COMPENSATED
+    _set_saga_status(saga_id, status)
+    return status
+
+
+async def recover_sagas(stale_after: timedelta = STALE_AFTER) -> int:
+    """Compensate sagas left running by a crash or still mid-compensation"""
+    stale_before = datetime.now() - stale_after
+    with get_db_session() as session:
+        saga_ids = session.exec(
+            select(SagaRun.id).where(
+                (SagaRun.status == SagaStatus.COMPENSATING)
+                | (
+                    (SagaRun.status == SagaStatus.RUNNING)
+                    & (SagaRun.updated_at < stale_before)
+                )
+            )
+        ).all()
+
+    recovered = 0
+    for saga_id in saga_ids:
+        if saga_id in _active_sagas:
+            continue
+        _active_sagas.add(saga_id)
+        try:
+            status = await compensate(saga_id)
+            logger.info(f"Recovered saga {saga_id}: {status.value}")
+            recovered += 1
+        finally:
+            _active_sagas.discard(saga_id)
+    return recovered
+
+
+async def recover_sagas_periodically() -> None:
+    # Anything RUNNING at startup belongs to a previous process
+    stale_after = timedelta(0)
+    while True:
+        try:
+            await recover_sagas(stale_after)
+        except Exception as e:
+            logger.warning(f"Saga recovery failed: {e}")
+        stale_after = STALE_AFTER
+        await asyncio.sleep(RECOVERY_INTERVAL_SECONDS)
+
+
+# Order -> production saga
+def _begin_production_saga(invoice_id: int):
+    """Validate the order and open its saga; returns (saga_id, lines, statuses) or an error"""
+    with get_db_session() as session:
+        invoice = session.exec(
+            select(OrderInvoice).where(OrderInvoice.id == invoice_id).with_for_update()
+        ).first()
+        if not invoice:
+            return f"Order Invoice with ID {invoice_id} not found"
+        if invoice.status not in (OrderStatus.PENDING, OrderStatus.CONFIRMED):
+            return f"Order {invoice_id} is {invoice.status.value}; only pending or confirmed orders can start production"
+
+        open_saga = session.exec(
+            select(SagaRun.id)
+            .where(SagaRun.fk_invoice == invoice_id)
+            .where(SagaRun.status.in_([SagaStatus.RUNNING, SagaStatus.COMPENSATING]))
+        ).first()
+        if open_saga:
+            return f"Order {invoice_id} already has saga {open_saga} in progress"
+
+        lines = session.exec(
+            select(OrderInnerBeerAssociative).where(
+                OrderInnerBeerAssociative.fk_order == invoice.fk_order_inner
+            )
+        ).all()
+        if not lines:
+            return f"Order {invoice_id} has no beers"
+
+        now = datetime.now()
+        saga = SagaRun(
+            saga_type=PRODUCTION_SAGA,
+            fk_invoice=invoice_id,
+            status=SagaStatus.RUNNING,
+            created_at=now,
+            updated_at=now,
+        )
+        session.add(saga)
+        session.flush()
+        previous = {
+            "previous_status": invoice.status.value,
+            "previous_inner_status": session.get(
+                OrderInner, invoice.fk_order_inner
+            ).status.value,
+        }
+        beer_orders = [
+            {"beer_id": line.fk_beer, "quantity_hecto": line.quantity_hecto or 0}
+            for line in lines
+        ]
+        return saga.id, beer_orders, previous
+
+
+async def start_production(invoice_id: int) -> str:
+    begun = _begin_production_saga(invoice_id)
+    if isinstance(begun, str):
+        return begun
+    saga_id, beer_orders, previous = begun
+
+    _active_sagas.add(saga_id)
+    try:
+        (requirements_json,) = await _run_stage(
+            saga_id, 0, [("requirements", {"beer_orders": beer_orders})]
+        )
+        requirements = json.loads(requirements_json)
+        if requirements["missing_beers"]:
+            raise SagaStepFailed(
+                f"Unknown beers in brewery: {requirements['missing_beers']}"
+            )
+
+        shortfalls = [
+            {
+                "ingredient_type": i["ingredient_type"],
+                "ingredient_id": i["ingredient_id"],
+                "quantity": i["shortfall"],
+            }
+            for i in requirements["ingredients"]
+            if i["shortfall"] > 0
+        ]
+        if shortfalls:
+            await _run_stage(
+                saga_id, 1, [("allocate", shortfall) for shortfall in shortfalls]
+            )
+
+        final_steps = [
+            (
+                "set_status",
+                {
+                    "invoice_id": invoice_id,
+                    "status": OrderStatus.IN_PRODUCTION.value,
+                    "inner_status": OrderStatusInner.READY_FOR_PRODUCTION.value,
+                    **previous,
+                },
+            )
+        ]
+        if shortfalls:
+            final_steps.append(("transfer", {"items": shortfalls}))
+        await _run_stage(saga_id, 2, final_steps)
+
+        _set_saga_status(saga_id, SagaStatus.COMPLETED)
+        return f"Order {invoice_id} is in production (saga {saga_id}): allocated {len(shortfalls)} ingredients from master storage"
+
+    except (SagaStepFailed, ServiceCallError, ValueError, KeyError) as e:
+        status = await compensate(saga_id)
+        _set_saga_status(saga_id, status, str(e))
+        return f"Could not start production for order {invoice_id} (saga {saga_id} {status.value}): {e}"
+    finally:
+        _active_sagas.discard(saga_id)
+
+
+def describe_saga(saga_id: int) -> Optional[dict]:
+    with get_db_session() as session:
+        saga = session.get(SagaRun, saga_id)
+        if not saga:
+            return None
+        return {
+            "id": saga.id,
+            "type": saga.saga_type,
+            "invoice_id": saga.fk_invoice,
+            "status": saga.status.value,
+            "error": saga.error,
+            "steps": [
+                {
+                    "id": step.id,
+                    "stage": step.stage,
+                    "kind": step.kind,
+                    "status": step.status.value,
+                    "result": step.result,
+                }
+                for step in sorted(saga.steps, key=lambda s: s.id)
+            ],
+        }
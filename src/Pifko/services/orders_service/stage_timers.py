@@ -0,0 +1,407 @@
+"""Automatic FERMENTING -> DONE_FERMENTING and AGING -> DONE_AGING transitions.
+
+When an order enters FERMENTING or AGING, the scheduler looks up the longest
+fermentation_time or aging_time among the order's beers and writes a
+stage_timer row with the due time. The timers also live in an in-memory heap.
+The scheduler sleeps until the earliest due time, then pops every timer that
+is due and moves all of those orders with one UPDATE. On startup the heap is
+rebuilt from stage_timer. Orders found in a timed stage without a timer,
+for example because the process died before scheduling, get a timer from
+that moment. Orders whose invoice was cancelled are never timed or advanced.
+
+Nothing scans the orders periodically. Status changes arrive through the
+change feed, and time comes from an injectable clock, so tests can drive the
+scheduler with SimulatedClock.advance().
+"""
+
+import asyncio
+import heapq
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, exists, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import select
+
+from beer_catalog import beer_catalog
+from db.connection import get_db_session
+from db.models import (
+    OrderInner,
+    OrderInnerBeerAssociative,
+    OrderInvoice,
+    OrderStatus,
+    OrderStatusInner,
+    StageTimer,
+)
+from db.outbox import change_feed
+from utils.logger import get_logger
+
+logger = get_logger("stage_timers")
+
+# Recipe times are in days; shorten this to watch stages advance in a demo
+STAGE_DAY_SECONDS = float(os.getenv("STAGE_DAY_SECONDS", 86_400))
+RETRY_SECONDS = 60
+
+# timed status -> (recipe time field, status it advances to)
+TIMED_STAGES = {
+    OrderStatusInner.FERMENTING: (
+        "fermentation_time",
+        OrderStatusInner.DONE_FERMENTING,
+    ),
+    OrderStatusInner.AGING: ("aging_time", OrderStatusInner.DONE_AGING),
+}
+
+# Cancelled orders keep their inner status but never advance again
+CANCELLED = exists().where(
+    OrderInvoice.fk_order_inner == OrderInner.id,
+    OrderInvoice.status == OrderStatus.CANCELLED,
+)
+
+
+class SystemClock:
+    def now(self) -> datetime:
+        return datetime.now()
+
+    async def sleep(self, seconds: Optional[float], wakeup: asyncio.Event) -> None:
+        """Sleep for seconds (forever if None) or until wakeup is set"""
+        try:
+            await asyncio.wait_for(
+                wakeup.wait(), None if seconds is None else max(0.0, seconds)
+            )
+        except asyncio.TimeoutError:
+            pass
+
+
+class SimulatedClock:
+    """Clock that only moves when advance() is called.
+
+    Timers fire in due order once the clock has passed them:
+
+    >>> clock = SimulatedClock(datetime(2025, 1, 1))
+    >>> scheduler = StageScheduler(clock)
+    >>> scheduler._push(1, datetime(2025, 1, 3), OrderStatusInner.FERMENTING)
+    >>> scheduler._push(2, datetime(2025, 1, 2), OrderStatusInner.AGING)
+    >>> scheduler.next_due()
+    datetime.datetime(2025, 1, 2, 0, 0)
+    >>> scheduler._pop_due(clock.now())
+    []
+    >>> clock.advance(days=1)
+    >>> [order_inner_id for order_inner_id, _, _ in scheduler._pop_due(clock.now())]
+    [2]
+    >>> clock.advance(days=1)
+    >>> [order_inner_id for order_inner_id, _, _ in scheduler._pop_due(clock.now())]
+    [1]
+    >>> scheduler.next_due() is None
+    True
+
+    sleep() returns once advance() reaches its deadline:
+
+    >>> async def sleep_one_hour():
+    ...     sleeper = asyncio.create_task(clock.sleep(3600, asyncio.Event()))
+    ...     await asyncio.sleep(0)
+    ...     clock.advance(minutes=30)
+    ...     await asyncio.sleep(0)
+    ...     halfway = sleeper.done()
+    ...     clock.advance(minutes=30)
+    ...     await sleeper
+    ...     return halfway
+    >>> asyncio.run(sleep_one_hour())
+    False
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        self._now = start or datetime(2025, 1, 1)
+        self._moved = asyncio.Event()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance(self, **delta) -> None:
+        self._now += timedelta(**delta)
+        self._moved.set()
+
+    async def sleep(self, seconds: Optional[float], wakeup: asyncio.Event) -> None:
+        deadline = None if seconds is None else self._now + timedelta(seconds=seconds)
+        while (deadline is None or self._now < deadline) and not wakeup.is_set():
+            self._moved.clear()
+            moved = asyncio.ensure_future(self._moved.wait())
+            woken = asyncio.ensure_future(wakeup.wait())
+            await asyncio.wait({moved, woken}, return_when=asyncio.FIRST_COMPLETED)
+            moved.cancel()
+            woken.cancel()
+
+
+class StageScheduler:
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        # (due_at, order_inner_id); entries not matching _due are stale
+        self._heap: list[tuple[datetime, int]] = []
+        self._due: dict[int, datetime] = {}
+        self._stage: dict[int, OrderStatusInner] = {}
+        self._wakeup = asyncio.Event()
+        self._reconcile_needed = True
+
+    # In-memory queue
+    def _push(
+        self, order_inner_id: int, due_at: datetime, status: OrderStatusInner
+    ) -> None:
+        self._due[order_inner_id] = due_at
+        self._stage[order_inner_id] = status
+        heapq.heappush(self._heap, (due_at, order_inner_id))
+        self._wakeup.set()
+
+    def _forget(self, order_inner_id: int) -> None:
+        self._due.pop(order_inner_id, None)
+        self._stage.pop(order_inner_id, None)
+
+    def _pop_due(self, now: datetime) -> list[tuple[int, datetime, OrderStatusInner]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, order_inner_id = heapq.heappop(self._heap)
+            if self._due.get(order_inner_id) == due_at:
+                due.append((order_inner_id, due_at, self._stage[order_inner_id]))
+                self._forget(order_inner_id)
+        return due
+
+    def next_due(self) -> Optional[datetime]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pending(self) -> dict[int, datetime]:
+        return dict(self._due)
+
+    def load(self) -> int:
+        """Rebuild the heap from stage_timer"""
+        with get_db_session() as session:
+            timers = session.exec(
+                select(
+                    StageTimer.fk_order_inner,
+                    StageTimer.due_at,
+                    StageTimer.from_status,
+                )
+            ).all()
+        self._due = {order_inner_id: due_at for order_inner_id, due_at, _ in timers}
+        self._stage = {order_inner_id: status for order_inner_id, _, status in timers}
+        self._heap = [(due_at, order_inner_id) for order_inner_id, due_at, _ in timers]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        return len(timers)
+
+    # Scheduling
+    async def _stage_days(self, order_inner_ids: list[int], field: str) -> dict:
+        """Longest recipe time among each order's beers, in days"""
+        with get_db_session() as session:
+            lines = session.exec(
+                select(
+                    OrderInnerBeerAssociative.fk_order,
+                    OrderInnerBeerAssociative.fk_beer,
+                ).where(OrderInnerBeerAssociative.fk_order.in_(order_inner_ids))
+            ).all()
+        beers = await beer_catalog.get_many(beer_id for _, beer_id in lines)
+        if any(beer is None for beer in beers.values()):
+            raise LookupError("beer recipe times unavailable from brewery")
+
+        days = {order_inner_id: 0 for order_inner_id in order_inner_ids}
+        for order_inner_id, beer_id in lines:
+            days[order_inner_id] = max(
+                days[order_inner_id], beers[beer_id].get(field) or 0
+            )
+        return days
+
+    async def schedule(self, status: OrderStatusInner, order_inner_ids: list[int]):
+        """Start timers for orders that just entered a timed stage"""
+        field, to_status = TIMED_STAGES[status]
+        days = await self._stage_days(order_inner_ids, field)
+        now = self.clock.now()
+        rows = [
+            {
+                "fk_order_inner": order_inner_id,
+                "from_status": status,
+                "to_status": to_status,
+                "due_at": now + timedelta(seconds=d * STAGE_DAY_SECONDS),
+                "created_at": now,
+            }
+            for order_inner_id, d in days.items()
+        ]
+        stmt = pg_insert(StageTimer).values(rows)
+        with get_db_session() as session:
+            session.exec(
+                stmt.on_conflict_do_update(
+                    index_elements=["fk_order_inner"],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in (
+                            "from_status",
+                            "to_status",
+                            "due_at",
+                            "created_at",
+                        )
+                    },
+                )
+            )
+        for row in rows:
+            self._push(row["fk_order_inner"], row["due_at"], status)
+
+    def cancel(self, order_inner_ids: list[int]) -> None:
+        with get_db_session() as session:
+            session.exec(
+                delete(StageTimer).where(StageTimer.fk_order_inner.in_(order_inner_ids))
+            )
+        for order_inner_id in order_inner_ids:
+            self._forget(order_inner_id)
+
+    async def reconcile(self) -> int:
+        """Schedule orders in a timed stage that have no timer"""
+        scheduled = 0
+        for status in TIMED_STAGES:
+            with get_db_session() as session:
+                orphans = session.exec(
+                    select(OrderInner.id)
+                    .outerjoin(StageTimer, StageTimer.fk_order_inner == OrderInner.id)
+                    .where(OrderInner.status == status)
+                    .where(StageTimer.fk_order_inner.is_(None))
+                    .where(~CANCELLED)
+                ).all()
+            if orphans:
+                await self.schedule(status, list(orphans))
+                scheduled += len(orphans)
+        self._reconcile_needed = False
+        return scheduled
+
+    def _cancelled(self, order_inner_ids: list[int]) -> set[int]:
+        if not order_inner_ids:
+            return set()
+        with get_db_session() as session:
+            return set(
+                session.exec(
+                    select(OrderInner.id)
+                    .where(OrderInner.id.in_(order_inner_ids))
+                    .where(CANCELLED)
+                ).all()
+            )
+
+    async def on_changes(self, changes: list[dict]) -> None:
+        """Start or cancel timers for a batch of order_inner change events"""
+        latest: dict[int, str] = {}
+        for change in changes:
+            if change["entity"] == "order_inner" and change["payload"]:
+                latest[int(change["entity_id"])] = change["payload"]["row"]["status"]
+
+        cancelled = self._cancelled(
+            [i for i, s in latest.items() if OrderStatusInner(s) in TIMED_STAGES]
+        )
+        entering = {status: [] for status in TIMED_STAGES}
+        leaving = []
+        for order_inner_id, status in latest.items():
+            status = OrderStatusInner(status)
+            if status in TIMED_STAGES and order_inner_id not in cancelled:
+                if self._stage.get(order_inner_id) != status:
+                    entering[status].append(order_inner_id)
+            elif order_inner_id in self._due:
+                leaving.append(order_inner_id)
+
+        if leaving:
+            self.cancel(leaving)
+        for status, order_inner_ids in entering.items():
+            if order_inner_ids:
+                await self.schedule(status, order_inner_ids)
+
+    # Firing
+    async def fire_due(self) -> list[tuple[int, str]]:
+        """Advance every order whose timer is due, in one UPDATE"""
+        now = self.clock.now()
+        due = self._pop_due(now)
+        if not due:
+            return []
+        try:
+            return await asyncio.to_thread(
+                self._advance, [order_inner_id for order_inner_id, _, _ in due], now
+            )
+        except Exception:
+            for timer in due:
+                self._push(*timer)
+            raise
+
+    def _advance(self, due_ids: list[int], now: datetime) -> list[tuple[int, str]]:
+        with get_db_session() as session:
+            fired = session.exec(
+                update(OrderInner)
+                .where(OrderInner.id == StageTimer.fk_order_inner)
+                .where(OrderInner.status == StageTimer.from_status)
+                .where(StageTimer.fk_order_inner.in_(due_ids))
+                .where(StageTimer.due_at <= now)
+                .where(~CANCELLED)
+                .values(status=StageTimer.to_status)
+                .returning(OrderInner.id, StageTimer.from_status, OrderInner.status)
+            ).all()
+            session.exec(
+                delete(StageTimer)
+                .where(StageTimer.fk_order_inner.in_(due_ids))
+                .where(StageTimer.due_at <= now)
+            )
+            # The bulk UPDATE bypasses the ORM hooks of the change feed
+            for order_inner_id, from_status, to_status in fired:
+                payload = {
+                    "row": {"status": to_status.value},
+                    "changes": {"status": [from_status.value, to_status.value]},
+                }
+                for topic in ("order_inner.updated", "order_inner.status_changed"):
+                    change_feed.record_event(
+                        session, topic, "order_inner", order_inner_id, payload
+                    )
+
+        return [(order_inner_id, status.value) for order_inner_id, _, status in fired]
+
+    async def _follow_changes(self, subscription) -> None:
+        while True:
+            batch = [await subscription.get()]
+            while not subscription.queue.empty():
+                batch.append(subscription.queue.get_nowait())
+            try:
+                await self.on_changes(batch)
+            except Exception as e:
+                logger.warning(f"Scheduling stage timers failed: {e}")
+                self._reconcile_needed = True
+                self._wakeup.set()
+
+    async def run(self) -> None:
+        """Load timers and fire them when due; run as a lifespan task"""
+        subscription = change_feed.subscribe("order_inner.*")
+        follower = asyncio.create_task(self._follow_changes(subscription))
+        try:
+            self.load()
+            while True:
+                failed = False
+                if self._reconcile_needed:
+                    try:
+                        await self.reconcile()
+                    except Exception as e:
+                        logger.warning(f"Reconciling stage timers failed: {e}")
+                try:
+                    fired = await self.fire_due()
+                    if fired:
+                        logger.info(f"Advanced {len(fired)} orders: {fired}")
+                except Exception as e:
+                    logger.warning(f"Firing stage timers failed: {e}")
+                    failed = True
+
+                next_due = self.next_due()
+                delay = (
+                    (next_due - self.clock.now()).total_seconds() if next_due else None
+                )
+                if failed:
+                    delay = RETRY_SECONDS
+                elif self._reconcile_needed:
+                    delay = (
+                        RETRY_SECONDS if delay is None else min(delay, RETRY_SECONDS)
+                    )
+                self._wakeup.clear()
+                await self.clock.sleep(delay, self._wakeup)
+        finally:
+            follower.cancel()
+            subscription.close()
+
+
+stage_scheduler = StageScheduler()
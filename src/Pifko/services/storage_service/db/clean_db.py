@@ -2,11 +2,22 @@
 """Data cleansing script for Master Storage Service - removes all data but keeps schema"""
 
 
-from sqlmodel import delete
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine, delete
 from utils.logger import get_logger
 from dotenv import load_dotenv
 import os
-from .models import Hop, Malt, Yeast, HopsStorage, MaltsStorage, YeastsStorage
+from .models import (
+    Hop,
+    Malt,
+    Yeast,
+    HopsStorage,
+    MaltsStorage,
+    YeastsStorage,
+    IdempotencyKey,
+    OutboxEvent,
+)
 
 
 def cleanse_data():
@@ -17,7 +28,7 @@ def cleanse_data():
     # Load environment variables - NEED TO IMPORT THIS NOW to override DATABASE_URL
 
     load_dotenv()  # Load .env from host
-    os.environ["DATABASE_URL"] = os.getenv("DATABASE_URL_HOST_BREWERY")
+    os.environ["DATABASE_URL"] = os.getenv("DATABASE_URL_HOST_STORAGE")
 
     from .connection import get_db_session
 
@@ -26,6 +37,12 @@ def cleanse_data():
     with get_db_session() as session:
         # Delete in reverse order of dependencies to avoid foreign key constraints
 
+        # 0. Delete idempotency keys
+        session.exec(delete(IdempotencyKey))
+        logger.info("Deleted idempotency keys", extra={"emoji": "🗑️"})
+        session.exec(delete(OutboxEvent))
+        logger.info("Deleted outbox events", extra={"emoji": "🗑️"})
+
         # 1. Delete storage entries first (they reference ingredients)
         hops_storage_deleted = session.exec(delete(HopsStorage))
         logger.info(
@@ -113,5 +130,29 @@ def cleanse_data():
         )
 
 
+def truncate_data():
+    """Remove all data from master storage database in one TRUNCATE, restarting ID sequences"""
+    load_dotenv()  # Load .env from host
+    engine = create_engine(os.getenv("DATABASE_URL_HOST_STORAGE"), poolclass=NullPool)
+    tables = ", ".join(
+        model.__tablename__
+        for model in (
+            Hop,
+            Malt,
+            Yeast,
+            HopsStorage,
+            MaltsStorage,
+            YeastsStorage,
+            IdempotencyKey,
+            OutboxEvent,
+        )
+    )
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+    finally:
+        engine.dispose()
+
+
 if __name__ == "__main__":
     cleanse_data()
@@ -1,5 +1,6 @@
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
+from datetime import datetime
 
 # Master Storage Database Models
 
@@ -71,6 +72,28 @@ class YeastsStorage(SQLModel, table=True):
     yeast: Yeast = Relationship(back_populates="storage")
 
 
+# Idempotency keys for retried mutating tools
+class IdempotencyKey(SQLModel, table=True):
+    __tablename__ = "storage_idempotency_key"
+    key: str = Field(primary_key=True, max_length=128)
+    tool: str
+    request_hash: str = Field(max_length=32)
+    response: str
+    expires_at: datetime = Field(index=True)
+
+
+# Transactional outbox feeding the change feed
+class OutboxEvent(SQLModel, table=True):
+    __tablename__ = "storage_outbox_event"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str = Field(index=True)
+    entity: str
+    entity_id: str
+    payload: str
+    created_at: datetime
+    published_at: Optional[datetime] = Field(default=None, index=True)
+
+
 # Pydantic models for API communication
 class IngredientInfo(SQLModel):
     id: int
@@ -0,0 +1,28 @@
+"""Change feed of the storage service (see utils/change_feed.py)."""
+
+from utils.change_feed import ChangeFeed, Tracked
+
+from .connection import engine
+from .models import (
+    Hop,
+    HopsStorage,
+    Malt,
+    MaltsStorage,
+    OutboxEvent,
+    Yeast,
+    YeastsStorage,
+)
+
+change_feed = ChangeFeed(
+    "storage",
+    engine,
+    OutboxEvent,
+    {
+        Hop: Tracked("hop", ("name", "country")),
+        Malt: Tracked("malt", ("name", "country")),
+        Yeast: Tracked("yeast", ("name", "country")),
+        HopsStorage: Tracked("hops_storage", ("amount", "unit")),
+        MaltsStorage: Tracked("malts_storage", ("quantity", "unit")),
+        YeastsStorage: Tracked("yeasts_storage", ("amount", "unit")),
+    },
+)
@@ -1,4 +1,6 @@
 import os
+import json
+import asyncio
 from fastmcp import FastMCP
 from typing import Optional
 from sqlmodel import Session, select
@@ -18,18 +20,47 @@ from db.models import (
     RestockRequest,
     InventoryReport,
 )
-from db.connection import get_session, create_db_and_tables
+from db.connection import engine, get_session, create_db_and_tables, query_stats
+from db.outbox import change_feed
+from utils.metrics import instrument
+from utils.profiler import add_profiler
+from utils.tracing import setup_tracing
+from utils.traffic import record_traffic
+from utils.resource_subscriptions import ResourceSubscriptions
+from db.idempotency import (
+    commit_with_key,
+    purge_expired_keys_periodically,
+    replay,
+    request_fingerprint,
+)
 
 
 # Initialize FastMCP
 @asynccontextmanager
 async def lifespan(app):
     create_db_and_tables()
+    key_purger = asyncio.create_task(purge_expired_keys_periodically())
+    outbox_relay = asyncio.create_task(change_feed.run_relay())
+    resource_updates = asyncio.create_task(subscriptions.run())
     yield
+    key_purger.cancel()
+    outbox_relay.cancel()
+    resource_updates.cancel()
 
 
 # Pass lifespan to FastMCP
 mcp = FastMCP("Brewery Storage MCP Server", lifespan=lifespan)
+metrics = instrument(mcp, "storage", engine)
+setup_tracing(mcp, "storage", engine)
+add_profiler(mcp)
+record_traffic(mcp, "storage")
+
+# ingredient type -> (ingredient model, storage model, stock column)
+STOCK_MODELS = {
+    "hops": (Hop, HopsStorage, "amount"),
+    "malts": (Malt, MaltsStorage, "quantity"),
+    "yeasts": (Yeast, YeastsStorage, "amount"),
+}
 
 
 # Hops Tools
@@ -616,46 +647,77 @@ async def allocate_stock(
     ingredient_id: int,
     quantity_requested: int,
     requesting_facility: str,
+    idempotency_key: Optional[str] = None,
 ) -> str:
-    """Allocate stock for a requesting facility"""
-    session = next(get_session())
-    try:
+    """Allocate stock for a requesting facility
+    Pass an idempotency_key to make retries return the original allocation instead of allocating twice.
+    """
+    session = next(get_session())
+    try:
+        fingerprint = request_fingerprint(
+            "allocate_stock",
+            ingredient_type=ingredient_type,
+            ingredient_id=ingredient_id,
+            quantity_requested=quantity_requested,
+            requesting_facility=requesting_facility,
+        )
+        replayed = replay(session, idempotency_key, "allocate_stock", fingerprint)
+        if replayed is not None:
+            return replayed
+
+        # The row stays locked until commit, so concurrent replicas cannot
+        # both spend the same stock or lose each other's update
         if ingredient_type == "hops":
-            storage = session.get(HopsStorage, ingredient_id)
+            storage = session.get(HopsStorage, ingredient_id, with_for_update=True)
             if not storage:
                 return f"No storage found for hop ID {ingredient_id}"
             available = storage.amount or 0
             if available >= quantity_requested:
                 storage.amount = available - quantity_requested
                 session.add(storage)
-                session.commit()
-                return f"Allocated {quantity_requested} units of hop {ingredient_id} to {requesting_facility}. Remaining: {storage.amount}"
+                return commit_with_key(
+                    session,
+                    idempotency_key,
+                    "allocate_stock",
+                    fingerprint,
+                    f"Allocated {quantity_requested} units of hop {ingredient_id} to {requesting_facility}. Remaining: {storage.amount}",
+                )
             else:
                 return f"Insufficient hop stock. Available: {available}, Requested: {quantity_requested}"
 
         elif ingredient_type == "malts":
-            storage = session.get(MaltsStorage, ingredient_id)
+            storage = session.get(MaltsStorage, ingredient_id, with_for_update=True)
             if not storage:
                 return f"No storage found for malt ID {ingredient_id}"
             available = storage.quantity or 0
             if available >= quantity_requested:
                 storage.quantity = available - quantity_requested
                 session.add(storage)
-                session.commit()
-                return f"Allocated {quantity_requested} units of malt {ingredient_id} to {requesting_facility}. Remaining: {storage.quantity}"
+                return commit_with_key(
+                    session,
+                    idempotency_key,
+                    "allocate_stock",
+                    fingerprint,
+                    f"Allocated {quantity_requested} units of malt {ingredient_id} to {requesting_facility}. Remaining: {storage.quantity}",
+                )
             else:
                 return f"Insufficient malt stock. Available: {available}, Requested: {quantity_requested}"
 
         elif ingredient_type == "yeasts":
-            storage = session.get(YeastsStorage, ingredient_id)
+            storage = session.get(YeastsStorage, ingredient_id, with_for_update=True)
             if not storage:
                 return f"No storage found for yeast ID {ingredient_id}"
             available = storage.amount or 0
             if available >= quantity_requested:
                 storage.amount = available - quantity_requested
                 session.add(storage)
-                session.commit()
-                return f"Allocated {quantity_requested} units of yeast {ingredient_id} to {requesting_facility}. Remaining: {storage.amount}"
+                return commit_with_key(
+                    session,
+                    idempotency_key,
+                    "allocate_stock",
+                    fingerprint,
+                    f"Allocated {quantity_requested} units of yeast {ingredient_id} to {requesting_facility}. Remaining: {storage.amount}",
+                )
             else:
                 return f"Insufficient yeast stock. Available: {available}, Requested: {quantity_requested}"
 
@@ -667,37 +729,67 @@ async def allocate_stock(
 
 @mcp.tool()
 async def restock_ingredient(
-    ingredient_type: str, ingredient_id: int, quantity_to_add: int
+    ingredient_type: str,
+    ingredient_id: int,
+    quantity_to_add: int,
+    idempotency_key: Optional[str] = None,
 ) -> str:
-    """Add stock to an ingredient"""
+    """Add stock to an ingredient
+    Pass an idempotency_key to make retries return the original result instead of restocking twice.
+    """
     session = next(get_session())
     try:
+        fingerprint = request_fingerprint(
+            "restock_ingredient",
+            ingredient_type=ingredient_type,
+            ingredient_id=ingredient_id,
+            quantity_to_add=quantity_to_add,
+        )
+        replayed = replay(session, idempotency_key, "restock_ingredient", fingerprint)
+        if replayed is not None:
+            return replayed
+
         if ingredient_type == "hops":
-            storage = session.get(HopsStorage, ingredient_id)
+            storage = session.get(HopsStorage, ingredient_id, with_for_update=True)
             if not storage:
                 return f"No storage found for hop ID {ingredient_id}. Create storage entry first."
             storage.amount = (storage.amount or 0) + quantity_to_add
             session.add(storage)
-            session.commit()
-            return f"Restocked hop {ingredient_id} with {quantity_to_add} units. New total: {storage.amount}"
+            return commit_with_key(
+                session,
+                idempotency_key,
+                "restock_ingredient",
+                fingerprint,
+                f"Restocked hop {ingredient_id} with {quantity_to_add} units. New total: {storage.amount}",
+            )
 
         elif ingredient_type == "malts":
-            storage = session.get(MaltsStorage, ingredient_id)
+            storage = session.get(MaltsStorage, ingredient_id, with_for_update=True)
             if not storage:
                 return f"No storage found for malt ID {ingredient_id}. Create storage entry first."
             storage.quantity = (storage.quantity or 0) + quantity_to_add
             session.add(storage)
-            session.commit()
-            return f"Restocked malt {ingredient_id} with {quantity_to_add} units. New total: {storage.quantity}"
+            return commit_with_key(
+                session,
+                idempotency_key,
+                "restock_ingredient",
+                fingerprint,
+                f"Restocked malt {ingredient_id} with {quantity_to_add} units. New total: {storage.quantity}",
+            )
 
         elif ingredient_type == "yeasts":
-            storage = session.get(YeastsStorage, ingredient_id)
+            storage = session.get(YeastsStorage, ingredient_id, with_for_update=True)
             if not storage:
                 return f"No storage found for yeast ID {ingredient_id}. Create storage entry first."
             storage.amount = (storage.amount or 0) + quantity_to_add
             session.add(storage)
-            session.commit()
-            return f"Restocked yeast {ingredient_id} with {quantity_to_add} units. New total: {storage.amount}"
+            return commit_with_key(
+                session,
+                idempotency_key,
+                "restock_ingredient",
+                fingerprint,
+                f"Restocked yeast {ingredient_id} with {quantity_to_add} units. New total: {storage.amount}",
+            )
 
         else:
             return "Invalid ingredient type. Use: hops, malts, or yeasts"
@@ -705,6 +797,172 @@ async def restock_ingredient(
         session.close()
 
 
+@mcp.tool()
+async def restock_ingredients_batch(
+    restocks_json: str, idempotency_key: Optional[str] = None
+) -> str:
+    """Add stock to many ingredients in one transaction; nothing is restocked if any entry is invalid
+    restocks_json should be a JSON string like: '[{"ingredient_type": "hops", "ingredient_id": 1, "quantity": 5}]'
+    Pass an idempotency_key to make retries return the original result instead of restocking twice.
+    """
+    session = next(get_session())
+    try:
+        fingerprint = request_fingerprint(
+            "restock_ingredients_batch", restocks_json=restocks_json
+        )
+        replayed = replay(
+            session, idempotency_key, "restock_ingredients_batch", fingerprint
+        )
+        if replayed is not None:
+            return replayed
+
+        # Lock rows in a fixed order so concurrent batches cannot deadlock
+        restocks = sorted(
+            json.loads(restocks_json),
+            key=lambda r: (r["ingredient_type"], r["ingredient_id"]),
+        )
+        results = []
+        for restock in restocks:
+            ingredient_type = restock["ingredient_type"]
+            ingredient_id = restock["ingredient_id"]
+            quantity = restock["quantity"]
+            if ingredient_type not in STOCK_MODELS:
+                return f"Invalid ingredient type: {ingredient_type}. Use: hops, malts, or yeasts"
+            if quantity < 0:
+                return (
+                    f"Invalid quantity {quantity} for {ingredient_type} {ingredient_id}"
+                )
+
+            _, storage_model, stock_column = STOCK_MODELS[ingredient_type]
+            storage = session.get(storage_model, ingredient_id, with_for_update=True)
+            if not storage:
+                session.rollback()
+                return f"No storage found for {ingredient_type} ID {ingredient_id}. Create storage entry first."
+
+            new_total = (getattr(storage, stock_column) or 0) + quantity
+            setattr(storage, stock_column, new_total)
+            session.add(storage)
+            results.append(
+                {
+                    "ingredient_type": ingredient_type,
+                    "ingredient_id": ingredient_id,
+                    "new_total": new_total,
+                }
+            )
+
+        return commit_with_key(
+            session,
+            idempotency_key,
+            "restock_ingredients_batch",
+            fingerprint,
+            f"Restocked ingredients ({len(results)}): {results}",
+        )
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return "Invalid JSON format for restocks_json"
+    finally:
+        session.close()
+
+
+# Query Stats Tools
+@mcp.tool()
+async def get_top_queries(
+    limit: int = 10, order_by: str = "total", reset: bool = False
+) -> str:
+    """Get the SQL statements (normalised to fingerprints) that cost the most since startup.
+    order_by: total, mean, max or calls. reset=True clears the statistics after reading them.
+    """
+    if order_by not in ("total", "mean", "max", "calls"):
+        return f"Invalid order_by: {order_by}. Use: total, mean, max or calls"
+    queries = query_stats.top(limit, order_by)
+    if reset:
+        query_stats.reset()
+    return f"Top queries by {order_by} ({len(queries)}): {queries}"
+
+
+# Change Feed Tools
+@mcp.tool()
+async def get_changes(
+    after_id: int = 0,
+    topic: Optional[str] = None,
+    limit: int = 100,
+    as_json: bool = False,
+) -> str:
+    """Get change events after a known event ID, oldest first.
+    topic may use * wildcards, e.g. "hops_storage.*". Live events are also published via LISTEN on the "storage_changes" channel.
+    as_json returns {"last_id": newest event ID, "changes": [...]} as JSON, for services following the feed.
+    """
+    session = next(get_session())
+    try:
+        changes = change_feed.read_events(session, after_id, topic, limit)
+        if as_json:
+            last_id = change_feed.last_event_id(session)
+            return json.dumps({"last_id": last_id, "changes": changes})
+        return f"Changes ({len(changes)}): {changes}"
+    finally:
+        session.close()
+
+
+# Resources (subscribe to get notifications/resources/updated on change)
+# change feed entity -> ingredient type of its stock resource
+STOCK_ENTITIES = {
+    "hop": "hops",
+    "hops_storage": "hops",
+    "malt": "malts",
+    "malts_storage": "malts",
+    "yeast": "yeasts",
+    "yeasts_storage": "yeasts",
+}
+
+
+def _stock_level(ingredient_type: str, ingredient_id: int) -> str:
+    ingredient_model, storage_model, stock_column = STOCK_MODELS[ingredient_type]
+    session = next(get_session())
+    try:
+        ingredient = session.get(ingredient_model, ingredient_id)
+        storage = session.get(storage_model, ingredient_id)
+        return json.dumps(
+            {
+                "ingredient_type": ingredient_type,
+                "ingredient_id": ingredient_id,
+                "name": ingredient.name if ingredient else None,
+                "stock": getattr(storage, stock_column) if storage else None,
+                "unit": storage.unit if storage else None,
+            }
+        )
+    finally:
+        session.close()
+
+
+@mcp.resource("storage://hops/{hop_id}", mime_type="application/json")
+async def hop_stock_resource(hop_id: int) -> str:
+    """Master storage stock level of a hop"""
+    return _stock_level("hops", int(hop_id))
+
+
+@mcp.resource("storage://malts/{malt_id}", mime_type="application/json")
+async def malt_stock_resource(malt_id: int) -> str:
+    """Master storage stock level of a malt"""
+    return _stock_level("malts", int(malt_id))
+
+
+@mcp.resource("storage://yeasts/{yeast_id}", mime_type="application/json")
+async def yeast_stock_resource(yeast_id: int) -> str:
+    """Master storage stock level of a yeast"""
+    return _stock_level("yeasts", int(yeast_id))
+
+
+def _changed_resources(changes: list[dict]) -> set[str]:
+    """Resource URIs affected by a batch of change events"""
+    return {
+        f"storage://{STOCK_ENTITIES[c['entity']]}/{c['entity_id']}"
+        for c in changes
+        if c["entity"] in STOCK_ENTITIES
+    }
+
+
+subscriptions = ResourceSubscriptions(mcp, change_feed, _changed_resources)
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8003))
     mcp.run(transport="streamable-http", host="0.0.0.0", port=port)
@@ -0,0 +1,318 @@
+"""Transactional outbox and change feed shared by the Pifko services.
+
+A service tracks some of its models with a ChangeFeed. Whenever a session
+bound to the service's engine flushes inserts, updates or deletes of tracked
+rows, matching events are written to the service's outbox table on the same
+connection, so they commit or roll back together with the change. Core bulk
+statements bypass the ORM and call record_event instead.
+
+A relay task publishes committed events in ID order to PostgreSQL NOTIFY on
+the "<service>_changes" channel, for other processes, and to in-process
+subscribers. Published events stay in the outbox for a retention period, so
+a consumer that missed notifications can catch up by event ID.
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import delete, event, func, insert, inspect, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlmodel import select
+
+from .logger import get_logger
+
+logger = get_logger("change_feed")
+
+RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", 500))
+RELAY_POLL_SECONDS = float(os.getenv("OUTBOX_RELAY_POLL_SECONDS", 1.0))
+RETENTION = timedelta(seconds=int(os.getenv("OUTBOX_RETENTION_SECONDS", 86_400)))
+NOTIFY_PAYLOAD_LIMIT = 7900  # NOTIFY payloads must stay under 8000 bytes
+
+
+@dataclass(frozen=True)
+class Tracked:
+    """How rows of one model appear in the change feed"""
+
+    entity: str
+    fields: tuple[str, ...]
+    # (op, row, {field: (old, new)}) -> extra topic suffixes such as "status_changed"
+    derive: Optional[Callable[[str, Any, dict], list[str]]] = None
+
+
+class Subscription:
+    """In-process stream of published events whose topic matches a pattern.
+
+    Events are buffered up to maxsize; a subscriber that falls further behind
+    loses the newest events and has them counted in dropped.
+    """
+
+    def __init__(self, feed: "ChangeFeed", patterns: tuple[str, ...], maxsize: int):
+        self._feed = feed
+        self.patterns = patterns
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def matches(self, topic: str) -> bool:
+        return any(fnmatch.fnmatchcase(topic, p) for p in self.patterns)
+
+    def _offer(self, change: dict) -> None:
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self._feed._subscribers.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChangeFeed:
+    def __init__(
+        self,
+        service: str,
+        engine: Engine,
+        outbox_model,
+        tracked: dict[type, Tracked],
+    ):
+        self.service = service
+        self.channel = f"{service}_changes"
+        self.engine = engine
+        self.model = outbox_model
+        self.tracked = tracked
+        self._subscribers: set[Subscription] = set()
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "after_commit", self._after_commit)
+
+    def _owns(self, session: Session) -> bool:
+        return session.bind is self.engine
+
+    # Writing events
+    def _row_event(self, op: str, row: Any, now: datetime) -> list[dict]:
+        spec = self.tracked[type(row)]
+        state = inspect(row)
+        values = {field: getattr(row, field) for field in spec.fields}
+
+        changes = {}
+        if op == "updated":
+            for field in spec.fields:
+                history = state.attrs[field].history
+                if history.has_changes():
+                    old = history.deleted[0] if history.deleted else None
+                    changes[field] = (old, values[field])
+            if not changes:
+                return []
+        elif op == "created":
+            changes = {field: (None, value) for field, value in values.items()}
+
+        entity_id = ":".join(
+            str(v) for v in state.mapper.primary_key_from_instance(row)
+        )
+        payload = {"row": values}
+        if op == "updated":
+            payload["changes"] = {f: list(change) for f, change in changes.items()}
+        encoded = json.dumps(payload, default=str)
+
+        suffixes = [op] + (spec.derive(op, row, changes) if spec.derive else [])
+        return [
+            {
+                "topic": f"{spec.entity}.{suffix}",
+                "entity": spec.entity,
+                "entity_id": entity_id,
+                "payload": encoded,
+                "created_at": now,
+            }
+            for suffix in suffixes
+        ]
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        if not self._owns(session):
+            return
+        now = datetime.now()
+        rows = []
+        for op, instances in (
+            ("created", session.new),
+            ("updated", session.dirty),
+            ("deleted", session.deleted),
+        ):
+            for instance in instances:
+                if type(instance) in self.tracked:
+                    rows.extend(self._row_event(op, instance, now))
+        if rows:
+            session.connection().execute(insert(self.model.__table__), rows)
+            session.info["outbox_written"] = True
+
+    def record_event(
+        self,
+        session: Session,
+        topic: str,
+        entity: str,
+        entity_id: Any,
+        payload: dict,
+    ) -> None:
+        """Write an event for a change made outside the ORM, in the session's transaction"""
+        session.add(
+            self.model(
+                topic=topic,
+                entity=entity,
+                entity_id=str(entity_id),
+                payload=json.dumps(payload, default=str),
+                created_at=datetime.now(),
+            )
+        )
+        session.info["outbox_written"] = True
+
+    def _after_commit(self, session: Session) -> None:
+        if session.info.pop("outbox_written", False) and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # Publishing events
+    def _as_change(self, row) -> dict:
+        return {
+            "id": row.id,
+            "service": self.service,
+            "topic": row.topic,
+            "entity": row.entity,
+            "entity_id": row.entity_id,
+            "payload": json.loads(row.payload),
+            "created_at": str(row.created_at),
+        }
+
+    def publish_pending(self, limit: int = RELAY_BATCH_SIZE) -> list[dict]:
+        """Publish one batch of unpublished events and mark them published.
+
+        SKIP LOCKED lets several relays share an outbox without publishing
+        an event twice. The NOTIFYs are delivered when the batch commits.
+        """
+        with Session(self.engine) as session:
+            rows = (
+                session.execute(
+                    select(self.model)
+                    .where(self.model.published_at.is_(None))
+                    .order_by(self.model.id)
+                    .limit(limit)
+                    .with_for_update(skip_locked=True)
+                )
+                .scalars()
+                .all()
+            )
+            if not rows:
+                return []
+
+            changes = [self._as_change(row) for row in rows]
+            messages = []
+            for change in changes:
+                message = json.dumps(change, default=str)
+                if len(message.encode()) > NOTIFY_PAYLOAD_LIMIT:
+                    # Listeners fetch oversized payloads with the catch-up query
+                    message = json.dumps({**change, "payload": None, "truncated": True})
+                messages.append(message)
+
+            session.execute(
+                text(
+                    "SELECT pg_notify(:channel, message) "
+                    "FROM unnest(CAST(:messages AS text[])) AS message"
+                ),
+                {"channel": self.channel, "messages": messages},
+            )
+            session.execute(
+                update(self.model)
+                .where(self.model.id.in_([row.id for row in rows]))
+                .values(published_at=datetime.now())
+            )
+            session.commit()
+            return changes
+
+    def purge_published(self) -> int:
+        with Session(self.engine) as session:
+            result = session.execute(
+                delete(self.model).where(
+                    self.model.published_at < datetime.now() - RETENTION
+                )
+            )
+            session.commit()
+            return result.rowcount
+
+    def _dispatch(self, change: dict) -> None:
+        for subscriber in list(self._subscribers):
+            if subscriber.matches(change["topic"]):
+                subscriber._offer(change)
+
+    async def run_relay(self) -> None:
+        """Publish events as their transactions commit; run as a lifespan task"""
+        self._loop = asyncio.get_running_loop()
+        next_purge = time.monotonic()
+        while True:
+            try:
+                published = await asyncio.to_thread(self.publish_pending)
+                for change in published:
+                    self._dispatch(change)
+                if time.monotonic() >= next_purge:
+                    await asyncio.to_thread(self.purge_published)
+                    next_purge = time.monotonic() + 3600
+            except Exception as e:
+                logger.warning(f"Outbox relay for {self.service} failed: {e}")
+                published = []
+
+            if len(published) < RELAY_BATCH_SIZE:
+                # Commits wake the relay early; the timeout covers other processes
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), RELAY_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    # Consuming events
+    def subscribe(self, *patterns: str, maxsize: int = 1000) -> Subscription:
+        """Subscribe to published events by topic pattern, e.g. "order_invoice.*" """
+        subscription = Subscription(self, patterns or ("*",), maxsize)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def read_events(
+        self,
+        session: Session,
+        after_id: int = 0,
+        topic: Optional[str] = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Events after a known event ID, for consumers catching up"""
+        query = select(self.model).where(self.model.id > after_id)
+        if topic:
+            # Only * is a wildcard; % and _ in the topic match themselves
+            pattern = (
+                topic.replace("\\", "\\\\")
+                .replace("%", "\\%")
+                .replace("_", "\\_")
+                .replace("*", "%")
+            )
+            query = query.where(self.model.topic.like(pattern, escape="\\"))
+        rows = session.exec(query.order_by(self.model.id).limit(limit)).all()
+        return [self._as_change(row) for row in rows]
+
+    def last_event_id(self, session: Session) -> int:
+        """ID of the newest event, where a new consumer starts following; 0 if none"""
+        return session.exec(select(func.max(self.model.id))).one() or 0
@@ -0,0 +1,107 @@
+"""Idempotency keys for retried mutating tools, shared by the Pifko services.
+
+A tool that accepts an idempotency key stores its response in the same
+transaction as its work. A replay of the key returns the stored response
+without running the work again, until the key expires.
+
+Each service keeps its own key table (a model with key, tool, request_hash,
+response and expires_at columns) and binds it with IdempotencyKeys.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from contextlib import AbstractContextManager
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session
+
+KEY_TTL = timedelta(seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600)))
+PURGE_INTERVAL_SECONDS = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", 3600))
+
+
+def request_fingerprint(tool: str, **arguments) -> str:
+    """Short hash of a tool call, used to reject a key reused for another request"""
+    payload = json.dumps([tool, arguments], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class IdempotencyKeys:
+    """Stored responses of one service's key table"""
+
+    def __init__(
+        self, model, session_factory: Callable[[], AbstractContextManager[Session]]
+    ):
+        self.model = model
+        self.session_factory = session_factory
+
+    def replay(
+        self, session: Session, key: Optional[str], tool: str, fingerprint: str
+    ) -> Optional[str]:
+        """Return the stored response for a live key, or None if the work must run"""
+        if not key:
+            return None
+        record = session.get(self.model, key)
+        if record is None or record.expires_at <= datetime.now():
+            return None
+        if record.tool != tool or record.request_hash != fingerprint:
+            return f"Idempotency key '{key}' was already used for a different request"
+        return record.response
+
+    def commit_with_key(
+        self,
+        session: Session,
+        key: Optional[str],
+        tool: str,
+        fingerprint: str,
+        response: str,
+    ) -> str:
+        """Commit the tool's work together with its idempotency record.
+
+        If a concurrent call with the same key committed first, this transaction
+        is rolled back and the winner's response is returned instead.
+        """
+        if key:
+            now = datetime.now()
+            stmt = pg_insert(self.model).values(
+                key=key,
+                tool=tool,
+                request_hash=fingerprint,
+                response=response,
+                expires_at=now + KEY_TTL,
+            )
+            # Only an expired record may be overwritten; a live one means we lost
+            claimed = session.exec(
+                stmt.on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={
+                        "tool": stmt.excluded.tool,
+                        "request_hash": stmt.excluded.request_hash,
+                        "response": stmt.excluded.response,
+                        "expires_at": stmt.excluded.expires_at,
+                    },
+                    where=self.model.expires_at <= now,
+                )
+            ).rowcount
+            if not claimed:
+                session.rollback()
+                return self.replay(session, key, tool, fingerprint) or response
+        session.commit()
+        return response
+
+    def purge_expired_keys(self) -> int:
+        """Delete expired keys in bulk; returns how many were removed"""
+        with self.session_factory() as session:
+            result = session.exec(
+                delete(self.model).where(self.model.expires_at <= datetime.now())
+            )
+            return result.rowcount
+
+    async def purge_expired_keys_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(PURGE_INTERVAL_SECONDS)
+            self.purge_expired_keys()
@@ -0,0 +1,221 @@
+"""Per-tool metrics in the Prometheus text format, served on /metrics.
+
+A middleware times every tool call and records, per tool:
+
+    pifko_tool_calls_total{status="ok"|"error"}     calls and failed calls
+    pifko_tool_duration_seconds                     latency histogram
+    pifko_tool_db_seconds_total                     time spent in SQL
+    pifko_tool_python_seconds_total                 the rest of the call
+    pifko_tool_db_queries_total                     statements executed
+    pifko_tool_response_bytes                       response size histogram
+
+SQL time is measured by engine cursor events and added to the accumulator
+of the tool call that runs the statement. The accumulator is found through
+a context variable, so it follows the call into asyncio.to_thread. A call
+only costs a few clock reads and dictionary updates, so metrics stay on in
+production.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from fastmcp import FastMCP
+from fastmcp.server.middleware import Middleware
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# [sql seconds, statements] of the tool call in progress
+_db_time: ContextVar[Optional[list]] = ContextVar("pifko_db_time", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class ToolStats:
+    __slots__ = ("calls", "errors", "latency", "size", "db_seconds", "queries")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.db_seconds = 0.0
+        self.queries = 0
+
+
+def _response_bytes(result) -> int:
+    return sum(
+        len(block.text.encode())
+        for block in getattr(result, "content", None) or ()
+        if getattr(block, "text", None)
+    )
+
+
+class ToolMetrics(Middleware):
+    def __init__(self, service: str, engine: Optional[Engine] = None):
+        self.service = service
+        self.tools: dict[str, ToolStats] = {}
+        if engine is not None:
+            event.listen(engine, "before_cursor_execute", self._before_execute)
+            event.listen(engine, "after_cursor_execute", self._after_execute)
+            event.listen(engine, "handle_error", self._handle_error)
+
+    # SQL timing
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if _db_time.get() is not None:
+            conn.info.setdefault("pifko_query_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        accumulator = _db_time.get()
+        starts = conn.info.get("pifko_query_start")
+        if accumulator is not None and starts:
+            accumulator[0] += time.perf_counter() - starts.pop()
+            accumulator[1] += 1
+
+    @staticmethod
+    def _handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        starts = conn.info.get("pifko_query_start") if conn is not None else None
+        if starts:
+            starts.pop()
+
+    # Tool timing
+    async def on_call_tool(self, context, call_next):
+        accumulator = [0.0, 0]
+        token = _db_time.set(accumulator)
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await call_next(context)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            _db_time.reset(token)
+            stats = self.tools.get(context.message.name)
+            if stats is None:
+                stats = self.tools[context.message.name] = ToolStats()
+            stats.calls += 1
+            stats.errors += failed
+            stats.latency.observe(elapsed)
+            stats.db_seconds += accumulator[0]
+            stats.queries += accumulator[1]
+            if not failed:
+                stats.size.observe(_response_bytes(result))
+
+    # Exposition
+    def render(self) -> str:
+        lines = [
+            "# HELP pifko_tool_calls_total MCP tool calls by outcome",
+            "# TYPE pifko_tool_calls_total counter",
+        ]
+        for tool, stats in sorted(self.tools.items()):
+            labels = f'service="{self.service}",tool="{tool}"'
+            lines.append(
+                f'pifko_tool_calls_total{{{labels},status="ok"}} {stats.calls - stats.errors}'
+            )
+            lines.append(
+                f'pifko_tool_calls_total{{{labels},status="error"}} {stats.errors}'
+            )
+
+        def value(metric):
+            return lambda name, labels, stats: [f"{name}{{{labels}}} {metric(stats)}"]
+
+        sections = (
+            (
+                "pifko_tool_duration_seconds",
+                "histogram",
+                "Tool call latency",
+                lambda name, labels, stats: stats.latency.render(name, labels),
+            ),
+            (
+                "pifko_tool_db_seconds_total",
+                "counter",
+                "Time tools spent in SQL",
+                value(lambda stats: stats.db_seconds),
+            ),
+            (
+                "pifko_tool_python_seconds_total",
+                "counter",
+                "Time tools spent outside SQL",
+                value(lambda stats: max(0.0, stats.latency.sum - stats.db_seconds)),
+            ),
+            (
+                "pifko_tool_db_queries_total",
+                "counter",
+                "SQL statements run by tools",
+                value(lambda stats: stats.queries),
+            ),
+            (
+                "pifko_tool_response_bytes",
+                "histogram",
+                "Tool response size",
+                lambda name, labels, stats: stats.size.render(name, labels),
+            ),
+        )
+        for name, kind, help_text, render in sections:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for tool, stats in sorted(self.tools.items()):
+                labels = f'service="{self.service}",tool="{tool}"'
+                lines.extend(render(name, labels, stats))
+        return "\n".join(lines) + "\n"
+
+
+def instrument(mcp: FastMCP, service: str, engine: Optional[Engine] = None):
+    """Time every tool of mcp and serve the numbers on GET /metrics"""
+    metrics = ToolMetrics(service, engine)
+    mcp.add_middleware(metrics)
+
+    @mcp.custom_route("/metrics", methods=["GET"], include_in_schema=False)
+    async def metrics_endpoint(request: Request) -> PlainTextResponse:
+        return PlainTextResponse(
+            metrics.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    return metrics
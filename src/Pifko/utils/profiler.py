@@ -0,0 +1,158 @@
+"""On-demand sampling profiler for a running service.
+
+While a profile runs, an ITIMER_PROF interval timer sends SIGPROF every
+interval of CPU time the process uses. The handler runs in the main thread,
+which runs the event loop, between two bytecodes. It records the stack of
+the interrupted frame and the stacks of the other threads. A thread that
+only polls for stacks would not work here: it gets the GIL almost only when
+the event loop releases it in select(), so busy tools would never appear.
+
+Nothing is installed outside the profile window, and the previous handler
+is restored afterwards. Profiles are bounded by MAX_PROFILE_SECONDS and
+only one runs at a time. Samples are folded into collapsed stacks
+("frame;frame;frame count", as read by flamegraph.pl and speedscope). Each
+sample is attributed to the tool whose function is on the stack. Work
+elsewhere, for example in asyncio.to_thread workers, counts as "(other)".
+Threads waiting for work are left out.
+"""
+
+import asyncio
+import os
+import signal
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+from fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+MAX_PROFILE_SECONDS = float(os.getenv("MAX_PROFILE_SECONDS", 60))
+
+# Leaf frames of threads that are waiting rather than working
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+_running = threading.Lock()
+
+
+def _label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+class StackSampler:
+    def __init__(self, tool_codes: dict):
+        """tool_codes maps a tool function's code object to the tool name"""
+        self.tool_codes = tool_codes
+        self.stacks: Counter = Counter()
+        self.tools: Counter = Counter()
+        self.samples = 0
+
+    def record(self, frame) -> None:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            return
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        tool = next(
+            (self.tool_codes[c] for c in codes if c in self.tool_codes),
+            "(other)",
+        )
+        self.stacks[";".join(_label(c) for c in codes)] += 1
+        self.tools[tool] += 1
+        self.samples += 1
+
+    def on_signal(self, signum, frame) -> None:
+        main = threading.main_thread().ident
+        if frame is not None:
+            self.record(frame)
+        for thread_id, thread_frame in sys._current_frames().items():
+            if thread_id != main:
+                self.record(thread_frame)
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common(limit)
+        )
+
+    def per_tool(self) -> list[dict]:
+        return [
+            {
+                "tool": tool,
+                "samples": count,
+                "share": round(count / self.samples, 3),
+            }
+            for tool, count in self.tools.most_common()
+        ]
+
+
+async def profile(mcp: FastMCP, seconds: float, interval_ms: float) -> StackSampler:
+    """Sample this process for seconds; raises if a profile is already running"""
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_PROFILE_SECONDS}")
+    if threading.current_thread() is not threading.main_thread():
+        raise RuntimeError("Profiling needs the event loop in the main thread")
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        tools = await mcp.get_tools()
+        sampler = StackSampler(
+            {
+                tool.fn.__code__: name
+                for name, tool in tools.items()
+                if hasattr(getattr(tool, "fn", None), "__code__")
+            }
+        )
+        interval = max(interval_ms, 1) / 1000
+        previous = signal.signal(signal.SIGPROF, sampler.on_signal)
+        try:
+            signal.setitimer(signal.ITIMER_PROF, interval, interval)
+            await asyncio.sleep(seconds)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+        return sampler
+    finally:
+        _running.release()
+
+
+def add_profiler(mcp: FastMCP) -> None:
+    """Add the profile_service tool and GET /debug/profile?seconds= to mcp"""
+
+    @mcp.tool()
+    async def profile_service(
+        seconds: float = 10, interval_ms: float = 10, top_stacks: int = 50
+    ) -> str:
+        """Sample this service's CPU use for a few seconds and report where the time went.
+        Returns samples per tool and the hottest stacks in collapsed (flamegraph) format.
+        """
+        try:
+            sampler = await profile(mcp, seconds, interval_ms)
+        except (ValueError, RuntimeError) as e:
+            return str(e)
+        return (
+            f"Profile ({sampler.samples} samples over {seconds}s, one per {interval_ms} ms of CPU): per tool {sampler.per_tool()}\n"
+            f"Collapsed stacks:\n{sampler.collapsed(top_stacks)}"
+        )
+
+    @mcp.custom_route("/debug/profile", methods=["GET"], include_in_schema=False)
+    async def profile_endpoint(request: Request) -> PlainTextResponse:
+        try:
+            sampler = await profile(
+                mcp,
+                float(request.query_params.get("seconds", 10)),
+                float(request.query_params.get("interval_ms", 10)),
+            )
+        except ValueError as e:
+            return PlainTextResponse(str(e), status_code=400)
+        except RuntimeError as e:
+            return PlainTextResponse(str(e), status_code=409)
+        return PlainTextResponse(sampler.collapsed() + "\n")
@@ -0,0 +1,113 @@
+"""Per-fingerprint SQL timing and a slow-query log.
+
+Every statement an engine executes is reduced to a fingerprint: literals
+and bind parameters become ?, IN lists, arrays and multi-row VALUES
+collapse to a single entry, and whitespace is normalised. Calls, total,
+max and rows are kept per fingerprint. Statements slower than
+SLOW_QUERY_MS are logged, and so is a random SQL_LOG_SAMPLE_RATE fraction
+of the rest.
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .logger import get_logger
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SQL_LOG_SAMPLE_RATE = float(os.getenv("SQL_LOG_SAMPLE_RATE", 0))
+
+logger = get_logger("sql")
+
+_NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),  # string literals
+    (re.compile(r"%\(\w+\)s|%s|\$\d+"), "?"),  # bind parameters
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),  # numbers
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?+)"),  # IN lists, VALUES rows
+    (re.compile(r"(\(\?\+\))(?:\s*,\s*\(\?\+\))+"), r"\1"),  # multi-row VALUES
+    (re.compile(r"\[\s*\?(?:\s*,\s*\?)*\s*\]"), "[?+]"),  # ARRAY literals
+    (re.compile(r"\s+"), " "),
+]
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    for pattern, replacement in _NORMALIZE:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class QueryStats:
+    def __init__(self, engine: Engine):
+        self._stats: dict[str, list] = {}
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_stats_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, many):
+        starts = conn.info.get("query_stats_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        key = fingerprint(statement)
+        rows = max(cursor.rowcount, 0)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                self._stats[key] = [1, elapsed, elapsed, rows]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+                stats[3] += rows
+
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms >= SLOW_QUERY_MS:
+            logger.warning(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows): {key}")
+        elif SQL_LOG_SAMPLE_RATE and random.random() < SQL_LOG_SAMPLE_RATE:
+            logger.info(f"Sampled query ({elapsed_ms:.1f} ms, {rows} rows): {key}")
+
+    def _handle_error(self, exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        starts = conn.info.get("query_stats_start") if conn is not None else None
+        if starts:
+            starts.pop()
+
+    def top(self, limit: int = 10, order_by: str = "total") -> list[dict]:
+        """Fingerprints with the highest total, mean, max time or call count"""
+        with self._lock:
+            snapshot = [(key, list(stats)) for key, stats in self._stats.items()]
+        queries = [
+            {
+                "fingerprint": key,
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / calls, 3),
+                "max_ms": round(longest * 1000, 3),
+                "rows": rows,
+            }
+            for key, (calls, total, longest, rows) in snapshot
+        ]
+        sort_key = {
+            "total": "total_ms",
+            "mean": "mean_ms",
+            "max": "max_ms",
+            "calls": "calls",
+        }[order_by]
+        queries.sort(key=lambda q: q[sort_key], reverse=True)
+        return queries[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,85 @@
+"""MCP resource subscriptions driven by a service's change feed.
+
+Clients subscribe to resource URIs (resources/subscribe). Every batch of
+published change events is mapped to the URIs it affects, and each URI with
+subscribers gets one notifications/resources/updated per batch, so clients
+re-read a resource only after it actually changed.
+"""
+
+import asyncio
+from collections import defaultdict
+from typing import Callable, Iterable
+
+from fastmcp import FastMCP
+from pydantic import AnyUrl
+
+from .change_feed import ChangeFeed
+from .logger import get_logger
+
+logger = get_logger("resource_subscriptions")
+
+
+class ResourceSubscriptions:
+    def __init__(
+        self,
+        mcp: FastMCP,
+        change_feed: ChangeFeed,
+        resolve: Callable[[list[dict]], Iterable[str]],
+    ):
+        """resolve maps a batch of change events to the resource URIs they affect"""
+        self.change_feed = change_feed
+        self.resolve = resolve
+        self._sessions: dict[str, set] = defaultdict(set)
+
+        server = mcp._mcp_server
+
+        @server.subscribe_resource()
+        async def subscribe(uri: AnyUrl) -> None:
+            self._sessions[str(uri)].add(server.request_context.session)
+
+        @server.unsubscribe_resource()
+        async def unsubscribe(uri: AnyUrl) -> None:
+            self._drop(str(uri), server.request_context.session)
+
+        # The low-level server always advertises subscribe=False
+        get_capabilities = server.get_capabilities
+
+        def get_capabilities_with_subscribe(*args, **kwargs):
+            capabilities = get_capabilities(*args, **kwargs)
+            if capabilities.resources is not None:
+                capabilities.resources.subscribe = True
+            return capabilities
+
+        server.get_capabilities = get_capabilities_with_subscribe
+
+    def _drop(self, uri: str, session) -> None:
+        sessions = self._sessions.get(uri)
+        if sessions is not None:
+            sessions.discard(session)
+            if not sessions:
+                del self._sessions[uri]
+
+    async def _notify(self, uri: str) -> None:
+        for session in list(self._sessions.get(uri, ())):
+            try:
+                await session.send_resource_updated(AnyUrl(uri))
+            except Exception:
+                # The client went away without unsubscribing
+                self._drop(uri, session)
+
+    async def run(self) -> None:
+        """Forward change events as resource updates; run as a lifespan task"""
+        with self.change_feed.subscribe() as changes:
+            while True:
+                batch = [await changes.get()]
+                while not changes.queue.empty():
+                    batch.append(changes.queue.get_nowait())
+                if not self._sessions:
+                    continue
+                try:
+                    uris = set(await asyncio.to_thread(self.resolve, batch))
+                except Exception as e:
+                    logger.warning(f"Resolving changed resources failed: {e}")
+                    continue
+                for uri in uris & self._sessions.keys():
+                    await self._notify(uri)
@@ -0,0 +1,190 @@
+"""Pooled MCP clients for calls between the Pifko services.
+
+Each peer service gets one long-lived ServiceClient: a single MCP session
+over a keep-alive httpx connection pool, shared by every caller in the
+process. Calls are bounded by a per-peer concurrency limit and a per-call
+timeout. A broken session is torn down and re-established on the next call.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+from typing import Any, Optional
+
+import httpx
+from fastmcp import Client
+from fastmcp.client.transports import StreamableHttpTransport
+from mcp import types as mcp_types
+
+from .logger import get_logger
+from .tracing import client_span, inject_meta
+from .traffic import INTERNAL_CALLER
+
+logger = get_logger("service_client")
+
+SERVICE_URLS = {
+    "orders": os.getenv("ORDERS_SERVICE_URL", "http://localhost:8001"),
+    "brewery": os.getenv("BREWERY_SERVICE_URL", "http://localhost:8002"),
+    "storage": os.getenv("STORAGE_SERVICE_URL", "http://localhost:8003"),
+}
+
+
+class ServiceCallError(Exception):
+    """A peer tool call failed, timed out, or the peer was unreachable"""
+
+
+class ServiceClient:
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        timeout: float = 10.0,
+        max_concurrency: int = 32,
+        max_connections: int = 32,
+        keepalive_expiry: float = 60.0,
+        client_name: str = INTERNAL_CALLER,
+    ):
+        self.name = name
+        self.url = f"{base_url.rstrip('/')}/mcp"
+        self.timeout = timeout
+        # Sent in the MCP initialize request; peers record it as the caller
+        self.client_info = mcp_types.Implementation(name=client_name, version="1")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._connect_lock = asyncio.Lock()
+        self._client: Optional[Client] = None
+        self._owner: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+
+    def _http_client(self, headers=None, timeout=None, auth=None) -> httpx.AsyncClient:
+        # Headers forwarded from whichever request opened the session are
+        # deliberately dropped: the pooled session is shared by all callers
+        return httpx.AsyncClient(
+            timeout=timeout or httpx.Timeout(self.timeout),
+            auth=auth,
+            limits=self.limits,
+            follow_redirects=True,
+        )
+
+    async def _own_session(self, ready: asyncio.Future) -> None:
+        """Hold the MCP session open in a task of its own until close()"""
+        client = Client(
+            StreamableHttpTransport(self.url, httpx_client_factory=self._http_client),
+            client_info=self.client_info,
+        )
+        try:
+            async with client:
+                self._client = client
+                ready.set_result(None)
+                await self._closed.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning(f"Session to {self.name} service dropped: {e}")
+        finally:
+            self._client = None
+
+    async def _connect(self) -> Client:
+        if self._client is not None:
+            return self._client
+        async with self._connect_lock:
+            if self._client is not None:
+                return self._client
+            self._closed = asyncio.Event()
+            ready = asyncio.get_running_loop().create_future()
+            # A fresh context keeps the caller's request state out of the session task
+            self._owner = asyncio.get_running_loop().create_task(
+                self._own_session(ready), context=contextvars.Context()
+            )
+            await asyncio.wait_for(ready, self.timeout)
+            return self._client
+
+    async def connect(self) -> None:
+        """Open the MCP session now instead of on the first call"""
+        try:
+            await self._connect()
+        except Exception as e:
+            raise ServiceCallError(f"{self.name} unreachable: {e}") from e
+
+    async def call(
+        self,
+        tool: str,
+        arguments: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Call a peer tool and return its text response"""
+        with client_span(self.name, tool):
+            async with self._semaphore:
+                try:
+                    client = await self._connect()
+                    result = await asyncio.wait_for(
+                        self._call_tool(client, tool, arguments or {}),
+                        timeout or self.timeout,
+                    )
+                except asyncio.TimeoutError as e:
+                    raise ServiceCallError(f"{self.name}.{tool} timed out") from e
+                except Exception as e:
+                    # Transport-level failure: reconnect on the next call
+                    await self.close()
+                    raise ServiceCallError(f"{self.name}.{tool} failed: {e}") from e
+
+        text = "".join(getattr(block, "text", "") for block in result.content)
+        if result.isError:
+            raise ServiceCallError(f"{self.name}.{tool} returned an error: {text}")
+        return text
+
+    @staticmethod
+    async def _call_tool(
+        client: Client, tool: str, arguments: dict[str, Any]
+    ) -> mcp_types.CallToolResult:
+        # Client.call_tool cannot set _meta, which carries the trace context
+        params = mcp_types.CallToolRequestParams(name=tool, arguments=arguments)
+        meta = inject_meta()
+        if meta:
+            params.meta = mcp_types.RequestParams.Meta(**meta)
+        return await client.session.send_request(
+            mcp_types.ClientRequest(mcp_types.CallToolRequest(params=params)),
+            mcp_types.CallToolResult,
+        )
+
+    async def call_json(
+        self,
+        tool: str,
+        arguments: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Call a peer tool that returns a JSON document"""
+        return json.loads(await self.call(tool, arguments, timeout))
+
+    async def close(self) -> None:
+        self._closed.set()
+        if self._owner is not None:
+            await asyncio.gather(self._owner, return_exceptions=True)
+            self._owner = None
+
+
+_clients: dict[str, ServiceClient] = {}
+
+
+def get_service_client(name: str) -> ServiceClient:
+    """Process-wide pooled client for the orders, brewery or storage service"""
+    if name not in _clients:
+        _clients[name] = ServiceClient(
+            name,
+            SERVICE_URLS[name],
+            timeout=float(os.getenv("SERVICE_CALL_TIMEOUT_SECONDS", 10)),
+            max_concurrency=int(os.getenv("SERVICE_CALL_CONCURRENCY", 32)),
+        )
+    return _clients[name]
+
+
+async def close_service_clients() -> None:
+    for client in _clients.values():
+        await client.close()
+    _clients.clear()
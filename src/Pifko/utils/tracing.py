@@ -0,0 +1,170 @@
+"""OpenTelemetry tracing across the orders, brewery and storage services.
+
+Each tool call gets a server span, each SQL statement a child span named
+after its fingerprint, and each call to a peer service a client span. The
+client span's W3C traceparent travels in the _meta field of the MCP
+request, so the peer's tool span joins the same trace, even though every
+caller shares one pooled session.
+
+Configured by environment:
+
+    TRACING_EXPORTER      none (default), file, memory or console
+    TRACING_FILE          JSON-lines output of the file exporter
+    TRACING_SAMPLE_RATIO  fraction of new traces kept (default 0.1); calls
+                          from a peer follow the caller's decision
+
+Unsampled spans are non-recording. The SQL hooks check that first and do
+nothing else, so the cost at high QPS scales with the sample ratio.
+"""
+
+import os
+import threading
+from contextlib import nullcontext
+from typing import Optional
+
+from fastmcp import FastMCP
+from fastmcp.server.middleware import Middleware
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace.propagation.tracecontext import (
+    TraceContextTextMapPropagator,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .logger import get_logger
+from .query_stats import fingerprint
+
+logger = get_logger("tracing")
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", "/tmp/pifko-traces-{service}.jsonl")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", 0.1))
+
+_tracer = None
+_propagator = None
+
+
+class FileSpanExporter(SpanExporter):
+    """Append finished spans to a JSON-lines file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+        return SpanExportResult.SUCCESS
+
+
+def inject_meta() -> dict:
+    """traceparent of the current span, for the _meta of an outgoing call"""
+    carrier: dict = {}
+    if _propagator is not None:
+        _propagator.inject(carrier)
+    return carrier
+
+
+def client_span(peer: str, tool: str):
+    """Span around a call to a peer service (no-op when tracing is off)"""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(
+        f"call {peer}.{tool}",
+        kind=trace.SpanKind.CLIENT,
+        attributes={"peer.service": peer, "mcp.tool": tool},
+    )
+
+
+class TracingMiddleware(Middleware):
+    async def on_call_tool(self, context, call_next):
+        parent = None
+        try:
+            meta = context.fastmcp_context.request_context.meta
+            if meta is not None:
+                parent = _propagator.extract(meta.model_dump(exclude_none=True))
+        except (AttributeError, ValueError, LookupError):
+            pass
+        with _tracer.start_as_current_span(
+            f"tool {context.message.name}",
+            context=parent,
+            kind=trace.SpanKind.SERVER,
+            attributes={"mcp.tool": context.message.name},
+        ):
+            return await call_next(context)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if not trace.get_current_span().is_recording():
+        return
+    key = fingerprint(statement)
+    span = _tracer.start_span(
+        f"db {key.split(' ', 1)[0]}",
+        kind=trace.SpanKind.CLIENT,
+        attributes={"db.system": "postgresql", "db.statement": key},
+    )
+    conn.info.setdefault("tracing_spans", []).append(span)
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("tracing_spans")
+    if spans:
+        spans.pop().end()
+
+
+def _handle_error(exception_context):
+    spans = exception_context.connection.info.get("tracing_spans")
+    if spans:
+        span = spans.pop()
+        span.record_exception(exception_context.original_exception)
+        span.set_status(trace.Status(trace.StatusCode.ERROR))
+        span.end()
+
+
+def setup_tracing(mcp: FastMCP, service: str, engine: Optional[Engine] = None):
+    """Trace mcp's tools and engine's statements; returns the exporter or None"""
+    global _tracer, _propagator
+    if TRACING_EXPORTER == "none":
+        return None
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    if TRACING_EXPORTER == "file":
+        exporter = FileSpanExporter(TRACING_FILE.format(service=service))
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    elif TRACING_EXPORTER == "memory":
+        exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+    elif TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {TRACING_EXPORTER}")
+
+    logger.info(
+        f"Tracing {service} to the {TRACING_EXPORTER} exporter, sample ratio {TRACING_SAMPLE_RATIO}"
+    )
+    _tracer = provider.get_tracer("pifko")
+    _propagator = TraceContextTextMapPropagator()
+    mcp.add_middleware(TracingMiddleware())
+    if engine is not None:
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    return exporter
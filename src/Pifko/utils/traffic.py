@@ -0,0 +1,88 @@
+"""Opt-in recording of tool calls, for replay with benchmarks/replay.py.
+
+With TRAFFIC_RECORD_PATH set (e.g. /tmp/traffic-{service}.jsonl), every
+tool call is appended to that file as one JSON line:
+
+    {"t": 1718000000.123, "service": "orders", "tool": "get_order_details",
+     "args": {"invoice_id": 4}, "ms": 12.4, "ok": true,
+     "caller": "claude-ai", "session": "5f0c..."}
+
+t is the wall clock time the call started and ms its duration inside the
+service. caller is the client name sent in the MCP initialize request, and
+session the MCP session, which orders the calls of one agent. Calls
+between the Pifko services come from INTERNAL_CALLER. The replayer skips
+them, since replaying the outer call makes them again.
+"""
+
+import json
+import os
+import time
+from typing import Optional
+
+from fastmcp import FastMCP
+from fastmcp.server.middleware import Middleware
+
+from .logger import get_logger
+
+logger = get_logger("traffic")
+
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+INTERNAL_CALLER = "pifko-service"
+
+
+def _caller(context) -> tuple[Optional[str], Optional[str]]:
+    """(client name, MCP session id) of the call, when known"""
+    try:
+        ctx = context.fastmcp_context
+        params = ctx.session.client_params
+        name = params.clientInfo.name if params else None
+        return name, ctx.session_id
+    except (AttributeError, ValueError, LookupError):
+        return None, None
+
+
+class TrafficRecorder(Middleware):
+    def __init__(self, service: str, path: str):
+        self.service = service
+        self.path = path
+        # Line buffered: every call reaches the file without an explicit flush
+        self._file = open(path, "a", buffering=1)
+
+    async def on_call_tool(self, context, call_next):
+        started = time.time()
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = await call_next(context)
+            ok = not getattr(result, "isError", False)
+            return result
+        finally:
+            caller, session = _caller(context)
+            self._file.write(
+                json.dumps(
+                    {
+                        "t": round(started, 6),
+                        "service": self.service,
+                        "tool": context.message.name,
+                        "args": context.message.arguments or {},
+                        "ms": round((time.perf_counter() - start) * 1000, 3),
+                        "ok": ok,
+                        "caller": caller,
+                        "session": session,
+                    },
+                    separators=(",", ":"),
+                    default=str,
+                )
+                + "\n"
+            )
+
+
+def record_traffic(mcp: FastMCP, service: str) -> Optional[TrafficRecorder]:
+    """Record mcp's tool calls if TRAFFIC_RECORD_PATH is set; returns the recorder"""
+    if not TRAFFIC_RECORD_PATH:
+        return None
+    path = TRAFFIC_RECORD_PATH.format(service=service)
+    logger.info(f"Recording tool calls to {path}")
+    recorder = TrafficRecorder(service, path)
+    mcp.add_middleware(recorder)
+    return recorder